@@ -8,18 +8,186 @@ import Link from 'next/link'
 import FullCalendar from '@fullcalendar/react'
 import dayGridPlugin from '@fullcalendar/daygrid'
 
-// Dados mock para demonstração
-const personalCalendarEvents = [
-  { id: "1", title: 'Aniversário da cidade', date: '2025-01-20', color: '#22c55e' },
-  { id: "2", title: 'Reunião família', date: '2025-01-19', color: '#22c55e' },
-  { id: "3", title: 'Dentista', date: '2025-01-21', color: '#22c55e' },
-]
+const API_URL = 'http://localhost:8000'
 
-const professionalCalendarEvents = [
-  { id: "1", title: 'Reunião equipe', date: '2025-01-20', color: '#3b82f6' },
-  { id: "2", title: 'Apresentação projeto', date: '2025-01-21', color: '#3b82f6' },
-  { id: "3", title: 'Call cliente', date: '2025-01-19', color: '#3b82f6' },
-]
+const toISODate = (d: Date) => {
+  const pad = (n: number) => String(n).padStart(2, '0')
+  return `${d.getFullYear()}-${pad(d.getMonth() + 1)}-${pad(d.getDate())}`
+}
+
+// Busca apenas os eventos da janela visível do calendário, seguindo o cursor de paginação
+async function fetchCalendarWindow(calendar: 'personal' | 'professional', start: Date, end: Date) {
+  const lastDay = new Date(end.getTime() - 24 * 60 * 60 * 1000)  // `end` do FullCalendar é exclusivo
+  const events: any[] = []
+  let cursor: string | null = null
+  
+  do {
+    const params = new URLSearchParams({
+      calendar,
+      from: toISODate(start),
+      to: toISODate(lastDay),
+      limit: '500'
+    })
+    if (cursor) params.set('cursor', cursor)
+    
+    const response = await fetch(`${API_URL}/calendar/events?${params}`)
+    if (!response.ok) {
+      throw new Error('Erro ao carregar eventos')
+    }
+    const page = await response.json()
+    events.push(...page.events)
+    cursor = page.next_cursor
+  } while (cursor)
+  
+  return events
+}
+
+// Lê um corpo text/event-stream e entrega cada evento (nome + JSON) ao callback
+async function readEventStream(
+  body: ReadableStream<Uint8Array>,
+  onEvent: (event: string, data: any) => void
+) {
+  const reader = body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    
+    let boundary = buffer.indexOf('\n\n')
+    while (boundary !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      
+      let event = 'message'
+      const dataLines: string[] = []
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart())
+      }
+      if (dataLines.length > 0) onEvent(event, JSON.parse(dataLines.join('\n')))
+      
+      boundary = buffer.indexOf('\n\n')
+    }
+  }
+}
+
+type ChatEventHandler = (event: string, data: any) => void
+
+// O WebSocket não chegou a entregar nenhum evento: a mensagem pode ser reenviada via HTTP
+class SocketUnavailableError extends Error {
+  name = 'SocketUnavailableError'
+}
+
+// Conexão única com /ws/chat: as mensagens são multiplexadas por id e as respostas
+// chegam com os mesmos eventos do SSE (meta, message, done, error)
+class ChatSocket {
+  private socket: WebSocket | null = null
+  private connecting: Promise<WebSocket> | null = null
+  private pending = new Map<string, { onEvent: ChatEventHandler, received: boolean, resolve: () => void, reject: (error: Error) => void }>()
+  private disabledUntil = 0
+  private nextId = 0
+
+  constructor(private url: string) {}
+
+  available() {
+    return typeof WebSocket !== 'undefined' && Date.now() >= this.disabledUntil
+  }
+
+  private connect(): Promise<WebSocket> {
+    if (this.socket && this.socket.readyState === WebSocket.OPEN) return Promise.resolve(this.socket)
+    if (this.connecting) return this.connecting
+    
+    this.connecting = new Promise((resolve, reject) => {
+      const socket = new WebSocket(this.url)
+      const timeout = setTimeout(() => socket.close(), 5000)
+      
+      socket.onopen = () => {
+        clearTimeout(timeout)
+        this.socket = socket
+        this.connecting = null
+        resolve(socket)
+      }
+      socket.onmessage = (message) => this.handleFrame(socket, JSON.parse(message.data))
+      socket.onclose = () => {
+        clearTimeout(timeout)
+        if (this.socket === socket) this.socket = null
+        if (this.connecting) {
+          this.connecting = null
+          // Gateway sem WebSocket (ou fora do ar): usa HTTP por um tempo antes de tentar de novo
+          this.disabledUntil = Date.now() + 30000
+          reject(new SocketUnavailableError('WebSocket indisponível'))
+        }
+        this.pending.forEach(request => request.reject(
+          request.received ? new Error('Conexão interrompida') : new SocketUnavailableError('Conexão interrompida')
+        ))
+        this.pending.clear()
+      }
+    })
+    return this.connecting
+  }
+
+  private handleFrame(socket: WebSocket, frame: any) {
+    if (frame.type === 'ping') {
+      socket.send(JSON.stringify({ type: 'pong' }))
+      return
+    }
+    const request = this.pending.get(frame.id)
+    if (!request) return
+    request.received = true
+    
+    if (frame.event === 'error') {
+      this.pending.delete(frame.id)
+      request.reject(new Error(frame.data?.detail || 'Erro ao gerar a resposta'))
+      return
+    }
+    request.onEvent(frame.event, frame.data)
+    if (frame.event === 'done') {
+      this.pending.delete(frame.id)
+      request.resolve()
+    }
+  }
+
+  async send(message: string, userId: string, onEvent: ChatEventHandler) {
+    const socket = await this.connect()
+    const id = `m${++this.nextId}`
+    
+    return new Promise<void>((resolve, reject) => {
+      this.pending.set(id, { onEvent, received: false, resolve, reject })
+      socket.send(JSON.stringify({ type: 'message', id, message, user_id: userId }))
+    })
+  }
+}
+
+const chatSocket = new ChatSocket(`${API_URL.replace(/^http/, 'ws')}/ws/chat`)
+
+// Fallback: mesma conversa via POST com resposta em SSE
+async function streamOverHttp(message: string, userId: string, onEvent: ChatEventHandler) {
+  const response = await fetch(`${API_URL}/api/chat/process/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      'Accept': 'text/event-stream',
+    },
+    body: JSON.stringify({
+      message: message,
+      user_id: userId
+    })
+  })
+  
+  if (!response.ok || !response.body) {
+    throw new Error('Erro na resposta do servidor')
+  }
+  
+  await readEventStream(response.body, (event, data) => {
+    if (event === 'error') {
+      throw new Error(data.detail || 'Erro ao gerar a resposta')
+    }
+    onEvent(event, data)
+  })
+}
 
 interface Message {
   id: number
@@ -58,44 +226,57 @@ export default function ChatPage() {
     
     setMessages(prev => [...prev, userMessage])
     
-    try {
-      // Chamar o orquestrador através do API Gateway diretamente
-      const response = await fetch('http://localhost:8000/api/chat/process', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          message: message,
-          user_id: 'default_user'
-        })
-      })
-      
-      if (!response.ok) {
-        throw new Error('Erro na resposta do servidor')
+    const botMessageId = Date.now() + 1
+    let botMessageCreated = false
+
+    // Cria a mensagem do bot no primeiro evento e vai anexando os tokens conforme chegam
+    const upsertBotMessage = (update: (message: Message) => Message) => {
+      if (!botMessageCreated) {
+        botMessageCreated = true
+        setMessages(prev => [...prev, update({
+          id: botMessageId,
+          type: 'bot',
+          content: '',
+          timestamp: new Date()
+        })])
+        return
       }
-      
-      const data = await response.json()
-      
-      // Atualizar estado baseado na resposta do orquestrador
-      setActiveAgent(data.agent_used || 'Assistente Geral')
-      
-      if (data.show_canvas && data.canvas_type) {
-        setCanvasContent(data.canvas_type)
-        setShowCanvas(true)
-      } else {
-        setShowCanvas(false)
+      setMessages(prev => prev.map(m => (m.id === botMessageId ? update(m) : m)))
+    }
+
+    const handleEvent: ChatEventHandler = (event, data) => {
+      if (event === 'meta') {
+        // Atualizar estado baseado na resposta do orquestrador
+        setActiveAgent(data.agent_used || 'Assistente Geral')
+        
+        if (data.show_canvas && data.canvas_type) {
+          setCanvasContent(data.canvas_type)
+          setShowCanvas(true)
+        } else {
+          setShowCanvas(false)
+        }
+        upsertBotMessage(m => ({ ...m, agent: data.agent_used }))
+      } else if (event === 'message') {
+        upsertBotMessage(m => ({ ...m, content: m.content + data.token }))
+      } else if (event === 'done') {
+        upsertBotMessage(m => ({ ...m, content: data.response }))
       }
-      
-      const botMessage: Message = {
-        id: Date.now() + 1,
-        type: 'bot',
-        content: data.response,
-        agent: data.agent_used,
-        timestamp: new Date()
+    }
+
+    try {
+      // Chamar o orquestrador através do API Gateway: WebSocket persistente, ou POST + SSE
+      let delivered = false
+      if (chatSocket.available()) {
+        try {
+          await chatSocket.send(message, 'default_user', handleEvent)
+          delivered = true
+        } catch (error) {
+          if (!(error instanceof Error && error.name === 'SocketUnavailableError')) throw error
+        }
+      }
+      if (!delivered) {
+        await streamOverHttp(message, 'default_user', handleEvent)
       }
-      
-      setMessages(prev => [...prev, botMessage])
       
     } catch (error) {
       console.error('Erro ao processar mensagem:', error)
@@ -109,7 +290,7 @@ export default function ChatPage() {
         timestamp: new Date()
       }
       
-      setMessages(prev => [...prev, errorMessage])
+      setMessages(prev => [...prev.filter(m => m.id !== botMessageId), errorMessage])
     }
     
     setIsLoading(false)
@@ -196,7 +377,7 @@ export default function ChatPage() {
                 </div>
               ))}
               
-              {isLoading && (
+              {isLoading && messages[messages.length - 1]?.type === 'user' && (
                 <div className="flex justify-start">
                   <div className="bg-gray-100 border rounded-lg p-3">
                     <div className="flex items-center space-x-2">
@@ -255,7 +436,12 @@ export default function ChatPage() {
                 <FullCalendar
                   plugins={[dayGridPlugin]}
                   initialView="dayGridMonth"
-                  events={canvasContent === 'personal' ? personalCalendarEvents : professionalCalendarEvents}
+                  key={canvasContent ?? 'professional'}
+                  events={(info, successCallback, failureCallback) => {
+                    fetchCalendarWindow(canvasContent ?? 'professional', info.start, info.end)
+                      .then(successCallback)
+                      .catch(failureCallback)
+                  }}
                   headerToolbar={{
                     left: 'prev,next today',
                     center: 'title',
@@ -0,0 +1,149 @@
+# apps/services/api-gateway/chat_socket.py
+"""Sessão do chat via WebSocket: várias mensagens e respostas em streaming numa conexão
+
+Protocolo (JSON por frame):
+
+- cliente -> gateway: {"type": "message", "id": "...", "message": "..."},
+  {"type": "cancel", "id": "..."} e {"type": "pong"} (resposta ao heartbeat);
+- gateway -> cliente: {"id": "...", "event": "meta" | "message" | "done" | "error",
+  "data": {...}} - os mesmos eventos do SSE de /api/chat/process/stream - e
+  {"type": "ping"} a cada WS_HEARTBEAT segundos.
+
+Backpressure: todos os frames de saída passam por uma fila limitada consumida
+por uma única tarefa; quando o cliente não acompanha, quem produz (a leitura do
+stream do orquestrador) espera, e a espera se propaga até o upstream. Cada
+conexão aceita no máximo `max_inflight` mensagens simultâneas.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+# Close codes: 1008 = violação de protocolo, 1011 = erro interno, 1013 = tente mais tarde
+CLOSE_POLICY = 1008
+CLOSE_TRY_AGAIN = 1013
+
+Emit = Callable[[str, str], Awaitable[None]]
+MessageHandler = Callable[[Dict[str, Any], Emit], Awaitable[None]]
+
+
+def event_frame(message_id: str, event: str, data: Any) -> str:
+    """Frame de evento; `data` já serializado (str) é repassado sem decodificar"""
+    raw = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    return f'{{"id":{json.dumps(message_id)},"event":{json.dumps(event)},"data":{raw}}}'
+
+
+async def iter_sse_events(chunks: AsyncIterator[str]) -> AsyncIterator[Tuple[str, str]]:
+    """(evento, data) de um corpo text/event-stream; `data` segue como texto JSON"""
+    buffer = ""
+    async for chunk in chunks:
+        buffer += chunk
+        while "\n\n" in buffer:
+            block, buffer = buffer.split("\n\n", 1)
+            event, data_lines = "message", []
+            for line in block.split("\n"):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data_lines.append(line[5:].lstrip())
+            if data_lines:
+                yield event, "\n".join(data_lines)
+
+
+class ChatSocketSession:
+    def __init__(self, websocket: WebSocket, handler: MessageHandler, max_inflight: int = 4,
+                 send_queue: int = 256, heartbeat: float = 20.0):
+        self.websocket = websocket
+        self.handler = handler
+        self.max_inflight = max_inflight
+        self.heartbeat = heartbeat
+        self._outgoing: "asyncio.Queue[str]" = asyncio.Queue(maxsize=send_queue)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._last_seen = time.monotonic()
+
+    async def run(self):
+        sender = asyncio.create_task(self._send_loop())
+        receiver = asyncio.create_task(self._receive_loop())
+        pinger = asyncio.create_task(self._heartbeat_loop())
+        try:
+            # Termina quando o cliente desconecta, o heartbeat expira ou o envio falha
+            await asyncio.wait([receiver, pinger, sender], return_when=asyncio.FIRST_COMPLETED)
+            if pinger.done() and not pinger.exception():
+                logger.info("WebSocket do chat sem resposta ao heartbeat, fechando")
+                await self.websocket.close(code=CLOSE_TRY_AGAIN)
+        except RuntimeError:
+            pass  # Conexão já encerrada
+        finally:
+            tasks = [*self._inflight.values(), receiver, pinger, sender]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def emit(self, message_id: str, event: str, data: Any):
+        # Bloqueia quando a fila está cheia: é aqui que o cliente lento freia o upstream
+        await self._outgoing.put(event_frame(message_id, event, data))
+
+    async def _send_loop(self):
+        while True:
+            await self.websocket.send_text(await self._outgoing.get())
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            if time.monotonic() - self._last_seen > 2 * self.heartbeat:
+                return
+            await self._outgoing.put('{"type":"ping"}')
+
+    async def _receive_loop(self):
+        while True:
+            try:
+                raw = await self.websocket.receive_text()
+            except WebSocketDisconnect:
+                return
+            self._last_seen = time.monotonic()
+            try:
+                frame = json.loads(raw)
+                kind = frame.get("type")
+            except (ValueError, AttributeError):
+                await self.websocket.close(code=CLOSE_POLICY)
+                return
+
+            if kind == "message":
+                await self._start(frame)
+            elif kind == "cancel":
+                task = self._inflight.get(str(frame.get("id")))
+                if task is not None:
+                    task.cancel()
+            elif kind == "ping":
+                await self._outgoing.put('{"type":"pong"}')
+            # "pong" só atualiza _last_seen
+
+    async def _start(self, frame: Dict[str, Any]):
+        message_id = str(frame.get("id") or "")
+        if not message_id or not isinstance(frame.get("message"), str):
+            await self.emit(message_id, "error", {"detail": "Mensagem inválida"})
+            return
+        if message_id in self._inflight:
+            await self.emit(message_id, "error", {"detail": "Id de mensagem já em andamento"})
+            return
+        if len(self._inflight) >= self.max_inflight:
+            await self.emit(message_id, "error", {"detail": "Muitas mensagens em andamento nesta conexão"})
+            return
+
+        async def run():
+            try:
+                await self.handler(frame, lambda event, data: self.emit(message_id, event, data))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Erro na mensagem do WebSocket: %s", e)
+                await self.emit(message_id, "error", {"detail": "Erro ao processar a mensagem"})
+            finally:
+                self._inflight.pop(message_id, None)
+
+        self._inflight[message_id] = asyncio.create_task(run())
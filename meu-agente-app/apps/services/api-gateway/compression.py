@@ -0,0 +1,126 @@
+# apps/services/api-gateway/compression.py
+"""Compressão das respostas do gateway (brotli ou gzip, conforme o Accept-Encoding)
+
+Middleware ASGI puro que comprime o corpo conforme ele passa, inclusive em
+respostas em streaming (cada pedaço é comprimido e enviado com flush), sem
+bufferizar a resposta inteira. Não mexe em respostas já codificadas pelo
+upstream, em tipos não textuais, em text/event-stream (os tokens do chat
+precisam sair na hora) nem em corpos menores que `minimum_size`.
+"""
+import zlib
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # Sem o pacote brotli só oferecemos gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+SKIPPED_TYPES = ("text/event-stream",)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Melhor codificação aceita pelo cliente (br > gzip), respeitando q=0"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    wildcard = accepted.get("*", 0.0)
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+class _Encoder:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=level)
+        else:
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: formato gzip
+
+    def chunk(self, data: bytes) -> bytes:
+        """Comprime e faz flush para o cliente já poder descomprimir o pedaço"""
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == b"accept-encoding"), "")
+        encoding = negotiate(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[dict] = None
+        encoder: Optional[_Encoder] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = dict((k.lower(), v) for k, v in message.get("headers", []))
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (b"content-encoding" in headers
+                               or not content_type.startswith(COMPRESSIBLE_TYPES)
+                               or content_type.startswith(SKIPPED_TYPES)
+                               or int(headers.get(b"content-length", self.minimum_size)) < self.minimum_size)
+                if passthrough:
+                    await send(start)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    # Corpo único e pequeno: não compensa comprimir
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = _Encoder(encoding, self.levels[encoding])
+                compressed = encoder.chunk(body) if more_body else encoder.finish(body)
+                await send({**start, "headers": self._headers(start["headers"], encoding,
+                                                               None if more_body else len(compressed))})
+            else:
+                compressed = encoder.chunk(body) if more_body else encoder.finish(body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _headers(raw: List[Tuple[bytes, bytes]], encoding: str, length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        headers = [(k, v) for k, v in raw if k.lower() not in (b"content-length", b"vary")]
+        vary = [v for k, v in raw if k.lower() == b"vary"]
+        headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+        headers.append((b"content-encoding", encoding.encode()))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        return headers
@@ -1,15 +1,71 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
+import asyncio
 import httpx
 import os
-from typing import Dict, Any
-import logging
+from typing import Dict, Any, Set
+from contextlib import AsyncExitStack
+from starlette.background import BackgroundTask
 
-app = FastAPI(title="API Gateway", version="1.0.0")
-logger = logging.getLogger("uvicorn")
-logger.setLevel(logging.DEBUG)
+from shared.instrumentation import setup_instrumentation
+from shared.logs import LOG_PAYLOADS, setup_logging
+from chat_socket import CLOSE_TRY_AGAIN, ChatSocketSession, iter_sse_events
+from compression import CompressionMiddleware
+from proxy import RawResponse, proxy_request, proxy_shared, response_headers
+from ratelimit import RateLimiter, estimate_tokens, retry_after_header
+from resilience import AdmissionControl, AdmissionMiddleware, CircuitOpenError, route_limits_from_env
+from upstream import UpstreamRegistry
+
+try:
+    import orjson
+except ImportError:  # Sem orjson as respostas montadas no gateway usam o json padrão
+    orjson = None
+
+# Respostas montadas pelo próprio gateway usam orjson; as dos upstreams são repassadas em bytes
+app = FastAPI(title="API Gateway", version="1.0.0",
+              default_response_class=ORJSONResponse if orjson else JSONResponse)
+logger = setup_logging("api-gateway")
+
+# Configuração dos microserviços
+SERVICES = {
+    "orchestrator": os.getenv("ORCHESTRATOR_URL", "http://orchestrator-agent:8001"),
+    "calendar": os.getenv("CALENDAR_URL", "http://calendar-service:8002"),
+    "settings": os.getenv("SETTINGS_URL", "http://user-settings-service:8004")
+}
+
+# Um pool de conexões keep-alive por microserviço (limites/timeouts configuráveis via ambiente)
+upstreams = UpstreamRegistry(SERVICES)
+
+# Máximo de requisições simultâneas por rota (ADMISSION_<NOME>); acima disso, ou com o
+# circuito do upstream aberto, a rota responde 503 na hora. Fica dentro do CORS para o
+# navegador conseguir ler a resposta.
+admission = AdmissionControl(
+    route_limits_from_env([
+        ("chat", "/chat", 64, "orchestrator"),
+        ("chat_api", "/api/chat", 64, "orchestrator"),
+        # Jobs: a rota só enfileira/consulta, mas o long polling segura a conexão
+        ("chat_jobs", "/api/chat/jobs", 256, "orchestrator"),
+        ("agents", "/agents", 200, "settings"),
+        ("calendar", "/calendar", 200, "calendar"),
+        # Uploads para a base de conhecimento vetorizam no orquestrador: poucos por vez
+        ("knowledge", "/api/agents", 16, "orchestrator"),
+    ]),
+    breakers={name: pool.breaker for name, pool in upstreams.pools.items()},
+)
+app.add_middleware(AdmissionMiddleware, control=admission)
+# Depois da admissão: as respostas 503 recusadas também aparecem nas métricas/traces
+setup_instrumentation(app, "api-gateway")
+
+# Limites por usuário (requisições/s e tokens do LLM/min) aplicados às rotas de chat
+rate_limiter = RateLimiter.from_env()
+
+# gzip/brotli conforme o Accept-Encoding do cliente (SSE e respostas já comprimidas passam direto)
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")))
+
+# Maior corpo de GET lido de uma vez e compartilhado entre pedidos idênticos; acima disso, streaming
+PROXY_SHARED_MAX_BYTES = int(os.getenv("PROXY_SHARED_MAX_BYTES", str(1 << 20)))
 
 # CORS para permitir requests do frontend
 app.add_middleware(
@@ -20,13 +76,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuração dos microserviços
-SERVICES = {
-    "orchestrator": "http://orchestrator-agent:8001",
-    "calendar": "http://calendar-service:8002",
-    "settings": "http://user-settings-service:8004"
-}
-
 class ChatMessage(BaseModel):
     message: str
     user_id: str = "default_user"
@@ -37,93 +86,404 @@ class AgentConfig(BaseModel):
     systemPrompt: str
     tools: list
 
+@app.on_event("startup")
+async def startup_event():
+    await upstreams.start()
+    await rate_limiter.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in list(job_settlers):
+        task.cancel()
+    await rate_limiter.close()
+    await upstreams.close()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "api-gateway"}
 
-@app.post("/chat")
-async def chat_endpoint(request: ChatMessage):
-    """Rota principal para o chat - encaminha para o orquestrador"""
+@app.get("/stats/upstreams")
+async def upstream_stats():
+    """Métricas dos pools de conexão por serviço (em uso, ociosas, tempo de espera)"""
+    return upstreams.metrics()
+
+@app.get("/stats/admission")
+async def admission_stats():
+    """Requisições em andamento, admitidas e recusadas por rota"""
+    return admission.stats()
+
+@app.get("/stats/ratelimit")
+async def ratelimit_stats():
+    """Decisões do rate limiter por limite (requisições/tokens)"""
+    return rate_limiter.stats()
+
+async def admit_chat(request: ChatMessage) -> int:
+    """Aplica os limites do usuário; retorna os tokens reservados (acertados com `settle`)"""
+    decision, reserved = await rate_limiter.admit(request.user_id, estimate_tokens(request.message))
+    if not decision.allowed:
+        logger.info("Limite atingido", extra={"user_id": request.user_id, "limit": decision.limit})
+        raise HTTPException(
+            status_code=429,
+            detail="Muitas requisições, tente novamente em instantes" if decision.limit == "requests"
+            else "Orçamento de tokens por minuto esgotado",
+            headers=retry_after_header(decision),
+        )
+    return reserved
+
+async def process_chat(request: ChatMessage):
+    reserved = await admit_chat(request)
+    completion_tokens = 0
+    failed = True
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{SERVICES['orchestrator']}/process",
-                json=request.dict()
-            )
-            return response.json()
+        response = await upstreams["orchestrator"].request(
+            "POST", "/process", json=request.dict()
+        )
+        failed = response.status_code != 200
+        # Lê a resposta só para contar os tokens; o cliente recebe os bytes do orquestrador
+        # (erros 5xx podem vir em HTML/texto: repassados como estão)
+        if not failed and response.headers.get("content-type", "").startswith("application/json"):
+            try:
+                data = orjson.loads(response.content) if orjson else response.json()
+            except ValueError:
+                data = None
+            if isinstance(data, dict):
+                completion_tokens = estimate_tokens(data.get("response", ""))
+        return RawResponse(response.content, response.status_code, response_headers(response.headers))
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Orchestrator service unavailable: {e}")
+    finally:
+        await rate_limiter.settle(request.user_id, reserved, completion_tokens, failed=failed)
+
+@app.post("/chat")
+async def chat_endpoint(request: ChatMessage):
+    """Rota principal para o chat - encaminha para o orquestrador"""
+    return await process_chat(request)
 
 @app.post("/api/chat/process")
 async def chat_process_endpoint(request: ChatMessage):
     """Rota alternativa para o chat - encaminha para o orquestrador"""
+    return await process_chat(request)
+
+@app.post("/api/chat/process/stream")
+async def chat_process_stream_endpoint(request: ChatMessage):
+    """Versão em streaming (SSE) do chat - repassa os chunks do orquestrador sem bufferizar"""
+    reserved = await admit_chat(request)
+    stack = AsyncExitStack()
+    try:
+        response = await stack.enter_async_context(
+            upstreams["orchestrator"].stream("POST", "/process/stream", json=request.dict())
+        )
+    except httpx.RequestError as e:
+        await stack.aclose()
+        await rate_limiter.settle(request.user_id, reserved, 0, failed=True)
+        raise HTTPException(status_code=503, detail=f"Orchestrator service unavailable: {e}")
+
+    state = {"tokens": 0, "released": False}
+
+    async def release():
+        # Chamado ao fim do relay e também como background task: se o cliente cair antes
+        # de o corpo começar a ser lido, o relay nunca roda e a conexão/reserva ficariam presas
+        if state["released"]:
+            return
+        state["released"] = True
+        await stack.aclose()
+        await rate_limiter.settle(request.user_id, reserved, state["tokens"],
+                                  failed=response.status_code != 200)
+
+    async def relay():
+        # Cada evento {"token": ...} do orquestrador corresponde a um pedaço gerado pelo LLM
+        marker = b'data: {"token"'
+        tail = b""
+        try:
+            async for chunk in response.aiter_bytes():
+                window = tail + chunk
+                state["tokens"] += window.count(marker)
+                tail = window[-(len(marker) - 1):]
+                yield chunk
+        finally:
+            await release()
+
+    try:
+        return StreamingResponse(
+            relay(),
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type", "text/event-stream"),
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            background=BackgroundTask(release),
+        )
+    except BaseException:
+        await release()
+        raise
+
+# WebSocket do chat: conexões no gateway, mensagens simultâneas por conexão, fila de saída e heartbeat
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "1000"))
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "256"))
+WS_HEARTBEAT = float(os.getenv("WS_HEARTBEAT", "20"))
+ws_connections = 0
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket, user_id: str = "default_user"):
+    """Canal persistente do chat: multiplexa as mensagens do usuário e as respostas em streaming"""
+    global ws_connections
+    await websocket.accept()
+    if ws_connections >= WS_MAX_CONNECTIONS:
+        await websocket.close(code=CLOSE_TRY_AGAIN)
+        return
+
+    async def handle(frame: Dict[str, Any], emit):
+        await relay_chat_stream(ChatMessage(message=frame["message"], user_id=frame.get("user_id") or user_id), emit)
+
+    ws_connections += 1
+    try:
+        await ChatSocketSession(websocket, handle, max_inflight=WS_MAX_INFLIGHT,
+                                send_queue=WS_SEND_QUEUE, heartbeat=WS_HEARTBEAT).run()
+    finally:
+        ws_connections -= 1
+
+async def relay_chat_stream(request: ChatMessage, emit):
+    """Repassa os eventos SSE do orquestrador como eventos do WebSocket"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{SERVICES['orchestrator']}/process",
-                json=request.dict()
-            )
-            return response.json()
+        reserved = await admit_chat(request)
+    except HTTPException as e:
+        await emit("error", {"detail": e.detail, "status": e.status_code,
+                             "retry_after": int((e.headers or {}).get("Retry-After", 0))})
+        return
+    tokens = 0
+    failed = True
+    try:
+        async with upstreams["orchestrator"].stream("POST", "/process/stream", json=request.dict()) as response:
+            if response.status_code != 200:
+                await emit("error", {"detail": "Erro no orquestrador", "status": response.status_code})
+                return
+            failed = False
+            async for event, data in iter_sse_events(response.aiter_text()):
+                if event == "message":
+                    tokens += 1
+                await emit(event, data)
     except httpx.RequestError as e:
+        logger.warning("Orquestrador indisponível para o WebSocket: %s", e)
+        await emit("error", {"detail": "Orchestrator service unavailable", "status": 503})
+        failed = True
+    finally:
+        await rate_limiter.settle(request.user_id, reserved, tokens, failed=failed)
+
+# Long polling de GET /api/chat/jobs/{id}?wait= (o orquestrador limita em JOB_MAX_WAIT)
+JOB_POLL_WAIT = float(os.getenv("JOB_POLL_WAIT", "20"))
+# Quanto tempo o gateway acompanha um job para acertar os tokens reservados
+JOB_SETTLE_TIMEOUT = float(os.getenv("JOB_SETTLE_TIMEOUT", "600"))
+job_settlers: Set[asyncio.Task] = set()
+
+def upstream_json(response: httpx.Response) -> Dict[str, Any]:
+    """Corpo JSON do upstream; páginas de erro em HTML/texto viram {"detail": ...}"""
+    try:
+        data = response.json()
+    except ValueError:
+        return {"detail": response.text[:200] or f"HTTP {response.status_code}"}
+    return data if isinstance(data, dict) else {"detail": data}
+
+@app.post("/api/chat/jobs", status_code=202)
+async def create_chat_job(request: ChatMessage):
+    """Modo assíncrono do chat: enfileira a mensagem e devolve o id do job na hora"""
+    reserved = await admit_chat(request)
+    try:
+        response = await upstreams["orchestrator"].request("POST", "/jobs", json=request.dict())
+    except httpx.RequestError as e:
+        await rate_limiter.settle(request.user_id, reserved, 0, failed=True)
         raise HTTPException(status_code=503, detail=f"Orchestrator service unavailable: {e}")
+    job = upstream_json(response)
+    if response.status_code != 202 or "job_id" not in job:
+        await rate_limiter.settle(request.user_id, reserved, 0, failed=True)
+        return JSONResponse(status_code=response.status_code if response.status_code != 202 else 502, content=job,
+                            headers={k: v for k, v in response.headers.items() if k.lower() == "retry-after"})
+    # A reserva é acertada quando o job terminar, mesmo que o cliente nunca volte para buscá-lo
+    task = asyncio.create_task(settle_job(request.user_id, reserved, job["job_id"]))
+    job_settlers.add(task)
+    task.add_done_callback(job_settlers.discard)
+    job["status_url"] = f"/api/chat/jobs/{job['job_id']}"
+    job["websocket_url"] = f"/ws/chat/jobs/{job['job_id']}"
+    return job
+
+async def settle_job(user_id: str, reserved: int, job_id: str):
+    """Acompanha o job (long polling) e acerta a reserva de tokens com a resposta gerada"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + JOB_SETTLE_TIMEOUT
+    completion_tokens, failed = 0, False
+    try:
+        while loop.time() < deadline:
+            try:
+                response = await fetch_job(job_id, JOB_POLL_WAIT)
+            except httpx.RequestError:
+                await asyncio.sleep(1)
+                continue
+            job = upstream_json(response)
+            if response.status_code == 404:
+                break  # Expirou: fica cobrado o prompt
+            if job.get("status") == "done":
+                completion_tokens = estimate_tokens((job.get("result") or {}).get("response", ""))
+                break
+            if job.get("status") == "failed":
+                failed = True
+                break
+            if response.status_code != 200:
+                await asyncio.sleep(1)
+    finally:
+        await rate_limiter.settle(user_id, reserved, completion_tokens, failed=failed)
+
+async def fetch_job(job_id: str, wait: float) -> httpx.Response:
+    wait = min(wait, JOB_POLL_WAIT)
+    return await upstreams["orchestrator"].request(
+        "GET", f"/jobs/{job_id}", params={"wait": wait},
+        timeout=httpx.Timeout(wait + 10.0, connect=5.0),
+    )
+
+@app.get("/api/chat/jobs/{job_id}")
+async def get_chat_job(job_id: str, wait: float = Query(0, ge=0)):
+    """Status do job (queued, running, done, failed); `wait` segura até o job terminar"""
+    try:
+        response = await fetch_job(job_id, wait)
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=503, detail=f"Orchestrator service unavailable: {e}")
+    return RawResponse(response.content, response.status_code, response_headers(response.headers))
+
+@app.websocket("/ws/chat/jobs/{job_id}")
+async def chat_job_websocket(websocket: WebSocket, job_id: str):
+    """Envia o status do job a cada mudança e fecha quando ele termina"""
+    await websocket.accept()
+    last_status = None
+    try:
+        while True:
+            try:
+                response = await fetch_job(job_id, JOB_POLL_WAIT)
+            except httpx.RequestError:
+                await websocket.send_json({"id": job_id, "status": "error", "detail": "Orchestrator service unavailable"})
+                break
+            job = upstream_json(response)
+            if response.status_code != 200 or "status" not in job:
+                await websocket.send_json({"id": job_id, **job, "status": "error"})
+                break
+            if job["status"] != last_status:
+                await websocket.send_json(job)
+                last_status = job["status"]
+            if job["status"] in ("done", "failed"):
+                break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 @app.get("/agents")
-async def get_agents():
-    """Lista todos os agentes configurados"""
-    print(f"[DEBUG] Iniciando requisição para: {SERVICES['settings']}/agents")
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            print("[DEBUG] Cliente HTTP criado, fazendo requisição...")
-            response = await client.get(f"{SERVICES['settings']}/agents")
-            print(f"[DEBUG] Resposta recebida - Status: {response.status_code}")
-            print(f"[DEBUG] Conteúdo da resposta: {response.text[:500]}...")
-            response.raise_for_status()
-            data = response.json()
-            print(f"[DEBUG] JSON parseado com sucesso: {len(data) if isinstance(data, list) else 'objeto'}")
-            return JSONResponse(content=data)
+async def get_agents(request: Request):
+    """Lista todos os agentes configurados (bytes do settings-service repassados sem parse)"""
+    try:
+        response = await proxy_shared(upstreams["settings"], "/agents", request, PROXY_SHARED_MAX_BYTES)
+        logger.debug("Resposta do settings-service", extra={"status": response.status_code})
+        if LOG_PAYLOADS and isinstance(response, RawResponse):
+            logger.debug("Corpo da resposta", extra={"payload": response.body[:500].decode(errors="replace")})
+        return response
     except httpx.TimeoutException as e:
-        print(f"[ERROR] Timeout ao conectar com settings-service: {e}")
+        logger.warning("Timeout ao conectar com settings-service: %s", e)
         raise HTTPException(status_code=503, detail="Settings service timeout")
-    except httpx.ConnectError as e:
-        print(f"[ERROR] Erro de conexão com settings-service: {e}")
+    except (httpx.ConnectError, CircuitOpenError) as e:
+        logger.warning("Erro de conexão com settings-service: %s", e)
         raise HTTPException(status_code=503, detail="Settings service unavailable")
     except Exception as e:
-        print(f"[ERROR] Erro inesperado ao buscar agentes: {type(e).__name__}: {e}")
+        logger.error("Erro inesperado ao buscar agentes: %s: %s", type(e).__name__, e)
         raise HTTPException(status_code=503, detail=f"Settings service unavailable: {e}")
 
 @app.post("/agents")
 async def create_agent(agent_config: AgentConfig):
     """Cria um novo agente"""
-    print(f"[DEBUG] Criando agente: {agent_config.name}")
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                f"{SERVICES['settings']}/agents",
-                json=agent_config.dict()
-            )
-            print(f"[DEBUG] Resposta criação agente - Status: {response.status_code}")
-            response.raise_for_status()
-            return JSONResponse(content=response.json())
+    logger.debug("Criando agente", extra={"agent_name": agent_config.name})
+    try:
+        response = await upstreams["settings"].request(
+            "POST", "/agents", json=agent_config.dict()
+        )
+        upstreams["settings"].flight.forget("/agents")
+        response.raise_for_status()
+        return RawResponse(response.content, response.status_code, response_headers(response.headers))
     except httpx.TimeoutException as e:
-        print(f"[ERROR] Timeout ao criar agente: {e}")
+        logger.warning("Timeout ao criar agente: %s", e)
         raise HTTPException(status_code=503, detail="Settings service timeout")
-    except httpx.ConnectError as e:
-        print(f"[ERROR] Erro de conexão ao criar agente: {e}")
+    except (httpx.ConnectError, CircuitOpenError) as e:
+        logger.warning("Erro de conexão ao criar agente: %s", e)
         raise HTTPException(status_code=503, detail="Settings service unavailable")
     except Exception as e:
-        print(f"[ERROR] Erro inesperado ao criar agente: {type(e).__name__}: {e}")
+        logger.error("Erro inesperado ao criar agente: %s: %s", type(e).__name__, e)
         raise HTTPException(status_code=503, detail=f"Settings service unavailable: {e}")
 
+@app.put("/agents/{agent_id}")
+async def update_agent(agent_id: int, agent_config: AgentConfig):
+    """Atualiza um agente existente"""
+    logger.debug("Atualizando agente", extra={"agent_id": agent_id})
+    try:
+        response = await upstreams["settings"].request(
+            "PUT", f"/agents/{agent_id}", json=agent_config.dict()
+        )
+        upstreams["settings"].flight.forget("/agents")
+        if response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Agente não encontrado")
+        response.raise_for_status()
+        return RawResponse(response.content, response.status_code, response_headers(response.headers))
+    except HTTPException:
+        raise
+    except httpx.TimeoutException as e:
+        logger.warning("Timeout ao atualizar agente: %s", e)
+        raise HTTPException(status_code=503, detail="Settings service timeout")
+    except (httpx.ConnectError, CircuitOpenError) as e:
+        logger.warning("Erro de conexão ao atualizar agente: %s", e)
+        raise HTTPException(status_code=503, detail="Settings service unavailable")
+    except Exception as e:
+        logger.error("Erro inesperado ao atualizar agente: %s: %s", type(e).__name__, e)
+        raise HTTPException(status_code=503, detail=f"Settings service unavailable: {e}")
+
+# Base de conhecimento dos agentes (no orquestrador): o upload segue em streaming, sem bufferizar
+KNOWLEDGE_UPLOAD_TIMEOUT = httpx.Timeout(float(os.getenv("KNOWLEDGE_UPLOAD_TIMEOUT", "300")), connect=5.0)
+
+async def forward_knowledge(method: str, path: str, request: Request, **kwargs) -> Response:
+    try:
+        return await proxy_request(upstreams["orchestrator"], method, path, request, **kwargs)
+    except httpx.TimeoutException as e:
+        logger.warning("Timeout na base de conhecimento: %s", e)
+        raise HTTPException(status_code=504, detail="Orchestrator timeout")
+    except httpx.RequestError as e:
+        logger.warning("Erro de conexão com o orquestrador (base de conhecimento): %s", e)
+        raise HTTPException(status_code=503, detail="Orchestrator unavailable")
+
+@app.post("/api/agents/{agent_id}/knowledge")
+async def upload_knowledge(agent_id: int, request: Request):
+    """Envia um documento de texto para a base do agente (?name=arquivo.txt)"""
+    return await forward_knowledge(
+        "POST", f"/agents/{agent_id}/knowledge", request, body=True, timeout=KNOWLEDGE_UPLOAD_TIMEOUT
+    )
+
+@app.get("/api/agents/{agent_id}/knowledge")
+async def list_knowledge(agent_id: int, request: Request):
+    return await forward_knowledge("GET", f"/agents/{agent_id}/knowledge", request)
+
+@app.get("/api/agents/{agent_id}/knowledge/search")
+async def search_knowledge(agent_id: int, request: Request):
+    return await forward_knowledge("GET", f"/agents/{agent_id}/knowledge/search", request)
+
+@app.delete("/api/agents/{agent_id}/knowledge/{document_id}")
+async def delete_knowledge(agent_id: int, document_id: int, request: Request):
+    return await forward_knowledge("DELETE", f"/agents/{agent_id}/knowledge/{document_id}", request)
+
+@app.get("/calendar/events/changes")
+async def get_calendar_changes(request: Request):
+    """Feed de mudanças da agenda (?since=); sem single-flight, o micro-cache devolveria tokens velhos"""
+    try:
+        return await proxy_request(upstreams["calendar"], "GET", "/events/changes", request)
+    except httpx.RequestError:
+        raise HTTPException(status_code=503, detail="Calendar service unavailable")
+
 @app.get("/calendar/{calendar_type}")
-async def get_calendar(calendar_type: str):
-    """Busca eventos do calendário"""
+async def get_calendar(calendar_type: str, request: Request):
+    """Busca eventos do calendário (ex.: /calendar/events?from=&to=&calendar=&cursor=)"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{SERVICES['calendar']}/{calendar_type}")
-            return response.json()
+        return await proxy_shared(upstreams["calendar"], f"/{calendar_type}", request, PROXY_SHARED_MAX_BYTES)
     except httpx.RequestError:
         raise HTTPException(status_code=503, detail="Calendar service unavailable")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)
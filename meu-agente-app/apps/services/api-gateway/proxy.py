@@ -0,0 +1,169 @@
+# apps/services/api-gateway/proxy.py
+"""Proxy reverso do gateway: repassa bytes e cabeçalhos do upstream sem decodificar
+
+`proxy_request` abre a resposta do upstream em streaming e devolve os bytes
+crus (`aiter_raw`) ao cliente conforme chegam: o gateway não faz parse do JSON
+nem o serializa de novo, e a memória usada não depende do tamanho do corpo. O
+corpo da requisição também segue em streaming. Cabeçalhos hop-by-hop ficam de
+fora, e o Accept-Encoding do cliente vai para o upstream. Se o upstream já
+comprimir, os bytes seguem comprimidos e o middleware de compressão não mexe.
+
+`proxy_shared` faz o mesmo para GETs, coalescendo pedidos idênticos em
+andamento (single-flight do pool): o corpo é lido uma vez e compartilhado se
+couber em `max_shared_bytes` (com ou sem Content-Length). Se não couber, quem
+abriu a requisição recebe o mesmo stream (o que já foi lido mais o restante),
+sem um segundo GET; só os pedidos que estavam esperando abrem o próprio stream.
+"""
+import asyncio
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from upstream import UpstreamPool
+
+# RFC 7230 6.1, mais os que o próprio servidor/cliente HTTP recalculam
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+    "transfer-encoding", "upgrade", "host", "content-length",
+}
+# Cabeçalhos do cliente repassados ao upstream
+FORWARDED_REQUEST_HEADERS = ("accept", "accept-encoding", "accept-language", "content-type",
+                             "if-none-match", "if-modified-since", "traceparent")
+
+
+def request_headers(request: Request) -> Dict[str, str]:
+    headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+    # Sem Accept-Encoding o httpx pediria gzip em nome de um cliente que talvez não aceite
+    headers.setdefault("accept-encoding", "identity")
+    return headers
+
+
+def response_headers(headers: httpx.Headers) -> List[Tuple[bytes, bytes]]:
+    return [(name, value) for name, value in headers.raw if name.decode("latin-1").lower() not in HOP_BY_HOP]
+
+
+class RawResponse(Response):
+    """Resposta com cabeçalhos crus do upstream (sem media_type/charset recalculados)"""
+
+    def __init__(self, content: bytes, status_code: int, raw_headers: List[Tuple[bytes, bytes]]):
+        super().__init__(content=content, status_code=status_code)
+        self.raw_headers = [*raw_headers, (b"content-length", str(len(content)).encode())]
+
+
+class RawStreamingResponse(StreamingResponse):
+    def __init__(self, content, status_code: int, raw_headers: List[Tuple[bytes, bytes]],
+                 background: Optional[BackgroundTask] = None):
+        super().__init__(content, status_code=status_code, background=background)
+        self.raw_headers = list(raw_headers)
+
+
+def relay_response(response: httpx.Response, stack: AsyncExitStack, body: AsyncIterator[bytes],
+                   buffered: Iterable[bytes] = ()) -> RawStreamingResponse:
+    """Repassa `buffered` e depois o restante do stream; fecha o upstream ao terminar
+
+    O fechamento também roda como background task: se o cliente cair antes de o
+    corpo começar a ser lido, o gerador nunca executa e a conexão ficaria presa.
+    """
+    async def relay():
+        try:
+            for chunk in buffered:
+                yield chunk
+            async for chunk in body:
+                yield chunk
+        finally:
+            await stack.aclose()
+
+    return RawStreamingResponse(relay(), response.status_code, response_headers(response.headers),
+                                background=BackgroundTask(stack.aclose))
+
+
+async def proxy_request(pool: UpstreamPool, method: str, path: str, request: Request,
+                        params: Optional[Iterable[Tuple[str, str]]] = None, body: bool = False,
+                        timeout: Optional[httpx.Timeout] = None) -> Response:
+    """Abre o upstream em streaming e devolve uma resposta que repassa os bytes crus
+
+    Falhas de conexão/timeout antes dos cabeçalhos sobem como httpx.RequestError
+    (o handler decide o status); depois disso o stream é só repassado.
+    """
+    kwargs: Dict[str, Any] = {
+        "params": list(params if params is not None else request.query_params.multi_items()),
+        "headers": request_headers(request),
+    }
+    if body:
+        kwargs["content"] = request.stream()
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+
+    stack = AsyncExitStack()
+    try:
+        response = await stack.enter_async_context(pool.stream(method, path, **kwargs))
+    except BaseException:
+        await stack.aclose()
+        raise
+    return relay_response(response, stack, response.aiter_raw())
+
+
+@dataclass
+class SharedBody:
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    content: bytes
+
+
+async def proxy_shared(pool: UpstreamPool, path: str, request: Request, max_shared_bytes: int = 1 << 20) -> Response:
+    """GET coalescido: pedidos idênticos em andamento compartilham um único corpo (bytes crus)"""
+    params = sorted(request.query_params.multi_items())
+    headers = request_headers(request)
+    # Começa pelo path para `flight.forget("/agents")` alcançar as variações da chave.
+    # If-None-Match entra na chave: clientes com validadores diferentes esperam 304 ou 200
+    key = "|".join((path + "?" + urlencode(params), headers["accept-encoding"], headers.get("if-none-match", "")))
+    # Stream aberto pelo load deste pedido quando o corpo não coube no limite
+    leader: Dict[str, Any] = {}
+
+    async def load() -> Optional[SharedBody]:
+        stack = AsyncExitStack()
+        try:
+            response = await stack.enter_async_context(pool.stream("GET", path, params=params, headers=headers))
+            body = response.aiter_raw()
+            buffered: List[bytes] = []
+            length = response.headers.get("content-length")
+            if length is None or int(length) <= max_shared_bytes:
+                size = 0
+                async for chunk in body:
+                    buffered.append(chunk)
+                    size += len(chunk)
+                    if size > max_shared_bytes:
+                        break
+                else:
+                    await stack.aclose()
+                    return SharedBody(response.status_code, response_headers(response.headers), b"".join(buffered))
+        except BaseException:
+            await stack.aclose()
+            raise
+        leader["stream"] = (response, stack, body, buffered)
+        if leader.get("abandoned"):
+            await stack.aclose()
+        return None
+
+    try:
+        shared = await pool.flight.do(key, load)
+    except asyncio.CancelledError:
+        # O load continua (shield): se já abriu o stream para este pedido, ninguém mais vai ler
+        leader["abandoned"] = True
+        if "stream" in leader:
+            await leader["stream"][1].aclose()
+        raise
+    if shared is not None:
+        return RawResponse(shared.content, shared.status_code, shared.headers)
+    if "stream" in leader:
+        # Este pedido abriu o stream: segue com ele, sem repetir o GET
+        response, stack, body, buffered = leader["stream"]
+        return relay_response(response, stack, body, buffered)
+    # Esperava o stream de outro pedido, que não é compartilhável: abre o próprio
+    return await proxy_request(pool, "GET", path, request, params=params)
@@ -0,0 +1,222 @@
+# apps/services/api-gateway/ratelimit.py
+"""Limite de taxa por usuário no gateway: requisições por segundo e tokens por minuto
+
+Dois token buckets por usuário:
+
+- `requests`: RATE_LIMIT_RPS por segundo, com rajada de RATE_LIMIT_BURST;
+- `tokens`: RATE_LIMIT_TOKENS_PER_MINUTE tokens estimados do LLM. Cada mensagem
+  reserva os tokens do prompt + RATE_LIMIT_COMPLETION_RESERVE antes de seguir
+  para o orquestrador; quando a resposta termina, `settle` acerta a diferença
+  (devolve o que sobrou ou deixa o bucket negativo, atrasando a próxima). Se a
+  chamada falhou ou foi recusada sem gerar resposta, a reserva volta inteira.
+
+Com REDIS_URL os buckets ficam no Redis (script Lua: leitura, recarga e débito
+atômicos, relógio do próprio Redis), compartilhados entre réplicas do gateway.
+Sem Redis, ou enquanto ele estiver fora, usa buckets em memória.
+"""
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from shared.instrumentation import metrics, tracer
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis é opcional: sem ele cada réplica limita só o próprio tráfego
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "gateway:ratelimit:"
+REDIS_RETRY_INTERVAL = 30.0
+
+ratelimit_decisions = metrics.counter(
+    "ratelimit_decisions_total", "Decisões do rate limiter por limite e resultado",
+    ["service", "limit", "result"],
+)
+
+# KEYS[1] = bucket; ARGV = capacidade, recarga (tokens/s), custo, permitir_saldo_negativo
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local allow_debt = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if allow_debt == 1 or tokens >= cost then
+  tokens = math.min(capacity, tokens - cost)
+  allowed = 1
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - math.min(tokens, 0)) / rate) + 1)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata (~4 caracteres por token), a mesma usada no orquestrador"""
+    return max(1, len(text or "") // 4)
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    remaining: float = 0.0
+    retry_after: float = 0.0
+    limit: str = ""
+
+
+class LocalBuckets:
+    """Token buckets em memória (fallback), com limite de usuários guardados"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, key: str, capacity: float, rate: float, cost: float, allow_debt: bool) -> Tuple[bool, float, float]:
+        now = time.monotonic()
+        tokens, ts = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+        if allow_debt or tokens >= cost:
+            tokens = min(capacity, tokens - cost)
+            allowed, retry_after = True, 0.0
+        else:
+            allowed, retry_after = False, (cost - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, tokens, retry_after
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RateLimiter:
+    def __init__(self, redis_url: Optional[str] = None, requests_per_second: float = 5.0,
+                 burst: int = 10, tokens_per_minute: int = 20000, completion_reserve: int = 300,
+                 max_local_keys: int = 10000):
+        self.redis_url = redis_url
+        self.requests_per_second = requests_per_second
+        self.burst = max(1, burst)
+        self.tokens_per_minute = tokens_per_minute
+        self.completion_reserve = completion_reserve
+        self.local = LocalBuckets(max_local_keys)
+        self._redis = None
+        self._script = None
+        self._redis_retry_at = 0.0
+        self.allowed: Dict[str, int] = {}
+        self.limited: Dict[str, int] = {}
+        self.redis_errors = 0
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        return cls(
+            os.getenv("REDIS_URL"),
+            requests_per_second=float(os.getenv("RATE_LIMIT_RPS", "5")),
+            burst=int(os.getenv("RATE_LIMIT_BURST", "10")),
+            tokens_per_minute=int(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "20000")),
+            completion_reserve=int(os.getenv("RATE_LIMIT_COMPLETION_RESERVE", "300")),
+        )
+
+    async def start(self):
+        if not (self.redis_url and aioredis):
+            return
+        self._redis = aioredis.from_url(self.redis_url, decode_responses=True,
+                                        socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    @property
+    def redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_retry_at
+
+    async def _take(self, limit: str, user_id: str, capacity: float, rate: float,
+                    cost: float, allow_debt: bool = False, record: bool = True) -> Decision:
+        key = f"{limit}:{user_id}"
+        # Um pedido maior que a capacidade nunca caberia no bucket
+        cost = min(cost, capacity)
+        if self.redis_available:
+            try:
+                allowed, tokens, retry_after = await self._script(
+                    keys=[KEY_PREFIX + key], args=[capacity, rate, cost, int(allow_debt)])
+                decision = Decision(bool(int(allowed)), float(tokens), float(retry_after), limit)
+                return self._record(decision) if record else decision
+            except Exception as e:
+                self.redis_errors += 1
+                logger.warning("Erro no Redis do rate limiter, usando memória: %s", e)
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+        allowed, tokens, retry_after = self.local.take(key, capacity, rate, cost, allow_debt)
+        decision = Decision(allowed, tokens, retry_after, limit)
+        return self._record(decision) if record else decision
+
+    def _record(self, decision: Decision) -> Decision:
+        counts = self.allowed if decision.allowed else self.limited
+        counts[decision.limit] = counts.get(decision.limit, 0) + 1
+        ratelimit_decisions.inc(service=tracer.service_name, limit=decision.limit,
+                                result="allowed" if decision.allowed else "limited")
+        return decision
+
+    async def admit(self, user_id: str, prompt_tokens: int) -> Tuple[Decision, int]:
+        """Consome uma requisição e reserva os tokens da mensagem; retorna (decisão, reservado)"""
+        if self.requests_per_second > 0:
+            decision = await self._take("requests", user_id, self.burst, self.requests_per_second, 1)
+            if not decision.allowed:
+                return decision, 0
+        if self.tokens_per_minute <= 0:
+            return Decision(True), 0
+        reserved = prompt_tokens + self.completion_reserve
+        decision = await self._take("tokens", user_id, self.tokens_per_minute,
+                                    self.tokens_per_minute / 60.0, reserved)
+        return decision, (min(reserved, self.tokens_per_minute) if decision.allowed else 0)
+
+    async def settle(self, user_id: str, reserved: int, completion_tokens: int, failed: bool = False):
+        """Acerta a reserva com o tamanho real da resposta (positivo = débito extra)
+
+        `failed`: o upstream falhou ou recusou (503/429...) sem gerar resposta;
+        prompt e reserva da resposta são devolvidos.
+        """
+        if self.tokens_per_minute <= 0 or not reserved:
+            return
+        if failed and not completion_tokens:
+            delta = -reserved
+        else:
+            delta = completion_tokens - self.completion_reserve
+        if delta == 0:
+            return
+        try:
+            await self._take("tokens", user_id, self.tokens_per_minute,
+                             self.tokens_per_minute / 60.0, delta, allow_debt=True, record=False)
+        except Exception as e:
+            logger.warning("Erro ao acertar o orçamento de tokens: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis" if self.redis_available else "memory",
+            "requests_per_second": self.requests_per_second,
+            "burst": self.burst,
+            "tokens_per_minute": self.tokens_per_minute,
+            "allowed": dict(self.allowed),
+            "limited": dict(self.limited),
+            "local_buckets": len(self.local),
+            "redis_errors": self.redis_errors,
+        }
+
+
+def retry_after_header(decision: Decision) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(decision.retry_after)))}
@@ -0,0 +1,236 @@
+# apps/services/api-gateway/resilience.py
+"""Proteções do gateway contra upstreams lentos ou fora do ar
+
+- `CircuitBreaker`: após N falhas seguidas (timeout, erro de conexão, 5xx) o
+  circuito abre e as chamadas falham na hora; passado o tempo de espera, uma
+  chamada de teste (half-open) decide se fecha de novo ou reabre.
+- `AdaptiveTimeout`: o read timeout acompanha a latência observada
+  (p99 x multiplicador), limitado entre um mínimo e o timeout configurado.
+- `AdmissionMiddleware`: limite de requisições simultâneas por rota; acima
+  dele, ou com o circuito do upstream aberto, responde 503 imediatamente com
+  Retry-After em vez de enfileirar.
+"""
+import json
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Chamada recusada sem tocar a rede porque o circuito do upstream está aberto"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuito do serviço '{name}' aberto")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10.0,
+                 max_reset_timeout: float = 60.0, half_open_max: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_max = half_open_max
+        self.state = CLOSED
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """Circuito aberto e ainda dentro do tempo de espera (não altera o estado)"""
+        return self.state == OPEN and self.retry_after() > 0
+
+    def before_call(self):
+        """Reserva a chamada ou levanta CircuitOpenError"""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.retry_after())
+            self.state = HALF_OPEN
+            self.probes = 0
+        if self.state == HALF_OPEN:
+            if self.probes >= self.half_open_max:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 1.0)
+            self.probes += 1
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            self.state = CLOSED
+            self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            # Teste falhou: reabre com espera maior (backoff exponencial)
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def release_probe(self):
+        """Chamada de teste terminou sem veredito (ex.: cancelada pelo cliente)"""
+        if self.state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": OPEN if self.is_open() else (HALF_OPEN if self.state != CLOSED else CLOSED),
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 3) if self.state == OPEN else 0.0,
+        }
+
+
+class AdaptiveTimeout:
+    """Read timeout derivado das últimas latências bem-sucedidas"""
+
+    def __init__(self, ceiling: float, floor: float = 1.0, multiplier: float = 3.0,
+                 window: int = 200, min_samples: int = 20):
+        self.ceiling = ceiling
+        self.floor = min(floor, ceiling)
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._current = ceiling
+        self._dirty = False
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+        self._dirty = True
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    def current(self) -> float:
+        if self._dirty:
+            self._dirty = False
+            if len(self._samples) >= self.min_samples:
+                p99 = self.percentile(99)
+                self._current = min(self.ceiling, max(self.floor, p99 * self.multiplier))
+        return self._current
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p99 = self.percentile(50), self.percentile(99)
+        return {
+            "read_timeout": round(self.current(), 3),
+            "samples": len(self._samples),
+            "p50_ms": round(p50 * 1000, 3) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 3) if p99 is not None else None,
+        }
+
+
+class RouteLimit:
+    def __init__(self, prefix: str, max_inflight: int, upstream: Optional[str] = None):
+        self.prefix = prefix
+        self.max_inflight = max_inflight
+        self.upstream = upstream
+        self.inflight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.circuit_rejected = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_inflight": self.max_inflight,
+            "inflight": self.inflight,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "circuit_rejected": self.circuit_rejected,
+        }
+
+
+def route_limits_from_env(defaults: List[Tuple[str, str, int, Optional[str]]]) -> List[RouteLimit]:
+    """[(nome, prefixo, limite, upstream)] -> RouteLimit; ADMISSION_<NOME>=N sobrescreve o limite"""
+    return [
+        RouteLimit(prefix, int(os.getenv(f"ADMISSION_{name.upper()}", str(limit))), upstream)
+        for name, prefix, limit, upstream in defaults
+    ]
+
+
+class AdmissionControl:
+    """Limites por rota (prefixo do path) e os circuitos dos upstreams de cada rota"""
+
+    def __init__(self, limits: List[RouteLimit], breakers: Optional[Dict[str, CircuitBreaker]] = None):
+        # Prefixos mais longos primeiro ("/api/chat/process/stream" antes de "/api/chat")
+        self.limits = sorted(limits, key=lambda limit: len(limit.prefix), reverse=True)
+        self.breakers = breakers or {}
+
+    def match(self, path: str) -> Optional[RouteLimit]:
+        for limit in self.limits:
+            if path == limit.prefix or path.startswith(limit.prefix.rstrip("/") + "/"):
+                return limit
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {limit.prefix: limit.stats() for limit in self.limits}
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI puro: a vaga da rota fica ocupada até o fim da resposta (inclusive streaming)"""
+
+    def __init__(self, app, control: AdmissionControl):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        limit = self.control.match(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None or scope.get("method") == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        breaker = self.control.breakers.get(limit.upstream) if limit.upstream else None
+        if breaker is not None and breaker.is_open():
+            limit.circuit_rejected += 1
+            await self._reject(send, f"Serviço {limit.upstream} indisponível", breaker.retry_after())
+            return
+        if limit.inflight >= limit.max_inflight:
+            limit.shed += 1
+            await self._reject(send, "Gateway sobrecarregado, tente novamente", 1.0)
+            return
+
+        limit.inflight += 1
+        limit.admitted += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limit.inflight -= 1
+
+    @staticmethod
+    async def _reject(send, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,118 @@
+# apps/services/api-gateway/tests/test_ratelimit.py
+"""Token buckets do gateway (memória e script Lua no Redis): recarga, recusa e acerto da reserva"""
+import asyncio
+
+import pytest
+
+from ratelimit import KEY_PREFIX, TOKEN_BUCKET_SCRIPT, RateLimiter
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    return request.param
+
+
+def make_limiter(backend: str, **options) -> RateLimiter:
+    limiter = RateLimiter(**options)
+    if backend == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")  # EVALSHA no fakeredis
+        limiter._redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        limiter._script = limiter._redis.register_script(TOKEN_BUCKET_SCRIPT)
+    return limiter
+
+
+async def rewind(limiter: RateLimiter, key: str, seconds: float):
+    """Simula a passagem do tempo recuando o instante da última atualização do bucket"""
+    if limiter._redis is not None:
+        ts = await limiter._redis.hget(KEY_PREFIX + key, "ts")
+        await limiter._redis.hset(KEY_PREFIX + key, "ts", str(float(ts) - seconds))
+    else:
+        tokens, ts = limiter.local._buckets[key]
+        limiter.local._buckets[key] = (tokens, ts - seconds)
+
+
+async def balance(limiter: RateLimiter, user_id: str) -> float:
+    decision = await limiter._take("tokens", user_id, limiter.tokens_per_minute,
+                                   limiter.tokens_per_minute / 60.0, 0, record=False)
+    return decision.remaining
+
+
+def test_burst_then_reject_then_refill(backend):
+    async def main():
+        limiter = make_limiter(backend, requests_per_second=1, burst=3, tokens_per_minute=0)
+        admitted = [(await limiter.admit("u", 10))[0] for _ in range(4)]
+        assert [d.allowed for d in admitted] == [True, True, True, False]
+        assert admitted[-1].limit == "requests"
+        assert 0 < admitted[-1].retry_after <= 1
+        # Outro usuário tem o próprio bucket
+        assert (await limiter.admit("v", 10))[0].allowed
+
+        await rewind(limiter, "requests:u", 2)
+        refilled = [(await limiter.admit("u", 10))[0].allowed for _ in range(3)]
+        assert refilled == [True, True, False]
+        assert limiter.limited["requests"] == 2
+
+    asyncio.run(main())
+
+
+def test_reserve_and_settle_with_actual_completion(backend):
+    async def main():
+        limiter = make_limiter(backend, requests_per_second=0, tokens_per_minute=6000, completion_reserve=300)
+        decision, reserved = await limiter.admit("u", 100)
+        assert decision.allowed and reserved == 400
+        assert await balance(limiter, "u") == pytest.approx(5600, abs=5)
+
+        # Resposta menor que a reserva: devolve a sobra
+        await limiter.settle("u", reserved, 50)
+        assert await balance(limiter, "u") == pytest.approx(5850, abs=5)
+
+    asyncio.run(main())
+
+
+def test_failed_call_refunds_whole_reservation(backend):
+    async def main():
+        limiter = make_limiter(backend, requests_per_second=0, tokens_per_minute=6000, completion_reserve=300)
+        _, reserved = await limiter.admit("u", 1000)
+        assert await balance(limiter, "u") == pytest.approx(4700, abs=5)
+        await limiter.settle("u", reserved, 0, failed=True)
+        assert await balance(limiter, "u") == pytest.approx(6000, abs=5)
+        # Falha depois de gerar parte da resposta: cobra o que foi gerado
+        _, reserved = await limiter.admit("u", 1000)
+        await limiter.settle("u", reserved, 100, failed=True)
+        assert await balance(limiter, "u") == pytest.approx(4900, abs=5)
+
+    asyncio.run(main())
+
+
+def test_long_completion_goes_into_debt_and_blocks(backend):
+    async def main():
+        limiter = make_limiter(backend, requests_per_second=0, tokens_per_minute=600, completion_reserve=100)
+        _, reserved = await limiter.admit("u", 100)
+        await limiter.settle("u", reserved, 1000)
+        assert await balance(limiter, "u") < 0
+        decision, reserved = await limiter.admit("u", 10)
+        assert not decision.allowed and reserved == 0
+        assert decision.limit == "tokens" and decision.retry_after > 0
+        # Recusado não reserva nada: settle sem reserva não mexe no bucket
+        before = await balance(limiter, "u")
+        await limiter.settle("u", reserved, 0, failed=True)
+        assert await balance(limiter, "u") == pytest.approx(before, abs=1)
+
+    asyncio.run(main())
+
+
+def test_redis_errors_fall_back_to_memory():
+    class Broken:
+        async def __call__(self, keys, args):
+            raise ConnectionError("redis fora")
+
+    async def main():
+        limiter = RateLimiter(requests_per_second=1, burst=1, tokens_per_minute=0)
+        limiter._redis, limiter._script = object(), Broken()
+        assert (await limiter.admit("u", 1))[0].allowed
+        assert limiter.redis_errors == 1 and not limiter.redis_available
+        assert not (await limiter.admit("u", 1))[0].allowed  # Bucket local, sem tentar o Redis de novo
+        assert limiter.redis_errors == 1
+
+    asyncio.run(main())
@@ -0,0 +1,277 @@
+# apps/services/api-gateway/upstream.py
+"""Clientes HTTP compartilhados (com pool de conexões) para os serviços upstream do gateway
+
+Cada pool tem seu circuit breaker e, nas requisições completas, um read timeout
+adaptativo (ver resilience.py).
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from shared.instrumentation import TracingTransport
+from shared.singleflight import SingleFlight
+from resilience import AdaptiveTimeout, CircuitBreaker
+
+try:
+    import h2  # noqa: F401  (habilita HTTP/2 no httpx quando instalado)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Valores padrão por serviço - o orquestrador espera pela resposta do LLM,
+# então precisa de um read timeout bem maior que os demais (e de um piso maior
+# para o timeout adaptativo). `singleflight_ttl` é a janela (s) em que um GET
+# idêntico reaproveita a resposta anterior
+DEFAULT_POOL_SETTINGS: Dict[str, Dict[str, Any]] = {
+    "orchestrator": {"max_connections": 100, "max_keepalive": 20, "read_timeout": 60.0, "timeout_floor": 10.0},
+    "calendar": {"max_connections": 50, "max_keepalive": 10, "read_timeout": 10.0, "singleflight_ttl": 0.5},
+    "settings": {"max_connections": 50, "max_keepalive": 10, "read_timeout": 10.0, "singleflight_ttl": 1.0},
+}
+
+
+def _env(name: str, key: str, default: Any) -> Any:
+    """Lê <SERVICO>_<CHAVE> do ambiente convertendo para o tipo do valor padrão"""
+    raw = os.getenv(f"{name.upper()}_{key.upper()}")
+    if raw is None:
+        return default
+    if isinstance(default, bool):
+        return raw.strip().lower() in ("1", "true", "yes", "on")
+    return type(default)(raw)
+
+
+@dataclass
+class UpstreamConfig:
+    """Configuração do pool de conexões de um serviço upstream"""
+    name: str
+    base_url: str
+    max_connections: int = 50
+    max_keepalive: int = 10
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 10.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+    http2: bool = HTTP2_AVAILABLE
+    singleflight_ttl: float = 0.0
+    # Circuit breaker: falhas seguidas para abrir e espera (s) até a chamada de teste
+    failure_threshold: int = 5
+    reset_timeout: float = 10.0
+    # Read timeout adaptativo = p99 x multiplicador, entre timeout_floor e read_timeout
+    adaptive_timeout: bool = True
+    timeout_floor: float = 1.0
+    timeout_multiplier: float = 3.0
+
+    @classmethod
+    def from_env(cls, name: str, base_url: str) -> "UpstreamConfig":
+        """Monta a configuração a partir dos padrões do serviço e das variáveis de ambiente
+
+        Ex.: ORCHESTRATOR_MAX_CONNECTIONS=200, CALENDAR_READ_TIMEOUT=5, SETTINGS_HTTP2=false,
+        SETTINGS_SINGLEFLIGHT_TTL=0, ORCHESTRATOR_FAILURE_THRESHOLD=10, CALENDAR_ADAPTIVE_TIMEOUT=false
+        """
+        config = cls(name=name, base_url=base_url, **DEFAULT_POOL_SETTINGS.get(name, {}))
+        for key in ("max_connections", "max_keepalive", "keepalive_expiry", "connect_timeout",
+                    "read_timeout", "write_timeout", "pool_timeout", "http2", "singleflight_ttl",
+                    "failure_threshold", "reset_timeout", "adaptive_timeout", "timeout_floor",
+                    "timeout_multiplier"):
+            setattr(config, key, _env(name, key, getattr(config, key)))
+        config.http2 = config.http2 and HTTP2_AVAILABLE
+        return config
+
+
+class UpstreamPool:
+    """Pool de conexões keep-alive para um único serviço upstream, com métricas de uso"""
+
+    def __init__(self, config: UpstreamConfig):
+        self.config = config
+        self._client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+        # Limita as requisições simultâneas ao tamanho do pool para podermos medir a espera
+        self._slots = asyncio.Semaphore(config.max_connections)
+        self.in_use = 0
+        self.waiting = 0
+        self.requests = 0
+        self.errors = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        # GETs idênticos simultâneos compartilham uma única chamada upstream
+        self.flight = SingleFlight(config.name, ttl=config.singleflight_ttl)
+        self.breaker = CircuitBreaker(config.name, failure_threshold=config.failure_threshold,
+                                      reset_timeout=config.reset_timeout)
+        self.timeouts = AdaptiveTimeout(config.read_timeout, floor=config.timeout_floor,
+                                        multiplier=config.timeout_multiplier)
+
+    async def start(self):
+        if self._client is not None:
+            return
+        config = self.config
+        self._transport = httpx.AsyncHTTPTransport(
+            http2=config.http2,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        )
+        self._client = httpx.AsyncClient(
+            base_url=config.base_url,
+            # Um span por chamada upstream, com traceparent/X-Request-ID propagados
+            transport=TracingTransport(self._transport, peer=config.name),
+            timeout=httpx.Timeout(
+                connect=config.connect_timeout,
+                read=config.read_timeout,
+                write=config.write_timeout,
+                pool=config.pool_timeout,
+            ),
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._transport = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError(f"Pool do serviço '{self.config.name}' não foi iniciado")
+        return self._client
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        """Reserva uma vaga no pool registrando o tempo de espera"""
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.config.pool_timeout)
+        except asyncio.TimeoutError:
+            self.errors += 1
+            raise httpx.PoolTimeout(f"Pool do serviço '{self.config.name}' esgotado")
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        self.requests += 1
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._slots.release()
+
+    def _timeout(self) -> httpx.Timeout:
+        config = self.config
+        return httpx.Timeout(
+            connect=config.connect_timeout,
+            read=self.timeouts.current() if config.adaptive_timeout else config.read_timeout,
+            write=config.write_timeout,
+            pool=config.pool_timeout,
+        )
+
+    @asynccontextmanager
+    async def _guard(self) -> AsyncIterator[Dict[str, Any]]:
+        """Passa pelo circuit breaker; o bloco informa o status recebido em outcome["status"]"""
+        self.breaker.before_call()
+        outcome: Dict[str, Any] = {"status": None}
+        try:
+            yield outcome
+        except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release_probe()
+            raise
+        status = outcome["status"]
+        if status is None:
+            self.breaker.release_probe()
+        elif status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Executa uma requisição completa (corpo já lido) reutilizando as conexões do pool"""
+        # Timeout explícito (ex.: long polling) não entra na estatística do timeout adaptativo
+        adaptive = "timeout" not in kwargs
+        kwargs.setdefault("timeout", self._timeout())
+        async with self._guard() as outcome, self._slot():
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except httpx.HTTPError:
+                self.errors += 1
+                raise
+            outcome["status"] = response.status_code
+            if adaptive and response.status_code < 500:
+                self.timeouts.observe(time.perf_counter() - started)
+            return response
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """Abre uma resposta em streaming; a vaga no pool fica ocupada até o fim do bloco
+
+        O breaker considera só a abertura (status dos cabeçalhos); o timeout é o
+        configurado, já que o intervalo entre chunks não tem relação com a latência típica.
+        """
+        async with self._guard() as outcome, self._slot():
+            try:
+                async with self.client.stream(method, path, **kwargs) as response:
+                    outcome["status"] = response.status_code
+                    yield response
+            except httpx.HTTPError:
+                self.errors += 1
+                raise
+
+    def _connection_counts(self) -> Dict[str, int]:
+        # httpx não expõe o pool publicamente; lemos o estado do httpcore quando disponível
+        pool = getattr(self._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {"open": len(connections), "idle": idle}
+
+    def metrics(self) -> Dict[str, Any]:
+        config = self.config
+        return {
+            "base_url": config.base_url,
+            "http2": config.http2,
+            "max_connections": config.max_connections,
+            "max_keepalive": config.max_keepalive,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "connections": self._connection_counts(),
+            "requests": self.requests,
+            "errors": self.errors,
+            "wait_time_avg_ms": round(1000 * self.wait_time_total / self.requests, 3) if self.requests else 0.0,
+            "wait_time_max_ms": round(1000 * self.wait_time_max, 3),
+            "singleflight": self.flight.stats(),
+            "circuit": self.breaker.stats(),
+            "timeout": self.timeouts.stats(),
+        }
+
+
+class UpstreamRegistry:
+    """Um pool por serviço configurado; iniciado e encerrado junto com a aplicação"""
+
+    def __init__(self, services: Dict[str, str]):
+        self.pools: Dict[str, UpstreamPool] = {
+            name: UpstreamPool(UpstreamConfig.from_env(name, url))
+            for name, url in services.items()
+        }
+
+    def __getitem__(self, name: str) -> UpstreamPool:
+        return self.pools[name]
+
+    async def start(self):
+        for pool in self.pools.values():
+            await pool.start()
+
+    async def close(self):
+        await asyncio.gather(*(pool.close() for pool in self.pools.values()))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {name: pool.metrics() for name, pool in self.pools.items()}
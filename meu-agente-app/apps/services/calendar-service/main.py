@@ -1,76 +1,641 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from datetime import datetime, date
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, BackgroundTasks, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import select, insert, update, or_, and_
+from sqlalchemy.orm import Session
+from datetime import datetime, date, timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, List, Literal, Optional, Tuple
+import asyncio
+import base64
+import binascii
+import heapq
 import json
+import os
+from itertools import islice
+
+from database import EventModel, SessionLocal, create_tables, engine, get_db, init_default_events
+from shared.instrumentation import instrument_sqlalchemy, setup_instrumentation
+from shared.logs import setup_logging
+from recurrence import occurrences, recurrence_columns
+from sync import LAST_ID, VersionCache, bump_version, decode_token, encode_token, list_etag, prune_tombstones, sync_state
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Sem Redis as mudanças simplesmente não são publicadas
+    aioredis = None
 
 app = FastAPI(title="Calendar Service", version="1.0.0")
+setup_instrumentation(app, "calendar-service")
+logger = setup_logging("calendar-service")
+instrument_sqlalchemy(engine)
+
+# Canal em que as mudanças da agenda são anunciadas (usado para invalidar caches)
+CHANGES_CHANNEL = "calendar:changes"
+REDIS_URL = os.getenv("REDIS_URL")
+redis_client = None
+
+DEFAULT_USER = "default_user"
+PERSONAL_TYPES = ["holiday", "personal", "appointment", "exercise"]
+PROFESSIONAL_TYPES = ["meeting", "presentation", "call"]
+CALENDAR_TYPES = {"personal": PERSONAL_TYPES, "professional": PROFESSIONAL_TYPES}
+PERSONAL_COLOR = "#22c55e"  # Verde para eventos pessoais
+PROFESSIONAL_COLOR = "#3b82f6"  # Azul para eventos profissionais
+MAX_PAGE_SIZE = 1000
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50000"))
+BATCH_CHUNK_SIZE = 500
+# Tombstones (eventos removidos) ficam este tempo à disposição do feed de mudanças
+TOMBSTONE_TTL_DAYS = float(os.getenv("CALENDAR_TOMBSTONE_TTL_DAYS", "30"))
+TOMBSTONE_PRUNE_INTERVAL = 3600
+# Até onde séries sem fim são expandidas quando a consulta não informa `to`
+RECURRENCE_HORIZON_DAYS = int(os.getenv("CALENDAR_RECURRENCE_HORIZON_DAYS", "365"))
+# /all, /personal e /professional sem `from`/`to`: eventos simples todos, como antes, e as
+# séries só de hoje até N dias (a série semanal padrão até o horizonte seriam ~500 linhas)
+COMPAT_SERIES_DAYS = int(os.getenv("CALENDAR_COMPAT_SERIES_DAYS", "30"))
+prune_task: Optional[asyncio.Task] = None
 
 class Event(BaseModel):
-    id: str
+    id: Optional[str] = None  # Gerado pelo banco na criação
     title: str
     date: str
-    color: str
+    color: Optional[str] = None
     type: str = "event"
+    user_id: str = DEFAULT_USER
+    # Recorrência: regra RRULE (ex.: FREQ=WEEKLY;BYDAY=MO,WE) e datas excluídas da série.
+    # Nas listagens cada ocorrência sai com o id da série e a própria data.
+    rrule: Optional[str] = None
+    exdates: Optional[List[str]] = None
+
+class EventPage(BaseModel):
+    events: List[Event]
+    next_cursor: Optional[str] = None
+
+class EventChange(BaseModel):
+    op: Literal["insert", "update", "delete"]
+    id: str
+    version: int
+    event: Optional[Event] = None  # Ausente em `delete`
+
+class ChangePage(BaseModel):
+    changes: List[EventChange]
+    next_token: str  # Usar como `since` na próxima consulta
+    has_more: bool = False
+
+class BatchOperation(BaseModel):
+    """Item de /events/batch: `insert` usa os campos do evento, `update` os que vierem, `delete` só o id"""
+    op: Literal["insert", "update", "delete"] = "insert"
+    id: Optional[str] = None
+    title: Optional[str] = None
+    date: Optional[str] = None
+    color: Optional[str] = None
+    type: Optional[str] = None
+    rrule: Optional[str] = None  # "" remove a recorrência
+    exdates: Optional[List[str]] = None
+    user_id: str = DEFAULT_USER
+
+class BatchItemResult(BaseModel):
+    index: int
+    op: str
+    status: Literal["ok", "error", "not_found"]
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class BatchResult(BaseModel):
+    committed: bool
+    counts: Dict[str, int]
+    results: List[BatchItemResult]
+
+def to_event(row: EventModel, on: Optional[date] = None) -> Event:
+    """Evento da linha; `on` é a data da ocorrência quando a linha é uma série"""
+    return Event(
+        id=str(row.id),
+        title=row.title,
+        date=(on or row.date).isoformat(),
+        color=row.color,
+        type=row.type,
+        user_id=row.user_id,
+        rrule=row.rrule,
+        exdates=row.exdates.split(",") if row.exdates else None,
+    )
+
+def parse_event_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Data inválida: {value} (use AAAA-MM-DD)")
+
+def encode_cursor(event_date: date, event_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{event_date.isoformat()}|{event_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        event_date, event_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return date.fromisoformat(event_date), int(event_id)
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def query_events(db: Session, user_id: str = DEFAULT_USER, types: Optional[List[str]] = None,
+                 from_date: Optional[date] = None, to_date: Optional[date] = None,
+                 after: Optional[tuple] = None, limit: Optional[int] = None) -> List[EventModel]:
+    """Eventos simples: consulta indexada por usuário/tipo/data, ordenada por (date, id) para keyset"""
+    stmt = select(EventModel).where(EventModel.user_id == user_id, EventModel.deleted_at.is_(None),
+                                    EventModel.rrule.is_(None))
+    if types:
+        stmt = stmt.where(EventModel.type.in_(types))
+    if from_date:
+        stmt = stmt.where(EventModel.date >= from_date)
+    if to_date:
+        stmt = stmt.where(EventModel.date <= to_date)
+    if after:
+        after_date, after_id = after
+        stmt = stmt.where(or_(
+            EventModel.date > after_date,
+            and_(EventModel.date == after_date, EventModel.id > after_id),
+        ))
+    stmt = stmt.order_by(EventModel.date, EventModel.id)
+    if limit:
+        stmt = stmt.limit(limit)
+    return list(db.scalars(stmt))
+
+def query_series(db: Session, user_id: str = DEFAULT_USER, types: Optional[List[str]] = None,
+                 from_date: Optional[date] = None, to_date: Optional[date] = None) -> List[EventModel]:
+    """Séries recorrentes que podem ter ocorrências na janela (uma linha por série)"""
+    stmt = select(EventModel).where(EventModel.user_id == user_id, EventModel.deleted_at.is_(None),
+                                    EventModel.rrule.is_not(None))
+    if types:
+        stmt = stmt.where(EventModel.type.in_(types))
+    if from_date:
+        stmt = stmt.where(or_(EventModel.series_end.is_(None), EventModel.series_end >= from_date))
+    if to_date:
+        stmt = stmt.where(EventModel.date <= to_date)
+    return list(db.scalars(stmt))
+
+def recurrence_horizon() -> date:
+    return date.today() + timedelta(days=RECURRENCE_HORIZON_DAYS)
+
+def series_occurrences(row: EventModel, from_date: Optional[date], to_date: date,
+                       after: Optional[tuple]) -> Iterator[Tuple[date, int, EventModel]]:
+    after_date, after_id = after or (None, None)
+    for day in occurrences(row.rrule, row.date, row.exdates, from_date or row.date, to_date, after=after_date):
+        if day != after_date or row.id > after_id:
+            yield day, row.id, row
+
+def query_occurrences(db: Session, user_id: str = DEFAULT_USER, types: Optional[List[str]] = None,
+                      from_date: Optional[date] = None, to_date: Optional[date] = None,
+                      after: Optional[tuple] = None, limit: Optional[int] = None,
+                      series_window: Optional[Tuple[date, date]] = None) -> List[Tuple[date, EventModel]]:
+    """Eventos simples e ocorrências das séries na janela, intercalados na ordem (date, id)
+
+    As séries são expandidas sob demanda e só até completar `limit`; sem `to`,
+    séries sem fim param em RECURRENCE_HORIZON_DAYS a partir de hoje.
+    `series_window` restringe só as séries (endpoints de compatibilidade).
+    """
+    singles = query_events(db, user_id=user_id, types=types, from_date=from_date, to_date=to_date,
+                           after=after, limit=limit)
+    series_from, series_to = series_window or (from_date, to_date or recurrence_horizon())
+    merged = heapq.merge(
+        ((row.date, row.id, row) for row in singles),
+        *[series_occurrences(row, series_from, series_to, after)
+          for row in query_series(db, user_id=user_id, types=types, from_date=series_from, to_date=series_to)],
+        key=lambda item: item[:2],
+    )
+    return [(day, row) for day, _, row in (islice(merged, limit) if limit else merged)]
+
+def color_for_type(event_type: str) -> str:
+    return PROFESSIONAL_COLOR if event_type in PROFESSIONAL_TYPES else PERSONAL_COLOR
+
+def insert_event(db: Session, event: Event, color: Optional[str] = None) -> Event:
+    event_date = parse_event_date(event.date)
+    try:
+        recurrence = recurrence_columns(event.rrule, event_date, event.exdates)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    version = bump_version(db, event.user_id)
+    row = EventModel(
+        user_id=event.user_id,
+        title=event.title,
+        date=event_date,
+        color=color or event.color or PERSONAL_COLOR,
+        type=event.type,
+        version=version,
+        created_version=version,
+        **recurrence,
+    )
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    return to_event(row)
+
+# Criar tabelas no banco de dados
+create_tables()
+
+@app.on_event("startup")
+async def startup_event():
+    global redis_client, prune_task
+    init_default_events()
+    if REDIS_URL and aioredis:
+        redis_client = aioredis.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    prune_task = asyncio.create_task(prune_tombstones_periodically())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if prune_task is not None:
+        prune_task.cancel()
+    if redis_client is not None:
+        await redis_client.aclose()
+
+def prune_old_tombstones() -> int:
+    db = SessionLocal()
+    try:
+        return prune_tombstones(db, datetime.utcnow() - timedelta(days=TOMBSTONE_TTL_DAYS))
+    finally:
+        db.close()
 
-# Mock data - em produção isso viria de um banco de dados
-ALL_EVENTS = [
-    Event(id="1", title="Aniversário da cidade", date="2025-01-20", color="#22c55e", type="holiday"),
-    Event(id="2", title="Reunião família", date="2025-01-19", color="#22c55e", type="personal"),
-    Event(id="3", title="Dentista", date="2025-01-21", color="#22c55e", type="appointment"),
-    Event(id="4", title="Academia", date="2025-01-20", color="#22c55e", type="exercise"),
-    Event(id="5", title="Reunião equipe", date="2025-01-20", color="#3b82f6", type="meeting"),
-    Event(id="6", title="Apresentação projeto", date="2025-01-21", color="#3b82f6", type="presentation"),
-    Event(id="7", title="Call cliente", date="2025-01-19", color="#3b82f6", type="call")
-]
+async def prune_tombstones_periodically():
+    while True:
+        try:
+            removed = await run_in_threadpool(prune_old_tombstones)
+            if removed:
+                logger.info("Tombstones removidos", extra={"count": removed})
+        except Exception as e:
+            logger.warning("Erro ao limpar tombstones: %s", e)
+        await asyncio.sleep(TOMBSTONE_PRUNE_INTERVAL)
+
+async def publish_change(action: str, event_id: Optional[str] = None):
+    """Anuncia a mudança para os consumidores que mantêm cache da agenda"""
+    if redis_client is None:
+        return
+    try:
+        await redis_client.publish(CHANGES_CHANNEL, json.dumps({"action": action, "id": event_id}))
+    except Exception as e:
+        logger.warning("Falha ao publicar mudança da agenda: %s", e)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "calendar-service"}
 
+def not_modified(db: Session, request: Request, response: Response, user_id: str,
+                 if_none_match: Optional[str], horizon: Optional[date] = None) -> bool:
+    """Define a ETag da listagem; True se o cliente já tem a versão atual (responder 304)"""
+    version, _ = sync_state(db, user_id)
+    params = dict(request.query_params)
+    if "to" not in params:
+        # Sem `to` as séries vão até o horizonte, que avança com o dia
+        params["_horizon"] = (horizon or recurrence_horizon()).isoformat()
+    etag = list_etag(version, request.url.path, params)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if not if_none_match:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def not_modified_response(response: Response) -> Response:
+    return Response(status_code=304, headers={k: response.headers[k] for k in ("ETag", "Cache-Control")})
+
+@app.get("/events/changes")
+def list_changes(
+    since: Optional[str] = Query(None, description="Token devolvido pela consulta anterior (vazio = desde o início)"),
+    user_id: str = DEFAULT_USER,
+    limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+) -> ChangePage:
+    """Inserções, atualizações e remoções posteriores ao token, em ordem de versão
+
+    Com `has_more` o cliente repete a consulta com `next_token`; sem mudanças o
+    token volta igual. 410 quando o token é anterior a tombstones já apagados
+    (o cliente deve baixar a agenda inteira e recomeçar do token vazio).
+    """
+    after_version, after_id = decode_token(since) if since else (0, 0)
+    if (after_version, after_id) == (0, 0):
+        since = None  # Token de uma sincronização completa vazia: equivale a começar do zero
+    version, pruned_version = sync_state(db, user_id)
+    if since and after_version < pruned_version:
+        raise HTTPException(status_code=410, detail="Token expirado: refaça a sincronização completa")
+
+    stmt = select(EventModel).where(
+        EventModel.user_id == user_id,
+        or_(EventModel.version > after_version,
+            and_(EventModel.version == after_version, EventModel.id > after_id)),
+    )
+    if not since:
+        # Sincronização completa: tombstones não interessam a quem ainda não tem nada
+        stmt = stmt.where(EventModel.deleted_at.is_(None))
+    rows = list(db.scalars(stmt.order_by(EventModel.version, EventModel.id).limit(limit + 1)))
+
+    changes = []
+    for row in rows[:limit]:
+        if row.deleted_at is not None:
+            changes.append(EventChange(op="delete", id=str(row.id), version=row.version))
+        else:
+            op = "insert" if not since or row.created_version > after_version else "update"
+            changes.append(EventChange(op=op, id=str(row.id), version=row.version, event=to_event(row)))
+    if rows:
+        last = rows[min(len(rows), limit) - 1]
+        next_token = encode_token(last.version, last.id)
+    else:
+        # Nada depois do token: o cliente já está na versão atual
+        next_token = encode_token(max(version, after_version), LAST_ID)
+    return ChangePage(changes=changes, next_token=next_token, has_more=len(rows) > limit)
+
+@app.get("/events")
+def list_events(
+    request: Request,
+    response: Response,
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    type: Optional[str] = Query(None, description="Um ou mais tipos separados por vírgula"),
+    calendar: Optional[str] = Query(None, description="personal ou professional"),
+    user_id: str = DEFAULT_USER,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+) -> EventPage:
+    """Eventos de uma janela de datas (inclusiva), paginados por keyset via `next_cursor`"""
+    if not_modified(db, request, response, user_id, if_none_match):
+        return not_modified_response(response)
+    types = [t.strip() for t in type.split(",") if t.strip()] if type else []
+    if calendar:
+        if calendar not in CALENDAR_TYPES:
+            raise HTTPException(status_code=422, detail=f"Calendário inválido: {calendar}")
+        types = [t for t in types if t in CALENDAR_TYPES[calendar]] if types else CALENDAR_TYPES[calendar]
+        if not types:
+            return EventPage(events=[])
+
+    rows = query_occurrences(
+        db, user_id=user_id, types=types, from_date=from_date, to_date=to_date,
+        after=decode_cursor(cursor) if cursor else None, limit=limit + 1,
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        last_date, last_row = rows[limit - 1]
+        next_cursor = encode_cursor(last_date, last_row.id)
+    return EventPage(events=[to_event(row, on) for on, row in rows[:limit]], next_cursor=next_cursor)
+
+def compat_events(db: Session, request: Request, response: Response, user_id: str,
+                  if_none_match: Optional[str], types: Optional[List[str]],
+                  from_date: Optional[date], to_date: Optional[date]):
+    """Listagem dos endpoints antigos; sem janela, as séries vão de hoje a COMPAT_SERIES_DAYS"""
+    series_window = None
+    if from_date is None and to_date is None:
+        today = date.today()
+        series_window = (today, today + timedelta(days=COMPAT_SERIES_DAYS))
+    if not_modified(db, request, response, user_id, if_none_match,
+                    horizon=series_window[1] if series_window else None):
+        return not_modified_response(response)
+    rows = query_occurrences(db, user_id=user_id, types=types, from_date=from_date, to_date=to_date,
+                             series_window=series_window)
+    return [to_event(row, on) for on, row in rows]
+
 @app.get("/all")
-async def get_all_calendar() -> List[Event]:
-    """Retorna todos os eventos da agenda"""
-    return ALL_EVENTS
+def get_all_calendar(request: Request, response: Response, user_id: str = DEFAULT_USER,
+                     from_date: Optional[date] = Query(None, alias="from"),
+                     to_date: Optional[date] = Query(None, alias="to"),
+                     if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)) -> List[Event]:
+    """Retorna todos os eventos da agenda (ocorrências de séries só na janela, ver COMPAT_SERIES_DAYS)"""
+    return compat_events(db, request, response, user_id, if_none_match, None, from_date, to_date)
 
 @app.get("/personal")
-async def get_personal_calendar() -> List[Event]:
+def get_personal_calendar(request: Request, response: Response, user_id: str = DEFAULT_USER,
+                          from_date: Optional[date] = Query(None, alias="from"),
+                          to_date: Optional[date] = Query(None, alias="to"),
+                          if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)) -> List[Event]:
     """Retorna eventos do calendário pessoal (mantido para compatibilidade)"""
-    return [e for e in ALL_EVENTS if e.type in ["holiday", "personal", "appointment", "exercise"]]
+    return compat_events(db, request, response, user_id, if_none_match, PERSONAL_TYPES, from_date, to_date)
 
-@app.get("/professional") 
-async def get_professional_calendar() -> List[Event]:
+@app.get("/professional")
+def get_professional_calendar(request: Request, response: Response, user_id: str = DEFAULT_USER,
+                              from_date: Optional[date] = Query(None, alias="from"),
+                              to_date: Optional[date] = Query(None, alias="to"),
+                              if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)) -> List[Event]:
     """Retorna eventos do calendário profissional (mantido para compatibilidade)"""
-    return [e for e in ALL_EVENTS if e.type in ["meeting", "presentation", "call"]]
+    return compat_events(db, request, response, user_id, if_none_match, PROFESSIONAL_TYPES, from_date, to_date)
 
 @app.post("/create")
-async def create_event(event: Event) -> Event:
+def create_event(event: Event, background_tasks: BackgroundTasks, db: Session = Depends(get_db)) -> Event:
     """Cria um novo evento na agenda"""
-    event.id = max([e.id for e in ALL_EVENTS], default=0) + 1
     # Define cor baseada no tipo
-    if event.type in ["meeting", "presentation", "call"]:
-        event.color = "#3b82f6"  # Azul para eventos profissionais
-    else:
-        event.color = "#22c55e"  # Verde para eventos pessoais
-    ALL_EVENTS.append(event)
-    return event
+    created = insert_event(db, event, color=color_for_type(event.type))
+    background_tasks.add_task(publish_change, "created", created.id)
+    return created
 
 @app.post("/personal")
-async def create_personal_event(event: Event) -> Event:
+def create_personal_event(event: Event, background_tasks: BackgroundTasks, db: Session = Depends(get_db)) -> Event:
     """Cria um novo evento pessoal (mantido para compatibilidade)"""
-    event.id = max([e.id for e in ALL_EVENTS], default=0) + 1
-    event.color = "#22c55e"
-    ALL_EVENTS.append(event)
-    return event
+    created = insert_event(db, event, color=PERSONAL_COLOR)
+    background_tasks.add_task(publish_change, "created", created.id)
+    return created
 
 @app.post("/professional")
-async def create_professional_event(event: Event) -> Event:
+def create_professional_event(event: Event, background_tasks: BackgroundTasks, db: Session = Depends(get_db)) -> Event:
     """Cria um novo evento profissional (mantido para compatibilidade)"""
-    event.id = max([e.id for e in ALL_EVENTS], default=0) + 1
-    event.color = "#3b82f6"
-    ALL_EVENTS.append(event)
-    return event
+    created = insert_event(db, event, color=PROFESSIONAL_COLOR)
+    background_tasks.add_task(publish_change, "created", created.id)
+    return created
+
+class BatchItemError(Exception):
+    pass
+
+def parse_event_id(value: Optional[str]) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BatchItemError(f"Id inválido: {value}")
+
+def batch_row(op: BatchOperation, partial: bool) -> Dict[str, Any]:
+    """Converte o item em valores de coluna; em updates apenas os campos enviados"""
+    values: Dict[str, Any] = {}
+    for field in ("title", "color", "type"):
+        value = getattr(op, field)
+        if value is not None:
+            values[field] = value
+    if op.date is not None:
+        try:
+            values["date"] = date.fromisoformat(op.date)
+        except ValueError:
+            raise BatchItemError(f"Data inválida: {op.date} (use AAAA-MM-DD)")
+    if op.rrule is not None:
+        values["rrule"] = op.rrule
+    if op.exdates is not None:
+        values["exdates"] = op.exdates
+    if partial:
+        if not values:
+            raise BatchItemError("Nenhum campo para atualizar")
+        return values
+    if "title" not in values or "date" not in values:
+        raise BatchItemError("Campos obrigatórios: title, date")
+    try:
+        values.update(recurrence_columns(values.pop("rrule", None), values["date"], values.pop("exdates", None)))
+    except ValueError as e:
+        raise BatchItemError(str(e))
+    values.setdefault("type", "event")
+    values.setdefault("color", color_for_type(values["type"]))
+    values["user_id"] = op.user_id
+    return values
+
+def recurrence_update(current: Dict[str, Any], values: Dict[str, Any]) -> Dict[str, Any]:
+    """Colunas de recorrência após um update parcial; ValueError se a combinação for inválida"""
+    rrule = values["rrule"] if "rrule" in values else current["rrule"]
+    if "exdates" in values:
+        exdates = values["exdates"]
+    else:
+        # Sem recorrência as exclusões antigas deixam de fazer sentido
+        exdates = current["exdates"].split(",") if current["exdates"] and rrule else None
+    return recurrence_columns(rrule, values.get("date", current["date"]), exdates)
+
+def apply_batch_run(db: Session, kind: str, items: List[tuple], versions: VersionCache) -> List[BatchItemResult]:
+    """Aplica uma sequência de operações do mesmo tipo com um único comando SQL"""
+    results: Dict[int, BatchItemResult] = {}
+    valid = []
+    for index, op in items:
+        try:
+            if kind == "insert":
+                valid.append((index, op, None, batch_row(op, partial=False)))
+            else:
+                event_id = parse_event_id(op.id)
+                values = batch_row(op, partial=True) if kind == "update" else {}
+                valid.append((index, op, event_id, values))
+        except BatchItemError as e:
+            results[index] = BatchItemResult(index=index, op=kind, status="error", id=op.id, error=str(e))
+
+    if kind == "insert" and valid:
+        for _, op, _, values in valid:
+            values["version"] = values["created_version"] = versions[op.user_id]
+        # Ids alocados pelo banco em lote, na mesma ordem dos itens
+        ids = db.scalars(
+            insert(EventModel).returning(EventModel.id, sort_by_parameter_order=True),
+            [values for _, _, _, values in valid],
+        ).all()
+        for (index, _, _, _), new_id in zip(valid, ids):
+            results[index] = BatchItemResult(index=index, op=kind, status="ok", id=str(new_id))
+    elif valid:
+        # Só atualiza/remove eventos que existem e pertencem ao usuário do item
+        requested = {(op.user_id, event_id) for _, op, event_id, _ in valid}
+        existing = {
+            (row.user_id, row.id): {"date": row.date, "rrule": row.rrule, "exdates": row.exdates}
+            for row in db.execute(
+                select(EventModel.user_id, EventModel.id, EventModel.date, EventModel.rrule, EventModel.exdates)
+                .where(EventModel.id.in_({event_id for _, event_id in requested}), EventModel.deleted_at.is_(None))
+            )
+        }
+        found = []
+        for index, op, event_id, values in valid:
+            current = existing.get((op.user_id, event_id))
+            if current is None:
+                results[index] = BatchItemResult(index=index, op=kind, status="not_found", id=str(event_id))
+                continue
+            if kind == "update" and ("rrule" in values or "exdates" in values or ("date" in values and current["rrule"])):
+                # Recorrência mexida (ou série com novo início): recalcula as colunas com os valores atuais
+                try:
+                    values = {**values, **recurrence_update(current, values)}
+                except ValueError as e:
+                    results[index] = BatchItemResult(index=index, op=kind, status="error", id=str(event_id), error=str(e))
+                    continue
+                current.update({key: values[key] for key in current if key in values})
+            found.append((event_id, {**values, "version": versions[op.user_id]}))
+            results[index] = BatchItemResult(index=index, op=kind, status="ok", id=str(event_id))
+        if found:
+            # Remoção vira tombstone: o feed de mudanças precisa anunciá-la
+            now = datetime.utcnow()
+            extra = {"updated_at": now} if kind == "update" else {"updated_at": now, "deleted_at": now}
+            db.execute(update(EventModel), [{"id": event_id, **extra, **values} for event_id, values in found])
+
+    return [results[index] for index, _ in items]
+
+def apply_batch_chunk(db: Session, chunk: List[tuple], versions: VersionCache) -> List[BatchItemResult]:
+    """Agrupa operações consecutivas do mesmo tipo preservando a ordem do lote"""
+    results: List[BatchItemResult] = []
+    run: List[tuple] = []
+    for item in chunk + [(None, None)]:
+        index, op = item
+        if run and (op is None or op.op != run[0][1].op):
+            results.extend(apply_batch_run(db, run[0][1].op, run, versions))
+            run = []
+        if op is not None:
+            run.append(item)
+    return results
+
+async def read_batch_items(request: Request) -> AsyncIterator[Any]:
+    """Lê o corpo como NDJSON em streaming (linha a linha) ou como um array JSON"""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if buffer.strip():
+            yield json.loads(buffer)
+        return
+
+    items = json.loads(await request.body())
+    if not isinstance(items, list):
+        raise HTTPException(status_code=422, detail="O corpo deve ser um array JSON ou NDJSON")
+    for item in items:
+        yield item
+
+@app.post("/events/batch", response_model=BatchResult)
+async def batch_events(request: Request, background_tasks: BackgroundTasks):
+    """Insere/atualiza/remove eventos em lote numa única transação
+
+    Aceita `application/json` (array) ou `application/x-ndjson` (um item por linha,
+    processado conforme chega). Se algum item falhar, nada é gravado e a resposta
+    (422) indica o resultado de cada item.
+    """
+    db = SessionLocal()
+    # Uma versão por usuário para o lote inteiro (atribuída no primeiro item de cada um)
+    versions = VersionCache(db)
+    results: List[BatchItemResult] = []
+    failed = False
+    try:
+        chunk: List[tuple] = []
+        index = 0
+        async for raw in read_batch_items(request):
+            if index >= BATCH_MAX_ITEMS:
+                raise HTTPException(status_code=413, detail=f"Máximo de {BATCH_MAX_ITEMS} itens por lote")
+            try:
+                chunk.append((index, BatchOperation.model_validate(raw)))
+            except ValidationError as e:
+                failed = True
+                op = raw.get("op", "insert") if isinstance(raw, dict) else "insert"
+                results.append(BatchItemResult(index=index, op=str(op), status="error",
+                                               error=e.errors()[0]["msg"]))
+            index += 1
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                results.extend(await run_in_threadpool(apply_batch_chunk, db, chunk, versions))
+                chunk = []
+        if chunk:
+            results.extend(await run_in_threadpool(apply_batch_chunk, db, chunk, versions))
+
+        results.sort(key=lambda r: r.index)
+        failed = failed or any(r.status != "ok" for r in results)
+        if failed:
+            await run_in_threadpool(db.rollback)
+        else:
+            await run_in_threadpool(db.commit)
+    except json.JSONDecodeError as e:
+        await run_in_threadpool(db.rollback)
+        raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+    except Exception:
+        await run_in_threadpool(db.rollback)
+        raise
+    finally:
+        await run_in_threadpool(db.close)
+
+    counts: Dict[str, int] = {}
+    for result in results:
+        key = f"{result.op}_{result.status}"
+        counts[key] = counts.get(key, 0) + 1
+    body = BatchResult(committed=not failed, counts=counts, results=results)
+    if failed:
+        return JSONResponse(status_code=422, content=body.model_dump())
+    if results:
+        background_tasks.add_task(publish_change, "batch")
+    return body
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+    uvicorn.run(app, host="0.0.0.0", port=8002, log_config=None)
@@ -0,0 +1,237 @@
+# apps/services/calendar-service/recurrence.py
+"""Eventos recorrentes: regra RRULE guardada uma vez, ocorrências geradas sob demanda
+
+Um evento recorrente é uma única linha em `calendar_events`: `date` é o início da
+série, `rrule` a regra (subconjunto da RFC 5545: FREQ=DAILY|WEEKLY|MONTHLY|YEARLY,
+INTERVAL, BYDAY para DAILY/WEEKLY, UNTIL ou COUNT) e `exdates` as datas
+excluídas. `series_end` (último dia possível da série, nulo se infinita) só serve
+para o banco descartar séries fora da janela consultada.
+
+As ocorrências saem de geradores que pulam direto para o período que contém o
+início da janela (aritmética sobre dias, semanas ou meses) e param no fim dela:
+o custo depende do tamanho da janela, não de quantas ocorrências a série já teve.
+Janelas de até `CACHE_MAX_DAYS` ficam em cache (LRU) por regra e janela; a
+chave inclui a regra, o início e as exclusões, então editar a série não exige
+invalidação.
+
+Edições valem para a série inteira; para mudar uma única ocorrência, exclua a
+data (`exdates`) e crie um evento simples no lugar.
+"""
+import os
+from bisect import bisect_left
+from calendar import monthrange
+from dataclasses import dataclass
+from datetime import date, timedelta
+from functools import lru_cache
+from itertools import islice
+from typing import FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+PERIOD_DAYS = {"DAILY": 1, "WEEKLY": 7, "MONTHLY": 31, "YEARLY": 366}
+MAX_COUNT = 10000
+CACHE_SIZE = int(os.getenv("CALENDAR_RECURRENCE_CACHE_SIZE", "4096"))
+CACHE_MAX_DAYS = 400
+
+
+@dataclass(frozen=True)
+class RecurrenceRule:
+    freq: str
+    interval: int = 1
+    by_day: Tuple[int, ...] = ()  # 0 = segunda-feira, como date.weekday()
+    until: Optional[date] = None
+    count: Optional[int] = None
+
+    def __str__(self) -> str:
+        """Forma canônica (é a que vai para o banco e para a chave do cache)"""
+        parts = [f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.by_day:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in self.by_day))
+        if self.until is not None:
+            parts.append("UNTIL=" + self.until.strftime("%Y%m%d"))
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        return ";".join(parts)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_rule(text: str) -> RecurrenceRule:
+    """RRULE (com ou sem o prefixo "RRULE:") -> RecurrenceRule; ValueError se inválida"""
+    parts = {}
+    for part in text.strip().upper().removeprefix("RRULE:").split(";"):
+        if not part:
+            continue
+        name, sep, value = part.partition("=")
+        if not sep or not value:
+            raise ValueError(f"Parte inválida na regra: {part}")
+        parts[name.strip()] = value.strip()
+    unsupported = set(parts) - {"FREQ", "INTERVAL", "BYDAY", "UNTIL", "COUNT"}
+    if unsupported:
+        raise ValueError("Partes não suportadas na regra: " + ", ".join(sorted(unsupported)))
+
+    freq = parts.get("FREQ")
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ inválida: {freq} (use {', '.join(FREQUENCIES)})")
+    try:
+        interval = int(parts.get("INTERVAL", "1"))
+        count = int(parts["COUNT"]) if "COUNT" in parts else None
+    except ValueError:
+        raise ValueError("INTERVAL e COUNT devem ser inteiros")
+    if interval < 1:
+        raise ValueError("INTERVAL deve ser maior que zero")
+    if count is not None and not 1 <= count <= MAX_COUNT:
+        raise ValueError(f"COUNT deve estar entre 1 e {MAX_COUNT}")
+
+    by_day: Tuple[int, ...] = ()
+    if "BYDAY" in parts:
+        days = [day.strip() for day in parts["BYDAY"].split(",")]
+        invalid = [day for day in days if day not in WEEKDAYS]
+        if invalid:
+            raise ValueError(f"BYDAY inválido: {', '.join(invalid)} (use {', '.join(WEEKDAYS)})")
+        if freq not in ("DAILY", "WEEKLY"):
+            raise ValueError("BYDAY só é suportado com FREQ=DAILY ou FREQ=WEEKLY")
+        by_day = tuple(sorted({WEEKDAYS.index(day) for day in days}))
+
+    until = None
+    if "UNTIL" in parts:
+        # Só a data importa (eventos são de dia inteiro): 20250131, 20250131T235959Z ou 2025-01-31
+        digits = parts["UNTIL"].replace("-", "")[:8]
+        try:
+            until = date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+        except ValueError:
+            raise ValueError(f"UNTIL inválido: {parts['UNTIL']}")
+        if count is not None:
+            raise ValueError("Use UNTIL ou COUNT, não os dois")
+    return RecurrenceRule(freq=freq, interval=interval, by_day=by_day, until=until, count=count)
+
+
+def parse_exdates(text: Optional[str]) -> FrozenSet[date]:
+    return frozenset(date.fromisoformat(value) for value in (text or "").split(",") if value)
+
+
+def format_exdates(values: Optional[Iterable[str]]) -> Optional[str]:
+    """Lista de datas AAAA-MM-DD -> texto ordenado guardado na coluna `exdates`; ValueError se inválida"""
+    if not values:
+        return None
+    try:
+        return ",".join(sorted({date.fromisoformat(value).isoformat() for value in values}))
+    except (TypeError, ValueError):
+        raise ValueError(f"Datas excluídas inválidas: {list(values)} (use AAAA-MM-DD)")
+
+
+def _add_days(day: date, days: int) -> date:
+    try:
+        return day + timedelta(days=days)
+    except OverflowError:
+        return date.max
+
+
+def _candidates(rule: RecurrenceRule, start: date, window_from: date, last: date) -> Iterator[date]:
+    """Datas geradas pela regra em [período de window_from, last], em ordem
+
+    Começa no período (dia, semana ou mês) que contém `window_from` sem passar
+    pelos anteriores; as exclusões e o corte exato da janela ficam com quem chama.
+    """
+    interval = rule.interval
+    try:
+        if rule.freq == "DAILY":
+            skip = max(0, (window_from - start).days // interval)
+            day = start + timedelta(days=skip * interval)
+            while day <= last:
+                if not rule.by_day or day.weekday() in rule.by_day:
+                    yield day
+                day += timedelta(days=interval)
+        elif rule.freq == "WEEKLY":
+            week = start - timedelta(days=start.weekday())  # Semanas começam na segunda (WKST=MO)
+            skip = max(0, (window_from - week).days // (7 * interval))
+            week += timedelta(weeks=skip * interval)
+            weekdays = rule.by_day or (start.weekday(),)
+            while week <= last:
+                for weekday in weekdays:
+                    day = week + timedelta(days=weekday)
+                    if day > last:
+                        return
+                    if day >= start:
+                        yield day
+                week += timedelta(weeks=interval)
+        else:
+            # MONTHLY/YEARLY repetem o dia do início; meses sem esse dia (31, 29/02) são pulados
+            step = interval if rule.freq == "MONTHLY" else 12 * interval
+            months = (window_from.year - start.year) * 12 + window_from.month - start.month
+            index = max(0, months // step) * step
+            while True:
+                year, month = divmod(start.month - 1 + index, 12)
+                year += start.year
+                if year > last.year:
+                    return
+                if start.day <= monthrange(year, month + 1)[1]:
+                    day = date(year, month + 1, start.day)
+                    if day > last:
+                        return
+                    yield day
+                index += step
+    except (OverflowError, ValueError):  # Passou de date.max
+        return
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def series_end(rule: RecurrenceRule, start: date) -> Optional[date]:
+    """Último dia possível da série (None se não tem fim); com COUNT percorre a série uma vez"""
+    if rule.until is not None:
+        return rule.until
+    if rule.count is None:
+        return None
+    # Limite folgado para regras que quase nunca casam (ex.: 31 de um mês a cada 2 meses)
+    bound = _add_days(start, PERIOD_DAYS[rule.freq] * rule.interval * 12 * (rule.count + 1))
+    last = start
+    for last in islice(_candidates(rule, start, start, bound), rule.count):
+        pass
+    return last
+
+
+def _generate(rule: RecurrenceRule, start: date, exdates: FrozenSet[date],
+              window_from: date, window_to: date) -> Iterator[date]:
+    end = series_end(rule, start)
+    last = window_to if end is None else min(window_to, end)
+    for day in _candidates(rule, start, window_from, last):
+        if day >= window_from and day not in exdates:
+            yield day
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def expand(rrule: str, start: date, exdates: str, window_from: date, window_to: date) -> Tuple[date, ...]:
+    """Ocorrências da série na janela (inclusiva), em cache por regra e janela"""
+    return tuple(_generate(parse_rule(rrule), start, parse_exdates(exdates), window_from, window_to))
+
+
+def occurrences(rrule: str, start: date, exdates: Optional[str], window_from: date, window_to: date,
+                after: Optional[date] = None) -> Iterator[date]:
+    """Ocorrências em [window_from, window_to] a partir de `after` (inclusive), sob demanda
+
+    Janelas do tamanho de uma tela vêm do cache; janelas maiores são geradas
+    aos poucos, a partir de `after`, e só até onde o consumidor ler.
+    """
+    window_from = max(window_from, start)
+    if window_from > window_to:
+        return iter(())
+    if (window_to - window_from).days <= CACHE_MAX_DAYS:
+        dates = expand(rrule, start, exdates or "", window_from, window_to)
+        return iter(dates[bisect_left(dates, after):] if after else dates)
+    lower = max(window_from, after) if after else window_from
+    return _generate(parse_rule(rrule), start, parse_exdates(exdates), lower, window_to)
+
+
+def recurrence_columns(rrule: Optional[str], start: date, exdates: Optional[List[str]]) -> dict:
+    """Valida a recorrência e devolve as colunas `rrule`, `exdates` e `series_end`; ValueError se inválida"""
+    if not rrule or not rrule.strip():
+        if exdates:
+            raise ValueError("Datas excluídas só valem para eventos recorrentes")
+        return {"rrule": None, "exdates": None, "series_end": None}
+    rule = parse_rule(rrule)
+    end = series_end(rule, start)
+    if end is not None and end < start:
+        raise ValueError("UNTIL anterior ao início da série")
+    return {"rrule": str(rule), "exdates": format_exdates(exdates), "series_end": end}
+
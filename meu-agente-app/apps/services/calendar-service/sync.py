@@ -0,0 +1,101 @@
+# apps/services/calendar-service/sync.py
+"""Sincronização incremental da agenda: versões por usuário, feed de mudanças e ETags
+
+Cada transação que altera eventos de um usuário incrementa `calendar_sync_state.version`
+uma única vez (UPDATE ... RETURNING, que segura a linha até o commit) e grava essa
+versão nos eventos tocados. Como escritores do mesmo usuário ficam em fila nessa
+linha, as versões ficam visíveis na ordem em que foram atribuídas e o feed nunca
+pula uma mudança. Remoções marcam `deleted_at` (tombstone), apagado de verdade
+por `prune_tombstones` depois de CALENDAR_TOMBSTONE_TTL_DAYS.
+
+O token do feed é (versão, id) do último item entregue, em base64. As ETags das
+listas são derivadas da versão do usuário e da consulta, então um If-None-Match
+atual é respondido (304) sem consultar os eventos.
+"""
+import base64
+import binascii
+import hashlib
+from datetime import datetime
+from typing import Dict, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import CalendarSyncState, EventModel
+
+
+def bump_version(db: Session, user_id: str) -> int:
+    """Próxima versão do usuário, dentro da transação corrente"""
+    stmt = (update(CalendarSyncState).where(CalendarSyncState.user_id == user_id)
+            .values(version=CalendarSyncState.version + 1).returning(CalendarSyncState.version))
+    version = db.scalar(stmt)
+    if version is not None:
+        return version
+    try:
+        # Primeira mudança do usuário; se outra transação criar a linha antes, cai no UPDATE
+        with db.begin_nested():
+            db.execute(insert(CalendarSyncState).values(user_id=user_id, version=1, pruned_version=0))
+        return 1
+    except IntegrityError:
+        return db.scalar(stmt)
+
+
+class VersionCache(dict):
+    """Versões já atribuídas na transação (um lote pode tocar vários usuários)"""
+
+    def __init__(self, db: Session):
+        super().__init__()
+        self.db = db
+
+    def __missing__(self, user_id: str) -> int:
+        self[user_id] = bump_version(self.db, user_id)
+        return self[user_id]
+
+
+def sync_state(db: Session, user_id: str) -> Tuple[int, int]:
+    """(versão atual, versão até onde os tombstones foram apagados)"""
+    row = db.execute(select(CalendarSyncState.version, CalendarSyncState.pruned_version)
+                     .where(CalendarSyncState.user_id == user_id)).first()
+    return (row.version, row.pruned_version) if row else (0, 0)
+
+
+# Id sentinela: o token (versão, LAST_ID) cobre todas as mudanças até aquela versão
+LAST_ID = 2 ** 63 - 1
+
+
+def encode_token(version: int, event_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{version}|{event_id}".encode()).decode()
+
+
+def decode_token(token: str) -> Tuple[int, int]:
+    try:
+        version, event_id = base64.urlsafe_b64decode(token.encode()).decode().split("|")
+        return int(version), int(event_id)
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Token de sincronização inválido")
+
+
+def list_etag(version: int, path: str, params: Dict[str, str]) -> str:
+    """ETag de uma listagem: muda quando a agenda do usuário muda ou a consulta é outra"""
+    query = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+    digest = hashlib.sha1(f"{path}?{query}".encode()).hexdigest()[:16]
+    return f'"v{version}-{digest}"'
+
+
+def prune_tombstones(db: Session, older_than: datetime) -> int:
+    """Apaga tombstones antigos e registra até que versão o feed deixou de ser completo"""
+    pruned = db.execute(
+        select(EventModel.user_id, func.max(EventModel.version))
+        .where(EventModel.deleted_at.is_not(None), EventModel.deleted_at < older_than)
+        .group_by(EventModel.user_id)
+    ).all()
+    for user_id, version in pruned:
+        db.execute(update(CalendarSyncState).where(CalendarSyncState.user_id == user_id)
+                   .values(pruned_version=case((CalendarSyncState.pruned_version < version, version),
+                                               else_=CalendarSyncState.pruned_version)))
+    result = db.execute(EventModel.__table__.delete().where(
+        EventModel.deleted_at.is_not(None), EventModel.deleted_at < older_than))
+    db.commit()
+    return result.rowcount or 0
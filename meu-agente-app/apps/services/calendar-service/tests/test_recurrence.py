@@ -0,0 +1,116 @@
+# apps/services/calendar-service/tests/test_recurrence.py
+"""Expansão de séries (recurrence.py) comparada com uma referência por força bruta"""
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from recurrence import (CACHE_MAX_DAYS, format_exdates, occurrences, parse_rule,
+                        recurrence_columns, series_end)
+
+
+def reference(rrule: str, start: date, exdates: frozenset, window_from: date, window_to: date):
+    """Testa dia a dia se cada data pertence à série (sem pular períodos)"""
+    rule = parse_rule(rrule)
+    week_start = start - timedelta(days=start.weekday())
+    found, day, generated = [], start, 0
+    while day <= window_to:
+        months = (day.year - start.year) * 12 + day.month - start.month
+        if rule.freq == "DAILY":
+            match = (day - start).days % rule.interval == 0 and (not rule.by_day or day.weekday() in rule.by_day)
+        elif rule.freq == "WEEKLY":
+            match = ((day - week_start).days // 7 % rule.interval == 0
+                     and day.weekday() in (rule.by_day or (start.weekday(),)))
+        elif rule.freq == "MONTHLY":
+            match = months % rule.interval == 0 and day.day == start.day
+        else:
+            match = months % (12 * rule.interval) == 0 and day.day == start.day
+        if match:
+            if rule.until is not None and day > rule.until:
+                break
+            generated += 1
+            if rule.count is not None and generated > rule.count:
+                break
+            if day >= window_from and day not in exdates:
+                found.append(day)
+        day += timedelta(days=1)
+    return found
+
+
+RULES = [
+    "FREQ=DAILY",
+    "FREQ=DAILY;INTERVAL=3",
+    "FREQ=DAILY;BYDAY=MO,WE,FR;COUNT=40",
+    "FREQ=WEEKLY",
+    "FREQ=WEEKLY;INTERVAL=2;BYDAY=TU,SU",
+    "FREQ=WEEKLY;BYDAY=MO,WE,FR;UNTIL=20270315",
+    "FREQ=MONTHLY",
+    "FREQ=MONTHLY;INTERVAL=2;COUNT=12",
+    "FREQ=YEARLY",
+    "FREQ=YEARLY;INTERVAL=4;UNTIL=20400101",
+]
+STARTS = [date(2024, 1, 31), date(2024, 2, 29), date(2025, 6, 15), date(2026, 12, 30)]
+
+
+@pytest.mark.parametrize("rrule", RULES)
+def test_matches_brute_force(rrule):
+    rng = random.Random(rrule)
+    for start in STARTS:
+        exdates = frozenset(start + timedelta(days=rng.randrange(400)) for _ in range(5))
+        exdates_text = format_exdates([d.isoformat() for d in exdates])
+        for _ in range(15):
+            window_from = start + timedelta(days=rng.randrange(-30, 900))
+            # Janelas curtas (cache) e longas (geradas sob demanda)
+            span = rng.choice([0, 6, 30, CACHE_MAX_DAYS, CACHE_MAX_DAYS + 1, 1500])
+            window_to = window_from + timedelta(days=span)
+            expected = reference(rrule, start, exdates, window_from, window_to)
+            assert list(occurrences(rrule, start, exdates_text, window_from, window_to)) == expected
+
+
+@pytest.mark.parametrize("span", [60, CACHE_MAX_DAYS + 100])
+def test_after_resumes_inside_window(span):
+    start = date(2025, 1, 6)
+    window_to = start + timedelta(days=span)
+    days = list(occurrences("FREQ=WEEKLY;BYDAY=MO,TH", start, None, start, window_to))
+    middle = days[len(days) // 2]
+    assert list(occurrences("FREQ=WEEKLY;BYDAY=MO,TH", start, None, start, window_to, after=middle)) == \
+        [day for day in days if day >= middle]
+
+
+def test_series_end():
+    assert series_end(parse_rule("FREQ=DAILY"), date(2025, 1, 1)) is None
+    assert series_end(parse_rule("FREQ=DAILY;UNTIL=20250110"), date(2025, 1, 1)) == date(2025, 1, 10)
+    # 31 só existe em alguns meses: a 3ª ocorrência é 31/05
+    assert series_end(parse_rule("FREQ=MONTHLY;COUNT=3"), date(2025, 1, 31)) == date(2025, 5, 31)
+
+
+def test_canonical_form():
+    rule = parse_rule("rrule:freq=weekly;byday=fr,mo;interval=1;until=2025-03-01")
+    assert str(rule) == "FREQ=WEEKLY;BYDAY=MO,FR;UNTIL=20250301"
+    assert parse_rule(str(rule)) == rule
+
+
+@pytest.mark.parametrize("rrule", [
+    "FREQ=HOURLY",
+    "FREQ=DAILY;INTERVAL=0",
+    "FREQ=DAILY;COUNT=abc",
+    "FREQ=MONTHLY;BYDAY=MO",
+    "FREQ=WEEKLY;BYDAY=XX",
+    "FREQ=DAILY;COUNT=2;UNTIL=20250101",
+    "FREQ=DAILY;BYMONTH=1",
+    "FREQ=DAILY;UNTIL=2025",
+])
+def test_invalid_rules(rrule):
+    with pytest.raises(ValueError):
+        parse_rule(rrule)
+
+
+def test_recurrence_columns():
+    assert recurrence_columns(None, date(2025, 1, 1), None) == {"rrule": None, "exdates": None, "series_end": None}
+    assert recurrence_columns("FREQ=DAILY;COUNT=3", date(2025, 1, 1), ["2025-01-02", "2025-01-02"]) == {
+        "rrule": "FREQ=DAILY;COUNT=3", "exdates": "2025-01-02", "series_end": date(2025, 1, 3),
+    }
+    with pytest.raises(ValueError):
+        recurrence_columns(None, date(2025, 1, 1), ["2025-01-02"])
+    with pytest.raises(ValueError):
+        recurrence_columns("FREQ=DAILY;UNTIL=20241231", date(2025, 1, 1), None)
@@ -0,0 +1,218 @@
+# apps/services/orchestrator-agent/cache.py
+"""Cache do orquestrador: Redis quando disponível, LRU em memória como fallback
+
+Guarda a configuração dos agentes, o snapshot da agenda e (opcionalmente) as
+respostas do LLM, cada tipo com seu TTL. Invalidações chegam por Redis pub/sub,
+publicadas pelos serviços donos dos dados. Cargas simultâneas da mesma chave
+(cache miss) compartilham uma única chamada ao serviço de origem.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis é opcional: sem ele usamos apenas o LRU local
+    aioredis = None
+
+from shared.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "orchestrator:cache:"
+
+# Canal de pub/sub -> prefixo das chaves que devem ser descartadas
+INVALIDATION_CHANNELS = {
+    "calendar:changes": "calendar:",
+    "agents:changes": "agent:",
+}
+
+# Após uma falha, espera este tempo antes de tentar o Redis novamente
+REDIS_RETRY_INTERVAL = 30.0
+
+
+class LRUCache:
+    """Cache LRU em memória com expiração por item"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: float):
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix: str):
+        for key in [k for k in self._data if k.startswith(prefix)]:
+            del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+def normalize_message(message: str) -> str:
+    """Normaliza a mensagem para que variações triviais compartilhem a mesma chave"""
+    text = unicodedata.normalize("NFKC", message).strip().lower()
+    return re.sub(r"\s+", " ", text)
+
+
+def llm_cache_key(message: str, system_prompt: str, model: str) -> str:
+    digest = hashlib.sha256(
+        "\x1f".join([model, system_prompt, normalize_message(message)]).encode("utf-8")
+    ).hexdigest()
+    return f"llm:{digest}"
+
+
+class OrchestratorCache:
+    """Cache em duas camadas com contadores de acertos/erros por tipo de chave"""
+
+    def __init__(self, redis_url: Optional[str] = None, max_entries: int = 1024):
+        self.redis_url = redis_url
+        self.local = LRUCache(max_entries)
+        self._redis = None
+        self._pubsub_redis = None
+        self._redis_retry_at = 0.0
+        self._listener: Optional[asyncio.Task] = None
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.invalidations = 0
+        self._invalidation_listeners: List[Tuple[str, Callable[[], Any]]] = []
+        self.flight = SingleFlight("orchestrator-cache")
+
+    def on_invalidate(self, prefix: str, callback: Callable[[], Any]):
+        """Registra um callback chamado quando chaves com o prefixo são invalidadas"""
+        self._invalidation_listeners.append((prefix, callback))
+
+    async def start(self):
+        if not (self.redis_url and aioredis):
+            return
+        self._redis = aioredis.from_url(self.redis_url, decode_responses=True,
+                                        socket_timeout=0.5, socket_connect_timeout=0.5)
+        # Conexão separada e sem timeout de leitura: a assinatura fica bloqueada esperando mensagens
+        self._pubsub_redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        self._listener = asyncio.create_task(self._listen_invalidations())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        for client in (self._redis, self._pubsub_redis):
+            if client is not None:
+                await client.aclose()
+
+    @property
+    def redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception):
+        logger.warning("Erro no Redis do cache: %s", error)
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+
+    @staticmethod
+    def _kind(key: str) -> str:
+        return key.split(":", 1)[0]
+
+    async def get(self, key: str) -> Optional[Any]:
+        kind = self._kind(key)
+        raw = self.local.get(key)
+        if raw is None and self.redis_available:
+            try:
+                raw = await self._redis.get(KEY_PREFIX + key)
+            except Exception as e:
+                self._redis_failed(e)
+        if raw is None:
+            self.misses[kind] = self.misses.get(kind, 0) + 1
+            return None
+        self.hits[kind] = self.hits.get(kind, 0) + 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        raw = json.dumps(value, ensure_ascii=False)
+        self.local.set(key, raw, ttl)
+        if self.redis_available:
+            try:
+                await self._redis.set(KEY_PREFIX + key, raw, ex=max(1, int(ttl)))
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def get_or_load(self, key: str, ttl: float, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Retorna o valor em cache ou chama `loader`, guardando o resultado se não for None"""
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        async def load():
+            loaded = await loader()
+            if loaded is not None:
+                await self.set(key, loaded, ttl)
+            return loaded
+        return await self.flight.do(key, load)
+
+    async def invalidate_prefix(self, prefix: str):
+        self.invalidations += 1
+        self.local.delete_prefix(prefix)
+        # Cargas em andamento trariam o valor antigo; próximos pedidos buscam de novo
+        self.flight.forget(prefix)
+        if self.redis_available:
+            try:
+                keys = [k async for k in self._redis.scan_iter(match=f"{KEY_PREFIX}{prefix}*", count=500)]
+                if keys:
+                    await self._redis.delete(*keys)
+            except Exception as e:
+                self._redis_failed(e)
+        for listener_prefix, callback in self._invalidation_listeners:
+            if listener_prefix.startswith(prefix) or prefix.startswith(listener_prefix):
+                callback()
+
+    async def _listen_invalidations(self):
+        """Escuta os canais de invalidação, reconectando se o Redis cair"""
+        while True:
+            try:
+                async with self._pubsub_redis.pubsub() as pubsub:
+                    await pubsub.subscribe(*INVALIDATION_CHANNELS)
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        prefix = INVALIDATION_CHANNELS.get(message["channel"])
+                        if prefix:
+                            await self.invalidate_prefix(prefix)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._redis_failed(e)
+                await asyncio.sleep(REDIS_RETRY_INTERVAL)
+
+    def stats(self) -> Dict[str, Any]:
+        kinds = sorted(set(self.hits) | set(self.misses))
+        return {
+            "backend": "redis" if self.redis_available else "memory",
+            "local_entries": len(self.local),
+            "invalidations": self.invalidations,
+            "singleflight": self.flight.stats(),
+            "kinds": {
+                kind: {"hits": self.hits.get(kind, 0), "misses": self.misses.get(kind, 0)}
+                for kind in kinds
+            },
+        }
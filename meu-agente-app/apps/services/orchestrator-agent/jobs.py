@@ -0,0 +1,301 @@
+# apps/services/orchestrator-agent/jobs.py
+"""Fila de jobs de chat: o cliente enfileira a mensagem e busca o resultado depois
+
+Com REDIS_URL a fila é a lista `chat:jobs` no Redis e cada job fica no hash
+`chat:job:<id>` (status, mensagem, resultado, tempos) com TTL, então qualquer
+réplica do orquestrador pode enfileirar, processar ou responder o status. O
+worker move o id da fila para a sua lista de processamento
+(`chat:jobs:processing:<instância>:<worker>`, BLMOVE) e só o remove dali depois
+de gravar o resultado: se a instância cair no meio, os jobs voltam para a fila
+quando ela reiniciar (JOB_WORKER_ID fixa a identidade da instância). Sem Redis,
+fila e jobs ficam em memória nesta instância.
+
+Um pool de JOB_WORKERS tarefas consome a fila; cada uma processa um job por
+vez. Erros ao processar um job (inclusive do Redis) marcam o job como `failed`
+e o worker segue com o próximo. Tamanho da fila, tempo de espera/execução e
+ocupação dos workers vão para /metrics e /stats.
+"""
+import asyncio
+import json
+import logging
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from shared.instrumentation import metrics, span, tracer
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Sem Redis a fila fica restrita a esta instância
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "chat:jobs"
+PROCESSING_KEY_PREFIX = "chat:jobs:processing:"
+JOB_KEY_PREFIX = "chat:job:"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Intervalo das consultas ao Redis enquanto alguém espera um job de outra réplica
+WAIT_POLL_INTERVAL = 0.25
+
+job_wait = metrics.histogram("chat_job_wait_seconds", "Tempo dos jobs na fila até um worker pegar", ["service"])
+job_run = metrics.histogram("chat_job_run_seconds", "Tempo de processamento dos jobs", ["service", "status"])
+job_queue_depth = metrics.gauge("chat_job_queue_depth", "Jobs aguardando na fila", ["service"])
+job_workers_busy = metrics.gauge("chat_job_workers_busy", "Workers processando um job", ["service"])
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, redis_url: Optional[str], handler: Handler, workers: int = 4,
+                 max_depth: int = 1000, ttl: float = 3600.0, worker_id: Optional[str] = None):
+        self.redis_url = redis_url
+        self.worker_id = worker_id or socket.gethostname()
+        self.handler = handler
+        self.workers = workers
+        self.max_depth = max_depth
+        self.ttl = ttl
+        self._redis = None
+        self._blocking_redis = None
+        self._local_queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._local_jobs: Dict[str, Dict[str, Any]] = {}
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.depth = 0
+        self.busy = 0
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.requeued = 0
+        self.wait_time_total = 0.0
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "memory"
+
+    async def start(self):
+        if self.redis_url and aioredis:
+            client = aioredis.from_url(self.redis_url, decode_responses=True,
+                                       socket_timeout=0.5, socket_connect_timeout=0.5)
+            try:
+                await client.ping()
+                self._redis = client
+                # BLMOVE bloqueia a conexão: cliente separado, sem timeout de leitura
+                self._blocking_redis = aioredis.from_url(self.redis_url, decode_responses=True)
+                await self._requeue_orphans()
+            except Exception as e:
+                logger.warning("Redis indisponível para a fila de jobs, usando memória: %s", e)
+                await client.aclose()
+        job_queue_depth.set_function(lambda: self.depth, service=tracer.service_name)
+        job_workers_busy.set_function(lambda: self.busy, service=tracer.service_name)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        if self._redis is not None:
+            self._tasks.append(asyncio.create_task(self._watch_depth()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for client in (self._redis, self._blocking_redis):
+            if client is not None:
+                await client.aclose()
+
+    # --- Armazenamento dos jobs ---------------------------------------------
+
+    async def _save(self, job_id: str, fields: Dict[str, Any]):
+        if self._redis is None:
+            self._local_jobs.setdefault(job_id, {}).update(fields)
+            return
+        key = JOB_KEY_PREFIX + job_id
+        encoded = {k: json.dumps(v, ensure_ascii=False) for k, v in fields.items()}
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=encoded)
+            pipe.expire(key, int(self.ttl))
+            await pipe.execute()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if self._redis is None:
+            job = self._local_jobs.get(job_id)
+            return dict(job) if job is not None else None
+        raw = await self._redis.hgetall(JOB_KEY_PREFIX + job_id)
+        return {k: json.loads(v) for k, v in raw.items()} if raw else None
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Status do job, esperando até `timeout` segundos que ele termine (long polling)"""
+        deadline = time.monotonic() + timeout
+        job = await self.get(job_id)
+        while job is not None and job["status"] in (QUEUED, RUNNING) and time.monotonic() < deadline:
+            event = self._finished.get(job_id)
+            remaining = deadline - time.monotonic()
+            if event is not None:
+                # Fila em memória: acorda assim que o worker terminar
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Com Redis o job pode estar em outra réplica: consulta o hash periodicamente
+                await asyncio.sleep(min(WAIT_POLL_INTERVAL, max(0.0, remaining)))
+            job = await self.get(job_id)
+        return job
+
+    # --- Fila -----------------------------------------------------------------
+
+    async def enqueue(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self.depth >= self.max_depth:
+            self.rejected += 1
+            raise QueueFullError(f"Fila de jobs cheia ({self.depth} aguardando)")
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "status": QUEUED, "request": payload, "created_at": time.time()}
+        await self._save(job_id, job)
+        if self._redis is None:
+            self._finished[job_id] = asyncio.Event()
+            self._local_queue.put_nowait(job_id)
+            self.depth = self._local_queue.qsize()
+        else:
+            self.depth = await self._redis.lpush(QUEUE_KEY, job_id)
+        self.enqueued += 1
+        job["position"] = self.depth
+        return job
+
+    def _processing_key(self, index: int) -> str:
+        return f"{PROCESSING_KEY_PREFIX}{self.worker_id}:{index}"
+
+    async def _requeue_orphans(self):
+        """Devolve à frente da fila os jobs que esta instância pegou e não terminou antes de parar"""
+        async for key in self._redis.scan_iter(match=f"{PROCESSING_KEY_PREFIX}{self.worker_id}:*"):
+            while await self._redis.lmove(key, QUEUE_KEY, "RIGHT", "RIGHT") is not None:
+                self.requeued += 1
+        if self.requeued:
+            logger.warning("%d jobs interrompidos voltaram para a fila", self.requeued)
+
+    async def _next(self, index: int) -> str:
+        if self._redis is None:
+            job_id = await self._local_queue.get()
+            self.depth = self._local_queue.qsize()
+            return job_id
+        while True:
+            job_id = await self._blocking_redis.blmove(QUEUE_KEY, self._processing_key(index), timeout=1,
+                                                       src="RIGHT", dest="LEFT")
+            if job_id is not None:
+                self.depth = max(0, self.depth - 1)
+                return job_id
+
+    async def _ack(self, index: int, job_id: str):
+        """Tira o job da lista de processamento (resultado já gravado)"""
+        if self._redis is None:
+            return
+        try:
+            await self._redis.lrem(self._processing_key(index), 1, job_id)
+        except Exception as e:
+            # Fica na lista: volta para a fila (e é reprocessado) quando a instância reiniciar
+            logger.warning("Erro ao confirmar o job %s: %s", job_id, e)
+
+    async def _watch_depth(self):
+        """Com Redis outras réplicas também mexem na fila: atualiza o tamanho periodicamente"""
+        while True:
+            try:
+                self.depth = await self._redis.llen(QUEUE_KEY)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Erro ao consultar a fila de jobs: %s", e)
+            await asyncio.sleep(5)
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                job_id = await self._next(index)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Erro ao ler a fila de jobs: %s", e)
+                await asyncio.sleep(1)
+                continue
+            self.busy += 1
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                # Desligando: o job fica na lista de processamento e volta para a fila no próximo start
+                raise
+            except Exception as e:
+                logger.error("Erro ao processar o job %s: %s", job_id, e)
+                await self._fail(job_id, e)
+            finally:
+                self.busy -= 1
+            await self._ack(index, job_id)
+
+    async def _fail(self, job_id: str, error: Exception):
+        """Marca o job como falho quando o erro veio de fora do handler (ex.: Redis)"""
+        self.failed += 1
+        try:
+            await self._save(job_id, {"status": FAILED, "error": str(error) or type(error).__name__,
+                                      "finished_at": time.time()})
+        except Exception as e:
+            logger.error("Não foi possível marcar o job %s como falho: %s", job_id, e)
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def _run(self, job_id: str):
+        job = await self.get(job_id)
+        if job is None:  # Expirou antes de ser processado
+            return
+        started = time.time()
+        waited = max(0.0, started - job["created_at"])
+        self.wait_time_total += waited
+        job_wait.observe(waited, service=tracer.service_name)
+        await self._save(job_id, {"status": RUNNING, "started_at": started})
+
+        status, fields = DONE, {}
+        try:
+            with span("job.run", job_id=job_id, queue_wait_ms=round(waited * 1000, 3)):
+                fields["result"] = await self.handler(job["request"])
+            self.completed += 1
+        except Exception as e:
+            status = FAILED
+            fields["error"] = str(e) or type(e).__name__
+            self.failed += 1
+            logger.error("Job %s falhou: %s", job_id, e)
+        finished = time.time()
+        job_run.observe(finished - started, service=tracer.service_name, status=status)
+        await self._save(job_id, {**fields, "status": status, "finished_at": finished})
+
+        event = self._finished.pop(job_id, None)
+        if event is not None:
+            event.set()
+        if self._redis is None:
+            self._expire_local(finished)
+
+    def _expire_local(self, now: float):
+        expired = [job_id for job_id, job in self._local_jobs.items()
+                   if job.get("finished_at") and now - job["finished_at"] > self.ttl]
+        for job_id in expired:
+            del self._local_jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        started = self.completed + self.failed
+        return {
+            "backend": self.backend,
+            "workers": self.workers,
+            "busy": self.busy,
+            "utilization": round(self.busy / self.workers, 3) if self.workers else 0.0,
+            "depth": self.depth,
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "requeued": self.requeued,
+            "wait_time_avg_ms": round(1000 * self.wait_time_total / started, 3) if started else 0.0,
+        }
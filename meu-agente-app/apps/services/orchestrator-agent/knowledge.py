@@ -0,0 +1,568 @@
+# apps/services/orchestrator-agent/knowledge.py
+"""Base de conhecimento local por agente (busca vetorial para o prompt)
+
+Documentos enviados para um agente são divididos em trechos, convertidos em
+vetores e guardados em KNOWLEDGE_DIR/agent_<id>/:
+
+- vectors.f32   matriz float32 (trechos x dimensão), lida via np.memmap;
+- rows.u64      por trecho: início e tamanho do texto em chunks.jsonl e o documento;
+- chunks.jsonl  texto dos trechos (lido só para os resultados);
+- meta.json     total de trechos válidos e lista de documentos;
+- ivf.npz       índice aproximado (IVF), criado quando a coleção passa de
+                `ann_threshold` trechos e reconstruído quando cresce 20%;
+                a construção roda em segundo plano, fora da busca.
+
+A busca percorre a matriz em blocos (várias consultas de uma vez, top-k por
+argpartition), sem carregar o arquivo todo; com o IVF só as listas dos
+centróides mais próximos (+ trechos novos ainda fora do índice) são pontuadas.
+A ingestão é incremental: o corpo chega em pedaços, é decodificado e dividido
+em trechos conforme chega, e os vetores são gravados em lotes. Cada busca lê
+um retrato consistente do índice (total, matrizes, IVF e documentos ativos)
+tirado sob um lock, então pode rodar em paralelo com a ingestão.
+
+Os vetores vêm de um embedder por hashing (palavras + trigramas de caracteres,
+sem modelo externo); qualquer objeto com `dimensions` e `embed(textos)` serve.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Sem NumPy a base de conhecimento fica desabilitada
+    np = None
+
+from router import tokenize
+
+logger = logging.getLogger(__name__)
+
+SEARCH_BLOCK_ROWS = 65536
+IVF_REBUILD_GROWTH = 1.2
+
+
+class HashingEmbedder:
+    """Palavras e trigramas de caracteres projetados por hashing com sinal, normalizados (L2)"""
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> Dict[int, float]:
+        counts: Dict[int, float] = {}
+        for token in tokenize(text):
+            features = [f"w:{token}"]
+            padded = f" {token} "
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+            for feature in features:
+                hashed = zlib.crc32(feature.encode())
+                index = hashed % self.dimensions
+                sign = 1.0 if (hashed >> 31) & 1 else -1.0
+                counts[index] = counts.get(index, 0.0) + sign
+        return counts
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for index, value in self._features(text).items():
+                # log(1 + tf) amortece termos muito repetidos
+                matrix[row, index] = math.copysign(math.log1p(abs(value)), value)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class Chunker:
+    """Divide texto que chega em pedaços em trechos de ~`size` caracteres com sobreposição"""
+
+    _BOUNDARY = re.compile(r"\n\s*\n|(?<=[.!?])\s+|\s+")
+
+    def __init__(self, size: int = 1200, overlap: int = 200):
+        self.size = size
+        self.overlap = min(overlap, size // 3)
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        chunks: List[str] = []
+        while len(self._buffer) >= self.size:
+            cut = self._cut_point(self._buffer[:self.size])
+            chunks.append(self._buffer[:cut].strip())
+            # Recomeça um pouco antes do corte, alinhado a um espaço
+            start = max(cut - self.overlap, 1)
+            space = self._buffer.find(" ", start, cut)
+            self._buffer = self._buffer[space + 1 if space != -1 else start:]
+        return [chunk for chunk in chunks if chunk]
+
+    def flush(self) -> List[str]:
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+    def _cut_point(self, window: str) -> int:
+        """Último parágrafo, frase ou espaço na parte final da janela (senão corta no tamanho)"""
+        minimum = int(self.size * 0.6)
+        best = 0
+        for pattern in (r"\n\s*\n", r"(?<=[.!?])\s+", r"\s+"):
+            for match in re.finditer(pattern, window):
+                if match.end() >= minimum:
+                    best = match.end()
+            if best:
+                return best
+        return len(window)
+
+
+@dataclass
+class KnowledgeHit:
+    text: str
+    score: float
+    document: str
+
+
+@dataclass
+class IndexView:
+    """Retrato do índice usado por uma busca do começo ao fim"""
+    count: int
+    vectors: Optional["np.ndarray"]
+    rows: Optional["np.ndarray"]
+    ivf: Optional[Dict[str, "np.ndarray"]]
+    inactive: Set[int]
+    names: Dict[int, str]
+
+
+class AgentIndex:
+    """Arquivos de um agente; só o processo do orquestrador escreve (um ingest por vez)
+
+    `_lock` protege meta.json, as matrizes e o IVF: escritas e o retrato da
+    busca passam por ele. A construção do IVF roda sem segurá-lo (uma por vez,
+    via `_building`) e só troca o índice pronto no final.
+    """
+
+    def __init__(self, path: Path, dimensions: int, ann_threshold: int, nprobe: int):
+        self.path = path
+        self.dimensions = dimensions
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        path.mkdir(parents=True, exist_ok=True)
+        self.meta: Dict[str, Any] = {"dimensions": dimensions, "count": 0, "documents": []}
+        meta_file = path / "meta.json"
+        if meta_file.exists():
+            self.meta = json.loads(meta_file.read_text())
+        if self.meta["dimensions"] != dimensions:
+            raise ValueError(f"Índice em {path} tem dimensão {self.meta['dimensions']}, esperado {dimensions}")
+        self._truncate_to_count()
+        self._lock = threading.Lock()
+        self._building = threading.Lock()
+        self._vectors: Optional["np.ndarray"] = None
+        self._rows: Optional["np.ndarray"] = None
+        self._ivf: Optional[Dict[str, "np.ndarray"]] = None
+        self._load_ivf()
+
+    @property
+    def count(self) -> int:
+        return self.meta["count"]
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _truncate_to_count(self):
+        """Descarta o que uma ingestão interrompida gravou além do último meta.json"""
+        count = self.count
+        text_end = 0
+        rows_file = self._file("rows.u64")
+        if count and rows_file.exists():
+            last = np.fromfile(rows_file, dtype=np.uint64, count=3, offset=(count - 1) * 24)
+            text_end = int(last[0] + last[1])
+        for name, size in (("vectors.f32", count * self.dimensions * 4),
+                           ("rows.u64", count * 24), ("chunks.jsonl", text_end)):
+            file = self._file(name)
+            if file.exists() and file.stat().st_size != size:
+                with open(file, "r+b") as handle:
+                    handle.truncate(size)
+
+    def _save_meta(self):
+        tmp = self._file("meta.json.tmp")
+        tmp.write_text(json.dumps(self.meta, ensure_ascii=False))
+        os.replace(tmp, self._file("meta.json"))
+
+    # --- Escrita --------------------------------------------------------------
+
+    def add_document(self, name: str) -> Dict[str, Any]:
+        with self._lock:
+            document = {"id": len(self.meta["documents"]), "name": name, "chunks": 0,
+                        "status": "ingesting", "created_at": time.time()}
+            self.meta["documents"].append(document)
+            self._save_meta()
+        return document
+
+    def append(self, document: Dict[str, Any], texts: List[str], vectors: "np.ndarray"):
+        chunks_file = self._file("chunks.jsonl")
+        offset = chunks_file.stat().st_size if chunks_file.exists() else 0
+        rows = np.zeros((len(texts), 3), dtype=np.uint64)
+        encoded = []
+        for i, text in enumerate(texts):
+            line = (json.dumps(text, ensure_ascii=False) + "\n").encode()
+            rows[i] = (offset, len(line), document["id"])
+            offset += len(line)
+            encoded.append(line)
+        with open(self._file("vectors.f32"), "ab") as handle:
+            handle.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._file("rows.u64"), "ab") as handle:
+            handle.write(rows.tobytes())
+        with open(chunks_file, "ab") as handle:
+            handle.write(b"".join(encoded))
+        # meta.json por último: só então os trechos passam a valer
+        with self._lock:
+            self.meta["count"] += len(texts)
+            document["chunks"] += len(texts)
+            self._save_meta()
+            self._vectors = self._rows = None
+
+    def finish_document(self, document: Dict[str, Any], status: str):
+        with self._lock:
+            document["status"] = status
+            self._save_meta()
+
+    def documents(self) -> List[Dict[str, Any]]:
+        """Cópia dos documentos não removidos"""
+        with self._lock:
+            return [dict(d) for d in self.meta["documents"] if d["status"] != "deleted"]
+
+    def delete_document(self, document_id: int) -> bool:
+        with self._lock:
+            for document in self.meta["documents"]:
+                if document["id"] == document_id and document["status"] != "deleted":
+                    document["status"] = "deleted"
+                    self._save_meta()
+                    return True
+        return False
+
+    # --- Leitura --------------------------------------------------------------
+
+    def view(self) -> IndexView:
+        """Total, matrizes, IVF e documentos de um mesmo instante"""
+        with self._lock:
+            count = self.count
+            if self._vectors is None and count:
+                self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r",
+                                          shape=(count, self.dimensions))
+                self._rows = np.memmap(self._file("rows.u64"), dtype=np.uint64, mode="r",
+                                       shape=(count, 3))
+            documents = self.meta["documents"]
+            return IndexView(
+                count=count, vectors=self._vectors, rows=self._rows, ivf=self._ivf,
+                inactive={d["id"] for d in documents if d["status"] != "ready"},
+                names={d["id"]: d["name"] for d in documents},
+            )
+
+    def search(self, view: IndexView, queries: "np.ndarray", k: int) -> List[List[Tuple[float, int]]]:
+        """Top-k (score, linha) para cada consulta (linhas de `queries`)"""
+        if view.count == 0:
+            return [[] for _ in range(len(queries))]
+        if view.ivf is not None:
+            return [self._search_ivf(view, query, k) for query in queries]
+        return self._search_rows(view, queries, k, np.arange(view.count))
+
+    @staticmethod
+    def _score_block(view: IndexView, queries: "np.ndarray", ids: "np.ndarray") -> "np.ndarray":
+        vectors, rows, inactive = view.vectors, view.rows, view.inactive
+        contiguous = len(ids) and ids[-1] - ids[0] + 1 == len(ids)
+        block = vectors[ids[0]:ids[-1] + 1] if contiguous else vectors[ids]
+        scores = queries @ np.asarray(block).T
+        if inactive:
+            documents = np.asarray(rows[ids[0]:ids[-1] + 1, 2] if contiguous else rows[ids, 2])
+            scores[:, np.isin(documents, list(inactive))] = -np.inf
+        return scores
+
+    def _search_rows(self, view: IndexView, queries: "np.ndarray", k: int,
+                     ids: "np.ndarray") -> List[List[Tuple[float, int]]]:
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(ids), SEARCH_BLOCK_ROWS):
+            block_ids = ids[start:start + SEARCH_BLOCK_ROWS]
+            scores = np.concatenate([best_scores, self._score_block(view, queries, block_ids)], axis=1)
+            candidates = np.concatenate([best_ids, np.broadcast_to(block_ids, (len(queries), len(block_ids)))], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                candidates = np.take_along_axis(candidates, top, axis=1)
+            best_scores, best_ids = scores, candidates
+        results = []
+        for scores, row_ids in zip(best_scores, best_ids):
+            order = np.argsort(-scores)
+            results.append([(float(scores[i]), int(row_ids[i])) for i in order if np.isfinite(scores[i])])
+        return results
+
+    # --- Índice aproximado (IVF) ---------------------------------------------
+
+    def _load_ivf(self):
+        file = self._file("ivf.npz")
+        if file.exists():
+            with np.load(file) as data:
+                self._ivf = {name: data[name] for name in data.files}
+            if int(self._ivf["built_count"]) > self.count:
+                self._ivf = None
+
+    def _ivf_stale(self, view: IndexView) -> bool:
+        if view.count < self.ann_threshold:
+            return view.ivf is not None
+        return view.ivf is None or view.count >= int(view.ivf["built_count"]) * IVF_REBUILD_GROWTH
+
+    def ivf_stale(self) -> bool:
+        with self._lock:
+            count, ivf = self.count, self._ivf
+        return self._ivf_stale(IndexView(count, None, None, ivf, set(), {}))
+
+    def build_ivf(self) -> bool:
+        """(Re)constrói o IVF se a coleção pedir; uma construção por vez, fora do lock da busca"""
+        if not self._building.acquire(blocking=False):
+            return False
+        try:
+            view = self.view()
+            if not self._ivf_stale(view):
+                return False
+            if view.count < self.ann_threshold:
+                with self._lock:
+                    self._ivf = None
+                return True
+            started = time.perf_counter()
+            ivf = self._build_ivf(view)
+            # Grava num temporário e troca: quem carregar o arquivo nunca vê metade dele
+            tmp = self._file("ivf.npz.tmp")
+            with open(tmp, "wb") as handle:
+                np.savez(handle, **ivf)
+            os.replace(tmp, self._file("ivf.npz"))
+            with self._lock:
+                self._ivf = ivf
+            logger.info("Índice IVF reconstruído", extra={"index": str(self.path), "rows": view.count,
+                                                          "lists": len(ivf["centroids"]),
+                                                          "seconds": round(time.perf_counter() - started, 3)})
+            return True
+        finally:
+            self._building.release()
+
+    @staticmethod
+    def _build_ivf(view: IndexView, iterations: int = 8, sample_size: int = 20000) -> Dict[str, "np.ndarray"]:
+        """k-means esférico numa amostra; cada trecho vai para a lista do centróide mais próximo"""
+        vectors, count = view.vectors, view.count
+        lists = max(1, int(math.sqrt(count)))
+        rng = np.random.default_rng(0)
+        sample = np.asarray(vectors[np.sort(rng.choice(count, size=min(sample_size, count), replace=False))])
+        centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(lists):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        assignment = np.empty(count, dtype=np.int32)
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS])
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(lists + 1))
+        return {"centroids": centroids, "order": order.astype(np.int64), "bounds": bounds,
+                "built_count": np.array(count)}
+
+    def _search_ivf(self, view: IndexView, query: "np.ndarray", k: int) -> List[Tuple[float, int]]:
+        ivf = view.ivf
+        probes = np.argsort(-(ivf["centroids"] @ query))[:self.nprobe]
+        ids = [ivf["order"][ivf["bounds"][c]:ivf["bounds"][c + 1]] for c in probes]
+        built = int(ivf["built_count"])
+        if built < view.count:  # trechos novos ainda fora do índice
+            ids.append(np.arange(built, view.count))
+        candidates = np.sort(np.concatenate(ids))
+        if len(candidates) == 0:
+            return []
+        return self._search_rows(view, query[None, :], k, candidates)[0]
+
+    def read_chunks(self, view: IndexView, row_ids: Sequence[int]) -> List[Tuple[str, str]]:
+        """(texto, nome do documento) das linhas pedidas"""
+        rows, names = view.rows, view.names
+        results = []
+        with open(self._file("chunks.jsonl"), "rb") as handle:
+            for row_id in row_ids:
+                start, length, document = (int(v) for v in rows[row_id])
+                handle.seek(start)
+                results.append((json.loads(handle.read(length)), names.get(document, "")))
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        view = self.view()
+        return {
+            "chunks": view.count,
+            "documents": sum(1 for name in view.names if name not in view.inactive),
+            "ivf_lists": len(view.ivf["centroids"]) if view.ivf is not None else 0,
+        }
+
+
+class IngestWriter:
+    """Recebe o texto em pedaços; trechos prontos são vetorizados e gravados em lotes"""
+
+    def __init__(self, base: "KnowledgeBase", index: AgentIndex, document: Dict[str, Any]):
+        self.base = base
+        self.index = index
+        self.document = document
+        self.chunker = Chunker(base.chunk_size, base.chunk_overlap)
+        self._pending: List[str] = []
+
+    async def feed(self, text: str):
+        self._pending.extend(self.chunker.feed(text))
+        if len(self._pending) >= self.base.batch_size:
+            await self._write()
+
+    async def finish(self):
+        self._pending.extend(self.chunker.flush())
+        await self._write()
+
+    async def _write(self):
+        if not self._pending:
+            return
+        texts, self._pending = self._pending, []
+        vectors = await asyncio.to_thread(self.base.embedder.embed, texts)
+        await asyncio.to_thread(self.index.append, self.document, texts, vectors)
+
+
+class KnowledgeBase:
+    def __init__(self, directory: str, embedder: Optional[HashingEmbedder] = None,
+                 chunk_size: int = 1200, chunk_overlap: int = 200, batch_size: int = 64,
+                 ann_threshold: int = 50000, nprobe: int = 8):
+        self.directory = Path(directory)
+        self.enabled = np is not None
+        self.embedder = embedder or HashingEmbedder()
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self._indexes: Dict[int, AgentIndex] = {}
+        # Um único AgentIndex por diretório: dois objetos teriam `meta` divergentes
+        self._indexes_lock = threading.Lock()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._ivf_builds: Dict[int, "asyncio.Task"] = {}
+        self.searches = 0
+        self.search_time_total = 0.0
+        if not self.enabled:
+            logger.warning("NumPy não instalado: base de conhecimento desabilitada")
+
+    def _index(self, agent_id: int, create: bool = False) -> Optional[AgentIndex]:
+        """Índice do agente, aberto do disco no primeiro acesso (lê arquivos: chamar fora do event loop)"""
+        with self._indexes_lock:
+            index = self._indexes.get(agent_id)
+            if index is None:
+                path = self.directory / f"agent_{agent_id}"
+                if not (create or (path / "meta.json").exists()):
+                    return None
+                index = AgentIndex(path, self.embedder.dimensions, self.ann_threshold, self.nprobe)
+                self._indexes[agent_id] = index
+            return index
+
+    @asynccontextmanager
+    async def ingest(self, agent_id: int, name: str) -> AsyncIterator[IngestWriter]:
+        """Um documento por vez por agente; se a ingestão falhar, o documento fica como `failed`"""
+        lock = self._locks.setdefault(agent_id, asyncio.Lock())
+        async with lock:
+            index = await asyncio.to_thread(self._index, agent_id, True)
+            document = await asyncio.to_thread(index.add_document, name)
+            writer = IngestWriter(self, index, document)
+            try:
+                yield writer
+                await writer.finish()
+            except BaseException:
+                await asyncio.to_thread(index.finish_document, document, "failed")
+                raise
+            await asyncio.to_thread(index.finish_document, document, "ready")
+        self._schedule_ivf(agent_id, index)
+
+    def _schedule_ivf(self, agent_id: int, index: AgentIndex):
+        """Reconstrói o IVF em segundo plano; enquanto isso a busca usa o índice anterior (ou a exata)"""
+        if agent_id in self._ivf_builds or not index.ivf_stale():
+            return
+        task = asyncio.create_task(asyncio.to_thread(index.build_ivf))
+        self._ivf_builds[agent_id] = task
+
+        def done(task: "asyncio.Task"):
+            self._ivf_builds.pop(agent_id, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Falha ao construir o índice IVF", exc_info=task.exception(),
+                             extra={"agent_id": agent_id})
+
+        task.add_done_callback(done)
+
+    def _search(self, agent_id: int, queries: Sequence[str], k: int) -> List[List[KnowledgeHit]]:
+        index = self._index(agent_id)
+        view = index.view() if index is not None else None
+        if view is None or view.count == 0:
+            return [[] for _ in queries]
+        results = index.search(view, self.embedder.embed(queries), k)
+        hits = []
+        for result in results:
+            chunks = index.read_chunks(view, [row for _, row in result])
+            hits.append([KnowledgeHit(text, score, document)
+                         for (score, _), (text, document) in zip(result, chunks)])
+        return hits
+
+    async def search(self, agent_id: int, query: str, k: int = 4) -> List[KnowledgeHit]:
+        if not self.enabled:
+            return []
+        return (await self.search_many(agent_id, [query], k))[0]
+
+    async def search_many(self, agent_id: int, queries: Sequence[str], k: int = 4) -> List[List[KnowledgeHit]]:
+        """Várias consultas numa única passada pela matriz"""
+        if not self.enabled:
+            return [[] for _ in queries]
+        started = time.perf_counter()
+        try:
+            return await asyncio.to_thread(self._search, agent_id, list(queries), k)
+        finally:
+            self.searches += 1
+            self.search_time_total += time.perf_counter() - started
+            index = self._indexes.get(agent_id)
+            if index is not None:
+                # Índice carregado do disco já acima do limite, sem IVF atual
+                self._schedule_ivf(agent_id, index)
+
+    async def documents(self, agent_id: int) -> List[Dict[str, Any]]:
+        index = await asyncio.to_thread(self._index, agent_id) if self.enabled else None
+        if index is None:
+            return []
+        return index.documents()
+
+    async def delete(self, agent_id: int, document_id: int) -> bool:
+        index = await asyncio.to_thread(self._index, agent_id) if self.enabled else None
+        if index is None:
+            return False
+        async with self._locks.setdefault(agent_id, asyncio.Lock()):
+            return await asyncio.to_thread(index.delete_document, document_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "agents": {agent_id: index.stats() for agent_id, index in list(self._indexes.items())},
+            "searches": self.searches,
+            "search_time_avg_ms": round(1000 * self.search_time_total / self.searches, 3) if self.searches else 0.0,
+        }
+
+
+def render_hits(hits: List[KnowledgeHit], max_tokens: int) -> str:
+    """Trechos para o prompt, em ordem de relevância, até o orçamento de tokens (~4 chars/token)"""
+    budget = max_tokens * 4
+    parts: List[str] = []
+    for hit in hits:
+        entry = f"[{hit.document}] {hit.text}"
+        if parts and len(entry) > budget:
+            break
+        parts.append(entry[:budget])
+        budget -= len(entry)
+        if budget <= 0:
+            break
+    return "\n---\n".join(parts)
@@ -0,0 +1,349 @@
+# apps/services/orchestrator-agent/llm.py
+"""Cliente assíncrono de LLM compartilhado pelo orquestrador
+
+Um único cliente é criado no startup e reutilizado por todas as requisições.
+Ele limita a concorrência com um semáforo, aplica timeout por chamada e refaz
+chamadas com falhas transitórias usando backoff exponencial com jitter.
+O backend é plugável: `openai` (AsyncOpenAI) ou `fake` (local, para testes de carga).
+`complete_tools` faz uma rodada de function calling: o modelo responde com texto
+ou com as ferramentas que quer chamar.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from router import tokenize
+
+import httpx
+
+from shared.instrumentation import span, traced_transport
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+
+class LLMUnavailableError(Exception):
+    """O LLM não respondeu após todas as tentativas"""
+
+
+@dataclass
+class LLMReply:
+    """Resposta de uma rodada com ferramentas: texto ou chamadas [{"id", "name", "arguments"}]"""
+    content: str = ""
+    tool_calls: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class LLMBackend:
+    """Interface dos backends de LLM"""
+
+    name = "base"
+    model = DEFAULT_MODEL
+    supports_tools = False
+
+    async def complete(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> str:
+        raise NotImplementedError
+
+    async def complete_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                             max_tokens: int, temperature: float) -> LLMReply:
+        raise NotImplementedError
+
+    def stream(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    def is_retryable(self, error: Exception) -> bool:
+        return isinstance(error, (asyncio.TimeoutError, httpx.TransportError))
+
+    async def close(self):
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """Backend da OpenAI usando AsyncOpenAI com pool de conexões HTTP próprio"""
+
+    name = "openai"
+    supports_tools = True
+
+    def __init__(self, api_key: str, model: str = DEFAULT_MODEL, base_url: Optional[str] = None,
+                 max_connections: int = 100):
+        import openai
+        from openai import AsyncOpenAI
+
+        self.model = model
+        self._retryable = (
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+        )
+        self._http_client = httpx.AsyncClient(
+            transport=traced_transport(peer="llm", limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_connections)),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+        # As tentativas ficam a cargo do LLMClient para termos backoff com jitter e métricas
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                  http_client=self._http_client)
+
+    async def complete(self, messages, max_tokens, temperature) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        return response.choices[0].message.content or ""
+
+    async def complete_tools(self, messages, tools, max_tokens, temperature) -> LLMReply:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            tools=tools,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        message = response.choices[0].message
+        calls = []
+        for call in message.tool_calls or []:
+            try:
+                arguments = json.loads(call.function.arguments or "{}")
+            except ValueError:
+                arguments = {}
+            calls.append({"id": call.id, "name": call.function.name,
+                          "arguments": arguments if isinstance(arguments, dict) else {}})
+        return LLMReply(content=message.content or "", tool_calls=calls)
+
+    async def stream(self, messages, max_tokens, temperature) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def is_retryable(self, error: Exception) -> bool:
+        return isinstance(error, self._retryable) or super().is_retryable(error)
+
+    async def close(self):
+        await self.client.close()
+        await self._http_client.aclose()
+
+
+class FakeBackend(LLMBackend):
+    """Backend local e determinístico para testes de carga sem acesso à OpenAI
+
+    `latency` é o tempo até o primeiro token (segundos) e `tokens_per_second`
+    controla a velocidade de geração dos tokens seguintes.
+    """
+
+    name = "fake"
+    model = "fake"
+    supports_tools = True
+
+    def __init__(self, latency: float = 0.2, tokens_per_second: float = 50.0, tokens: int = 40):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens
+
+    def _tokens(self, messages: List[Dict[str, str]], max_tokens: int) -> List[str]:
+        question = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        words = f"Resposta simulada para: {question}".split()
+        filler = ["lorem", "ipsum", "dolor", "sit", "amet"]
+        count = min(self.tokens, max_tokens)
+        words = (words + [filler[i % len(filler)] for i in range(count)])[:count]
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    async def complete(self, messages, max_tokens, temperature) -> str:
+        tokens = self._tokens(messages, max_tokens)
+        delay = self.latency + (len(tokens) / self.tokens_per_second if self.tokens_per_second > 0 else 0)
+        await asyncio.sleep(delay)
+        return "".join(tokens)
+
+    async def complete_tools(self, messages, tools, max_tokens, temperature) -> LLMReply:
+        """Chama (sem argumentos) as ferramentas cujo nome aparece na pergunta; depois responde"""
+        await asyncio.sleep(self.latency)
+        if any(m.get("role") == "tool" for m in messages):
+            return LLMReply(content=await self.complete(messages, max_tokens, temperature))
+        question = set(tokenize(next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")))
+        calls = [{"id": f"call_{i}", "name": tool["function"]["name"], "arguments": {}}
+                 for i, tool in enumerate(tools)
+                 if question & set(tokenize(tool["function"]["name"].replace("_", " ")))]
+        if not calls:
+            return LLMReply(content=await self.complete(messages, max_tokens, temperature))
+        return LLMReply(tool_calls=calls)
+
+    async def stream(self, messages, max_tokens, temperature) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for token in self._tokens(messages, max_tokens):
+            yield token
+            if interval:
+                await asyncio.sleep(interval)
+
+
+class LLMClient:
+    """Fachada usada pelos handlers: concorrência limitada, timeout e retry com jitter"""
+
+    def __init__(self, backend: LLMBackend, max_concurrency: int = 16, timeout: float = 30.0,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.queue_wait_total = 0.0
+        self._last_wait = 0.0
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": espera aleatória entre 0 e o teto exponencial
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _acquire(self):
+        started = time.perf_counter()
+        await self._semaphore.acquire()
+        self._last_wait = time.perf_counter() - started
+        self.queue_wait_total += self._last_wait
+        self.in_flight += 1
+        self.calls += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def _call(self, request: Callable[[], Awaitable[Any]], current) -> Any:
+        """Semáforo, timeout e retry com jitter em volta de `request` (uma nova corrotina por tentativa)"""
+        await self._acquire()
+        current.set_attribute("queue_wait_ms", round(1000 * self._last_wait, 3))
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await asyncio.wait_for(request(), timeout=self.timeout)
+                except Exception as e:
+                    if attempt >= self.max_retries or not self.backend.is_retryable(e):
+                        self.failures += 1
+                        raise LLMUnavailableError(str(e) or type(e).__name__) from e
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt))
+        finally:
+            self._release()
+
+    async def complete(self, messages: List[Dict[str, str]], max_tokens: int = 300,
+                       temperature: float = 0.7) -> str:
+        """Gera a resposta completa"""
+        with span("llm.complete", model=self.model, max_tokens=max_tokens) as current:
+            return await self._call(lambda: self.backend.complete(messages, max_tokens, temperature), current)
+
+    @property
+    def supports_tools(self) -> bool:
+        return self.backend.supports_tools
+
+    async def complete_tools(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]],
+                             max_tokens: int = 300, temperature: float = 0.7) -> LLMReply:
+        """Uma rodada de function calling, com o mesmo semáforo, timeout e retry de `complete`"""
+        with span("llm.complete_tools", model=self.model, tools=len(tools)) as current:
+            reply = await self._call(
+                lambda: self.backend.complete_tools(messages, tools, max_tokens, temperature), current
+            )
+            current.set_attribute("tool_calls", len(reply.tool_calls))
+            return reply
+
+    async def stream(self, messages: List[Dict[str, str]], max_tokens: int = 300,
+                     temperature: float = 0.7) -> AsyncIterator[str]:
+        """Transmite os tokens; só refaz a chamada se nenhum token tiver sido enviado ainda
+
+        O timeout vale para o intervalo entre tokens, não para a geração inteira.
+        """
+        # Não ativa o span: o contexto do gerador é compartilhado com quem consome os tokens
+        with span("llm.stream", activate=False, model=self.model, max_tokens=max_tokens) as current:
+            await self._acquire()
+            try:
+                for attempt in range(self.max_retries + 1):
+                    emitted = False
+                    iterator = self.backend.stream(messages, max_tokens, temperature).__aiter__()
+                    try:
+                        while True:
+                            try:
+                                token = await asyncio.wait_for(iterator.__anext__(), timeout=self.timeout)
+                            except StopAsyncIteration:
+                                return
+                            if not emitted:
+                                current.set_attribute("time_to_first_token_ms",
+                                                      round((time.perf_counter() - current._started) * 1000, 3))
+                            emitted = True
+                            yield token
+                    except Exception as e:
+                        if emitted or attempt >= self.max_retries or not self.backend.is_retryable(e):
+                            self.failures += 1
+                            raise LLMUnavailableError(str(e) or type(e).__name__) from e
+                        self.retries += 1
+                        await asyncio.sleep(self._backoff(attempt))
+                    finally:
+                        aclose = getattr(iterator, "aclose", None)
+                        if aclose is not None:
+                            await aclose()
+            finally:
+                self._release()
+
+    @property
+    def model(self) -> str:
+        return self.backend.model
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend.name,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "queue_wait_avg_ms": round(1000 * self.queue_wait_total / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+def create_llm_client() -> Optional[LLMClient]:
+    """Cria o cliente a partir do ambiente; retorna None se não houver backend disponível
+
+    LLM_BACKEND=openai|fake, LLM_MAX_CONCURRENCY, LLM_TIMEOUT, LLM_MAX_RETRIES,
+    OPENAI_BASE_URL, FAKE_LLM_LATENCY, FAKE_LLM_TOKENS_PER_SECOND, FAKE_LLM_TOKENS
+    """
+    backend_name = os.getenv("LLM_BACKEND", "openai").lower()
+    max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+    if backend_name == "fake":
+        backend: LLMBackend = FakeBackend(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.2")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+            tokens=int(os.getenv("FAKE_LLM_TOKENS", "40")),
+        )
+    else:
+        openai_key = os.getenv("OPENAI_API_KEY")
+        if not openai_key or openai_key == "your_openai_api_key_here":
+            return None
+        backend = OpenAIBackend(
+            api_key=openai_key,
+            model=os.getenv("LLM_MODEL", DEFAULT_MODEL),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            max_connections=max_concurrency,
+        )
+
+    return LLMClient(
+        backend,
+        max_concurrency=max_concurrency,
+        timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+    )
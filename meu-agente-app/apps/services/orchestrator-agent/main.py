@@ -1,13 +1,134 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict
 import os
+import codecs
+import json
+import asyncio
+import time
 from dotenv import load_dotenv
 import httpx
-from typing import Dict, Any, List, Optional, Union
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple, Union, AsyncIterator
+
+from cache import OrchestratorCache, llm_cache_key
+from jobs import JobQueue, QueueFullError
+from knowledge import KnowledgeBase, render_hits
+from llm import LLMClient, create_llm_client
+from memory import ConversationMemory, extractive_summary
+from retrieval import (CalendarContext, DateWindow, RetrievalStats, parse_date_window,
+                       parse_event_types, render_events)
+from shared.instrumentation import setup_instrumentation, span, traced_transport
+from shared.logs import setup_logging
+from tools import ToolCall, ToolRuntime, ToolSet
+from router import (CALENDAR_KEYWORDS, CALENDAR_ROUTE, GENERAL_ROUTE, IntentRouter, Route,
+                    RouteMatch, plan_clauses)
 
 load_dotenv()
 
 app = FastAPI(title="Orchestrator Agent", version="1.0.0")
+setup_instrumentation(app, "orchestrator-agent")
+logger = setup_logging("orchestrator-agent")
+
+USER_SETTINGS_URL = os.getenv("USER_SETTINGS_URL", "http://user-settings-service:8004")
+CALENDAR_URL = os.getenv("CALENDAR_URL", "http://calendar-service:8002")
+
+# TTLs (segundos) do cache; as respostas do LLM só são cacheadas se habilitado
+AGENT_CACHE_TTL = float(os.getenv("AGENT_CACHE_TTL", "300"))
+CALENDAR_CACHE_TTL = float(os.getenv("CALENDAR_CACHE_TTL", "60"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+# Janela de eventos (em dias a partir de hoje) consultada para responder sobre a agenda
+CALENDAR_WINDOW_DAYS = int(os.getenv("CALENDAR_WINDOW_DAYS", "30"))
+# Máximo de eventos lidos da janela (uma página); além disso o prompt diz só que há mais
+CALENDAR_MAX_EVENTS = int(os.getenv("CALENDAR_MAX_EVENTS", "200"))
+# Limite (tokens estimados) da lista de eventos colocada no prompt
+CALENDAR_CONTEXT_TOKENS = int(os.getenv("CALENDAR_CONTEXT_TOKENS", "400"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Mensagens com pedidos para agentes diferentes são respondidas em paralelo (um ramo por agente)
+FANOUT_ENABLED = os.getenv("FANOUT_ENABLED", "true").lower() in ("1", "true", "yes")
+FANOUT_MAX_AGENTS = int(os.getenv("FANOUT_MAX_AGENTS", "3"))
+FANOUT_BRANCH_TIMEOUT = float(os.getenv("FANOUT_BRANCH_TIMEOUT", "20"))
+# Só trechos com rota confiante e ao menos N tokens viram ramo; os demais ("e Maria",
+# "quais suas causas") continuam o pedido vizinho
+FANOUT_MIN_SEGMENT_TOKENS = int(os.getenv("FANOUT_MIN_SEGMENT_TOKENS", "3"))
+FANOUT_MIN_CONFIDENCE = float(os.getenv("FANOUT_MIN_CONFIDENCE", "0.6"))
+
+# Ferramentas dos agentes (function calling); as chamadas de uma rodada rodam em paralelo
+TOOLS_ENABLED = os.getenv("TOOLS_ENABLED", "true").lower() in ("1", "true", "yes")
+TOOL_MAX_ROUNDS = int(os.getenv("TOOL_MAX_ROUNDS", "2"))
+
+# Clientes compartilhados, criados no startup e reutilizados entre requisições
+http_client: Optional[httpx.AsyncClient] = None
+llm_client: Optional[LLMClient] = None
+cache = OrchestratorCache(os.getenv("REDIS_URL"), max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "1024")))
+retrieval_stats = RetrievalStats()
+fanout_stats = {"requests": 0, "branches": 0, "timeouts": 0, "failures": 0}
+tool_runtime = ToolRuntime(
+    lambda: http_client,
+    # Endpoints das specs (como o gateway os expõe) -> serviços internos; TOOL_ROUTES=prefixo=url,...
+    routes={"/api/calendar": CALENDAR_URL, "/calendar": CALENDAR_URL, **dict(
+        item.split("=", 1) for item in os.getenv("TOOL_ROUTES", "").split(",") if "=" in item)},
+    timeout=float(os.getenv("TOOL_TIMEOUT", "5")),
+    max_timeout=float(os.getenv("TOOL_MAX_TIMEOUT", "30")),
+    max_result_bytes=int(os.getenv("TOOL_RESULT_MAX_BYTES", "8000")),
+    max_calls=int(os.getenv("TOOL_MAX_CALLS", "8")),
+)
+# Ferramentas do agente de agenda embutido: consultar outros períodos além do já incluído e criar eventos
+CALENDAR_TOOLS = [
+    {"name": "consultar_agenda", "description": "Consulta os eventos da agenda do usuário num período",
+     "apiEndpoint": "/api/calendar/events", "method": "GET", "parameters": [
+         {"name": "data_inicio", "type": "data", "field": "from", "required": True},
+         {"name": "data_fim", "type": "data", "field": "to", "required": True},
+         {"name": "calendario", "type": "string", "field": "calendar",
+          "description": "personal ou professional (opcional)"},
+     ]},
+    {"name": "criar_evento", "description": "Cria um evento na agenda do usuário",
+     "apiEndpoint": "/api/calendar/create", "method": "POST", "parameters": [
+         {"name": "titulo", "type": "string", "field": "title", "required": True},
+         {"name": "data", "type": "data", "field": "date", "required": True},
+         {"name": "tipo", "type": "string", "field": "type", "description": "Tipo do evento (ex.: meeting)"},
+         {"name": "recorrencia", "type": "string", "field": "rrule",
+          "description": "Regra RRULE para eventos que se repetem (ex.: FREQ=WEEKLY;BYDAY=MO,WE)"},
+     ]},
+]
+
+# Agente padrão (conhecimento geral) e rotas embutidas; agentes do settings são adicionados em runtime
+GENERAL_AGENT_ID = 1
+router = IntentRouter(
+    builtin_routes=[Route(
+        name=CALENDAR_ROUTE,
+        keywords=CALENDAR_KEYWORDS,
+        label="Agenda Service",
+        description="agenda calendário eventos compromissos reuniões datas horários marcar agendar",
+    )],
+    default_route=Route(name=GENERAL_ROUTE, agent_id=GENERAL_AGENT_ID, label="Assistente Geral"),
+    classifier_enabled=os.getenv("ROUTER_CLASSIFIER_ENABLED", "false").lower() in ("1", "true", "yes"),
+    classifier_threshold=float(os.getenv("ROUTER_CLASSIFIER_THRESHOLD", "0.35")),
+)
+routes_loaded_at = 0.0
+routes_refresh: Optional[asyncio.Task] = None
+
+async def summarize_conversation(previous: str, turns: List[Dict[str, Any]], max_tokens: int) -> str:
+    """Resumo incremental pelo LLM: resumo anterior + mensagens que saíram da janela"""
+    if llm_client is None:
+        return await extractive_summary(previous, turns, max_tokens)
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    return await llm_client.complete([
+        {"role": "system", "content": "Atualize o resumo da conversa de forma concisa, mantendo fatos, "
+                                      "preferências e pendências do usuário. Responda apenas com o resumo."},
+        {"role": "user", "content": f"Resumo atual:\n{previous or '(vazio)'}\n\nNovas mensagens:\n{transcript}"},
+    ], max_tokens=max_tokens, temperature=0.2)
+
+# Histórico por usuário: o prompt leva um resumo + as mensagens recentes que cabem no orçamento
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "true").lower() in ("1", "true", "yes")
+memory = ConversationMemory(
+    os.getenv("REDIS_URL"),
+    window_tokens=int(os.getenv("MEMORY_WINDOW_TOKENS", "1500")),
+    summary_tokens=int(os.getenv("MEMORY_SUMMARY_TOKENS", "300")),
+    max_turns=int(os.getenv("MEMORY_MAX_TURNS", "50")),
+    ttl=float(os.getenv("MEMORY_TTL", str(7 * 24 * 3600))),
+    summarizer=summarize_conversation,
+)
 
 class ChatRequest(BaseModel):
     message: str
@@ -18,142 +139,590 @@ class ChatResponse(BaseModel):
     agent_used: str
     show_canvas: bool = False
 
+class AgentTurn(BaseModel):
+    """Chamada ao LLM já preparada por um agente, pronta para ser completada ou transmitida"""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    agent_used: str
+    show_canvas: bool = False
+    messages: List[Dict[str, Any]] = []
+    user_id: str = "default_user"
+    tools: Optional[ToolSet] = None  # Ferramentas que o modelo pode chamar antes de responder
+    max_tokens: int = 300
+    fallback: str  # Resposta usada quando o LLM não está disponível
+
+async def run_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return (await run_chat(ChatRequest(**payload))).model_dump()
+
+# Modo assíncrono: POST /jobs enfileira e um pool de workers processa (Redis compartilha entre réplicas)
+jobs = JobQueue(
+    os.getenv("REDIS_URL"),
+    handler=run_job,
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_depth=int(os.getenv("JOB_QUEUE_MAX", "1000")),
+    ttl=float(os.getenv("JOB_TTL", "3600")),
+    # Identidade da instância (lista de processamento no Redis); padrão: hostname
+    worker_id=os.getenv("JOB_WORKER_ID"),
+)
+# Espera máxima de GET /jobs/{id}?wait= (long polling)
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+
+# Documentos por agente (índice vetorial local); só os trechos mais relevantes vão para o prompt
+knowledge = KnowledgeBase(
+    os.getenv("KNOWLEDGE_DIR", "/data/knowledge"),
+    chunk_size=int(os.getenv("KNOWLEDGE_CHUNK_CHARS", "1200")),
+    chunk_overlap=int(os.getenv("KNOWLEDGE_CHUNK_OVERLAP", "200")),
+    ann_threshold=int(os.getenv("KNOWLEDGE_ANN_THRESHOLD", "50000")),
+    nprobe=int(os.getenv("KNOWLEDGE_ANN_NPROBE", "8")),
+)
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "4"))
+KNOWLEDGE_MIN_SCORE = float(os.getenv("KNOWLEDGE_MIN_SCORE", "0.15"))
+KNOWLEDGE_CONTEXT_TOKENS = int(os.getenv("KNOWLEDGE_CONTEXT_TOKENS", "600"))
+KNOWLEDGE_MAX_BYTES = int(os.getenv("KNOWLEDGE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+def parse_json_list(value: Any) -> List[Any]:
+    if isinstance(value, list):
+        return value
+    try:
+        parsed = json.loads(value or "[]")
+    except (TypeError, ValueError):
+        return []
+    return parsed if isinstance(parsed, list) else []
+
+async def refresh_agent_routes():
+    """Recompila o roteador com as palavras-chave dos agentes cadastrados no settings"""
+    global routes_loaded_at
+    async def load():
+        response = await http_client.get(f"{USER_SETTINGS_URL}/agents")
+        return response.json() if response.status_code == 200 else None
+    try:
+        agents = await cache.get_or_load("agent:list", AGENT_CACHE_TTL, load) or []
+    except Exception as e:
+        logger.warning("Falha ao atualizar as rotas dos agentes: %s", e)
+        return
+    router.update_agents([
+        Route(
+            name=f"agent:{agent['id']}",
+            keywords=[str(k) for k in parse_json_list(agent.get("keywords"))],
+            agent_id=agent["id"],
+            label=agent.get("name", ""),
+            description=(agent.get("system_prompt") or "")[:500],
+        )
+        for agent in agents if agent.get("id") != GENERAL_AGENT_ID
+    ])
+    routes_loaded_at = time.monotonic()
+
+def schedule_routes_refresh():
+    """Recompila em segundo plano; as mensagens continuam usando o índice atual"""
+    global routes_refresh
+    if routes_refresh is None or routes_refresh.done():
+        routes_refresh = asyncio.create_task(refresh_agent_routes())
+
+def route_message(message: str):
+    if time.monotonic() - routes_loaded_at > AGENT_CACHE_TTL:
+        schedule_routes_refresh()
+    with span("router.route") as current:
+        matches = router.route(message)
+        current.set_attribute("route", matches[0].route)
+        current.set_attribute("tier", matches[0].tier)
+    return matches
+
+@app.on_event("startup")
+async def startup_event():
+    global http_client, llm_client
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0, connect=5.0),
+        transport=traced_transport(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)),
+    )
+    llm_client = create_llm_client()
+    await cache.start()
+    await memory.start()
+    await jobs.start()
+    cache.on_invalidate("agent:", schedule_routes_refresh)
+    await refresh_agent_routes()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await jobs.close()
+    await memory.close()
+    await cache.close()
+    if llm_client is not None:
+        await llm_client.close()
+    if http_client is not None:
+        await http_client.aclose()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "orchestrator-agent"}
 
+@app.get("/stats")
+async def stats():
+    """Métricas internas do orquestrador"""
+    return {
+        "llm": llm_client.stats() if llm_client else None,
+        "cache": cache.stats(),
+        "router": router.stats(),
+        "memory": memory.stats() if MEMORY_ENABLED else None,
+        "retrieval": retrieval_stats.stats(),
+        "fanout": dict(fanout_stats),
+        "jobs": jobs.stats(),
+        "tools": tool_runtime.stats(),
+        "knowledge": knowledge.stats(),
+    }
+
 @app.post("/process")
 async def process_message(request: ChatRequest) -> ChatResponse:
     """Processa a mensagem do usuário e orquestra a resposta entre agentes especializados"""
-    
+
     try:
-        # Primeiro, analisamos se a pergunta precisa de funcionalidades específicas
-        message_lower = request.message.lower()
-        
-        # Verificar se precisa de funcionalidades de agenda
-        agenda_keywords = ["agenda", "calendário", "compromisso", "evento", "reunião", "marcar", "agendar", 
-                          "data", "horário", "quando", "hoje", "amanhã", "semana", "mês"]
-        
-        needs_calendar = any(keyword in message_lower for keyword in agenda_keywords)
-        
-        if needs_calendar:
-            # Redirecionar para funcionalidades de agenda
-            return await handle_calendar_request(request)
-        else:
-            # Usar o agente de conhecimento geral
-            return await handle_general_request(request)
-        
+        return await run_chat(request)
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
-async def handle_calendar_request(request: ChatRequest) -> ChatResponse:
-    """Processa requisições relacionadas à agenda"""
+async def run_chat(request: ChatRequest) -> ChatResponse:
+    turns = await prepare_turns(request)
+    if len(turns) == 1:
+        response = await complete_turn(turns[0])
+    else:
+        # Cada agente responde em paralelo; o tempo total é o do ramo mais lento
+        response = merge_responses(turns, await complete_branches(turns))
+    await remember_turn(request, turns, response.response)
+    return response
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: ChatRequest):
+    """Enfileira a mensagem para processamento assíncrono; o resultado sai em GET /jobs/{id}"""
     try:
-        # Consultar eventos através do calendar service
-        async with httpx.AsyncClient() as client:
-            calendar_response = await client.get("http://calendar-service:8002/all")
-            events = calendar_response.json() if calendar_response.status_code == 200 else []
-        
-        # Usar IA para gerar resposta contextual sobre a agenda
-        openai_key = os.getenv('OPENAI_API_KEY')
-        ai_response = "Consultando sua agenda..."
-        
-        if openai_key and openai_key != "your_openai_api_key_here":
+        job = await jobs.enqueue(request.model_dump())
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        logger.error("Erro ao enfileirar job: %s", e)
+        raise HTTPException(status_code=503, detail="Fila de jobs indisponível")
+    return {"job_id": job["id"], "status": job["status"], "position": job["position"]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0)):
+    """Status/resultado do job; com `wait` segura a resposta até o job terminar (long polling)"""
+    try:
+        job = await jobs.wait(job_id, min(wait, JOB_MAX_WAIT))
+    except Exception as e:
+        logger.error("Erro ao consultar job %s: %s", job_id, e)
+        raise HTTPException(status_code=503, detail="Fila de jobs indisponível")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    job.pop("request", None)
+    return job
+
+@app.post("/agents/{agent_id}/knowledge", status_code=201)
+async def ingest_knowledge(agent_id: int, request: Request, name: str = Query("documento", max_length=200)):
+    """Adiciona um documento de texto (corpo da requisição) à base do agente
+
+    O corpo é lido em streaming: os trechos são vetorizados e gravados conforme
+    chegam, sem manter o documento inteiro em memória.
+    """
+    if not knowledge.enabled:
+        raise HTTPException(status_code=503, detail="Base de conhecimento indisponível")
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    received = 0
+    with span("knowledge.ingest", agent_id=agent_id) as current:
+        async with knowledge.ingest(agent_id, name) as writer:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > KNOWLEDGE_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="Documento maior que o limite")
+                await writer.feed(decoder.decode(chunk))
+            await writer.feed(decoder.decode(b"", final=True))
+        current.set_attribute("bytes", received)
+        current.set_attribute("chunks", writer.document["chunks"])
+    return writer.document
+
+@app.get("/agents/{agent_id}/knowledge")
+async def list_knowledge(agent_id: int):
+    return await knowledge.documents(agent_id)
+
+@app.get("/agents/{agent_id}/knowledge/search")
+async def search_knowledge(agent_id: int, q: str, k: int = Query(KNOWLEDGE_TOP_K, ge=1, le=50)):
+    hits = await knowledge.search(agent_id, q, k)
+    return [{"document": hit.document, "score": round(hit.score, 4), "text": hit.text} for hit in hits]
+
+@app.delete("/agents/{agent_id}/knowledge/{document_id}")
+async def delete_knowledge(agent_id: int, document_id: int):
+    if not await knowledge.delete(agent_id, document_id):
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    return {"message": "Documento removido"}
+
+@app.post("/process/stream")
+async def process_message_stream(request: ChatRequest) -> StreamingResponse:
+    """Mesma orquestração de /process, mas transmite os tokens via Server-Sent Events
+
+    Eventos emitidos: `meta` (agente e canvas), mensagens sem nome com {"token": ...}
+    conforme chegam do modelo, e `done` com a resposta completa (ou `error`).
+    """
+    turns = await prepare_turns(request)
+    events = (stream_turn_events(turns[0], request) if len(turns) == 1
+              else stream_branch_events(turns, request))
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {payload}\n\n"
+
+async def stream_turn_events(turn: AgentTurn, request: ChatRequest) -> AsyncIterator[str]:
+    yield sse_event({"agent_used": turn.agent_used, "show_canvas": turn.show_canvas}, event="meta")
+    parts: List[str] = []
+    try:
+        async for token in stream_turn(turn):
+            parts.append(token)
+            yield sse_event({"token": token})
+    except Exception as e:
+        logger.error("Erro do LLM durante o streaming: %s", e)
+        yield sse_event({"detail": "Erro ao gerar a resposta."}, event="error")
+        return
+    response = "".join(parts)
+    yield sse_event({"response": response}, event="done")
+    await remember_turn(request, [turn], response)
+
+async def stream_branch_events(turns: List[AgentTurn], request: ChatRequest) -> AsyncIterator[str]:
+    """Fan-out no streaming: os ramos rodam juntos e cada seção sai, na ordem do pedido,
+    assim que ela e as anteriores ficam prontas"""
+    yield sse_event({"agent_used": " + ".join(t.agent_used for t in turns),
+                     "show_canvas": any(t.show_canvas for t in turns)}, event="meta")
+    tasks = start_branches(turns)
+    results: List[Union[ChatResponse, BaseException]] = []
+    try:
+        for index, task in enumerate(tasks):
             try:
-                from openai import OpenAI
-                client = OpenAI(api_key=openai_key)
-                
-                events_context = f"Eventos na agenda: {events}" if events else "Nenhum evento encontrado."
-                
-                system_prompt = f"""
-                Você é um assistente de agenda inteligente. O usuário perguntou: "{request.message}"
-                
-                Contexto da agenda atual: {events_context}
-                
-                Responda de forma útil sobre a agenda do usuário. Se não houver eventos relevantes, 
-                sugira criar novos eventos se apropriado.
-                """
-                
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": request.message}
-                    ],
-                    max_tokens=200,
-                    temperature=0.7
-                )
-                
-                ai_response = response.choices[0].message.content
-                
+                result: Union[ChatResponse, BaseException] = await task
             except Exception as e:
-                print(f"OpenAI Error: {e}")
-        
-        return ChatResponse(
-            response=ai_response,
-            agent_used="Agenda Service",
-            show_canvas=True
-        )
-        
-    except Exception as e:
-        print(f"Calendar service error: {e}")
-        return ChatResponse(
-            response="Desculpe, não foi possível acessar sua agenda no momento.",
-            agent_used="Agenda Service",
-            show_canvas=False
-        )
+                result = e
+            results.append(result)
+            section = branch_section(turns[index], result)
+            yield sse_event({"token": section if index == 0 else "\n\n" + section})
+    finally:
+        for task in tasks:
+            task.cancel()
+    response = merge_responses(turns, results)
+    yield sse_event({"response": response.response}, event="done")
+    await remember_turn(request, turns, response.response)
 
-async def handle_general_request(request: ChatRequest) -> ChatResponse:
-    """Processa requisições de conhecimento geral usando o agente principal"""
+async def remember_turn(request: ChatRequest, turns: List[AgentTurn], response: str):
+    """Guarda a troca no histórico (só quando houve chamada ao LLM)"""
+    if not (MEMORY_ENABLED and any(turn.messages for turn in turns)):
+        return
     try:
-        # Buscar configuração do agente de conhecimento geral
-        async with httpx.AsyncClient() as client:
-            agent_response = await client.get("http://user-settings-service:8004/agents/1")
-            agent_config = agent_response.json() if agent_response.status_code == 200 else None
-        
-        # Usar IA para resposta de conhecimento geral
-        openai_key = os.getenv('OPENAI_API_KEY')
-        ai_response = "Como posso ajudá-lo hoje?"
-        
-        if openai_key and openai_key != "your_openai_api_key_here":
+        await memory.append(request.user_id, request.message, response)
+    except Exception as e:
+        logger.warning("Erro na memória de conversa: %s", e)
+
+def turn_cache_key(turn: AgentTurn) -> Optional[str]:
+    """Chave do cache de respostas: mensagem normalizada + system prompt + modelo"""
+    if not (LLM_CACHE_ENABLED and llm_client) or turn.tools:
+        # Com ferramentas a resposta depende de dados consultados na hora
+        return None
+    # Tudo antes da pergunta (system prompt, resumo e histórico) faz parte do contexto da chave
+    context = "\x1e".join(f"{m['role']}:{m['content']}" for m in turn.messages[:-1])
+    return llm_cache_key(turn.messages[-1]["content"], context, llm_client.model)
+
+async def complete_turn(turn: AgentTurn) -> ChatResponse:
+    """Executa a chamada ao LLM e devolve a resposta completa"""
+    ai_response = turn.fallback
+
+    if llm_client and turn.messages:
+        key = turn_cache_key(turn)
+        cached = await cache.get(key) if key else None
+        if cached is not None:
+            ai_response = cached
+        else:
             try:
-                from openai import OpenAI
-                client = OpenAI(api_key=openai_key)
-                
-                # Usar o prompt do agente de conhecimento geral se disponível
-                system_prompt = (agent_config.get('system_prompt') if agent_config 
-                               else """Você é um assistente de IA de conhecimento geral, como ChatGPT, Gemini ou Claude. 
-                                      Seja útil, preciso e amigável. Responda em português brasileiro.""")
-                
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": request.message}
-                    ],
-                    max_tokens=300,
-                    temperature=0.7
-                )
-                
-                ai_response = response.choices[0].message.content
-                
+                answer = await run_tool_rounds(turn)
+                ai_response = (answer if answer is not None
+                               else await llm_client.complete(turn.messages, max_tokens=turn.max_tokens))
+                if key:
+                    await cache.set(key, ai_response, LLM_CACHE_TTL)
             except Exception as e:
-                print(f"OpenAI Error: {e}")
-        
-        return ChatResponse(
-            response=ai_response,
-            agent_used="Assistente Geral",
-            show_canvas=False
+                logger.error("Erro do LLM: %s", e)
+
+    return ChatResponse(
+        response=ai_response,
+        agent_used=turn.agent_used,
+        show_canvas=turn.show_canvas
+    )
+
+async def complete_branch(turn: AgentTurn) -> ChatResponse:
+    with span("fanout.branch", agent=turn.agent_used):
+        return await asyncio.wait_for(complete_turn(turn), FANOUT_BRANCH_TIMEOUT)
+
+def start_branches(turns: List[AgentTurn]) -> List[asyncio.Task]:
+    fanout_stats["requests"] += 1
+    fanout_stats["branches"] += len(turns)
+    return [asyncio.create_task(complete_branch(turn)) for turn in turns]
+
+async def complete_branches(turns: List[AgentTurn]) -> List[Union[ChatResponse, BaseException]]:
+    """Completa todos os ramos juntos; falhas e timeouts voltam como exceção, sem derrubar os demais"""
+    with span("fanout", branches=len(turns)):
+        return await asyncio.gather(*start_branches(turns), return_exceptions=True)
+
+def branch_section(turn: AgentTurn, result: Union[ChatResponse, BaseException]) -> str:
+    """Trecho da resposta final referente a um ramo (ou o aviso de resposta parcial)"""
+    if isinstance(result, asyncio.TimeoutError):
+        fanout_stats["timeouts"] += 1
+        logger.warning("Agente %s excedeu %.1fs no fan-out", turn.agent_used, FANOUT_BRANCH_TIMEOUT)
+        text = "_(não respondeu a tempo)_"
+    elif isinstance(result, BaseException):
+        fanout_stats["failures"] += 1
+        logger.error("Erro no ramo do agente %s: %s", turn.agent_used, result)
+        text = "_(não foi possível obter esta parte da resposta)_"
+    else:
+        text = result.response
+    return f"**{turn.agent_used}**\n{text}"
+
+def merge_responses(turns: List[AgentTurn], results: List[Union[ChatResponse, BaseException]]) -> ChatResponse:
+    """Junta as respostas dos ramos, na ordem em que os pedidos aparecem na mensagem"""
+    return ChatResponse(
+        response="\n\n".join(branch_section(turn, result) for turn, result in zip(turns, results)),
+        agent_used=" + ".join(turn.agent_used for turn in turns),
+        show_canvas=any(isinstance(result, ChatResponse) and result.show_canvas for result in results),
+    )
+
+async def stream_turn(turn: AgentTurn) -> AsyncIterator[str]:
+    """Transmite os tokens do LLM conforme são gerados"""
+    if not (llm_client and turn.messages):
+        yield turn.fallback
+        return
+
+    key = turn_cache_key(turn)
+    cached = await cache.get(key) if key else None
+    if cached is not None:
+        yield cached
+        return
+
+    answer = await run_tool_rounds(turn)
+    if answer is not None:
+        # O modelo já respondeu na rodada de ferramentas
+        yield answer
+        return
+
+    parts: List[str] = []
+    async for token in llm_client.stream(turn.messages, max_tokens=turn.max_tokens):
+        parts.append(token)
+        yield token
+    if key:
+        await cache.set(key, "".join(parts), LLM_CACHE_TTL)
+
+async def run_tool_rounds(turn: AgentTurn) -> Optional[str]:
+    """Rodadas de function calling antes da resposta final
+
+    As chamadas pedidas em cada rodada são executadas juntas e os resultados
+    entram em `turn.messages`. Se o modelo responder sem pedir ferramentas, o
+    texto é devolvido e a chamada final ao LLM é dispensada.
+    """
+    if not (turn.tools and llm_client and llm_client.supports_tools):
+        return None
+    for _ in range(TOOL_MAX_ROUNDS):
+        reply = await llm_client.complete_tools(turn.messages, turn.tools.schemas, max_tokens=turn.max_tokens)
+        if not reply.tool_calls:
+            return reply.content
+        calls = [ToolCall(call["id"], call["name"], call["arguments"]) for call in reply.tool_calls]
+        results = await tool_runtime.execute(turn.tools, calls, turn.user_id)
+        turn.messages = turn.messages + [{
+            "role": "assistant",
+            "content": reply.content or None,
+            "tool_calls": [{"id": call.id, "type": "function", "function": {
+                "name": call.name, "arguments": json.dumps(call.arguments, ensure_ascii=False)}}
+                for call in calls],
+        }] + [result.message() for result in results]
+    return None
+
+async def fetch_agent_config(agent_id: int) -> Optional[Dict[str, Any]]:
+    """Configuração do agente no user-settings-service (memoizada)"""
+    async def load():
+        response = await http_client.get(f"{USER_SETTINGS_URL}/agents/{agent_id}")
+        return response.json() if response.status_code == 200 else None
+    return await cache.get_or_load(f"agent:{agent_id}", AGENT_CACHE_TTL, load)
+
+async def fetch_calendar_events(user_id: str, from_date: date, to_date: date,
+                                types: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Primeira página da janela: {"events": [...], "more": bool} (invalidada quando a agenda muda)
+
+    Só uma página: o prompt comporta poucas linhas, então o custo não cresce
+    com o tamanho da agenda; `more` indica que a janela tem mais eventos.
+    """
+    params = {
+        "user_id": user_id,
+        "from": from_date.isoformat(),
+        "to": to_date.isoformat(),
+        "limit": CALENDAR_MAX_EVENTS,
+    }
+    if types:
+        params["type"] = ",".join(sorted(types))
+    async def load():
+        response = await http_client.get(f"{CALENDAR_URL}/events", params=params)
+        # Erro do serviço não vira "nenhum evento": quem chama responde que a agenda está indisponível
+        response.raise_for_status()
+        page = response.json()
+        return {"events": page["events"], "more": bool(page.get("next_cursor"))}
+    key = f"calendar:{user_id}:{from_date.isoformat()}:{to_date.isoformat()}:{params.get('type', '')}"
+    return await cache.get_or_load(key, CALENDAR_CACHE_TTL, load)
+
+def plan_branches(message: str) -> List[Tuple[RouteMatch, str]]:
+    """Divide a mensagem em pedidos por agente: [(RouteMatch, trecho), ...] na ordem da mensagem
+
+    Trechos com a mesma rota são reunidos; se não há pedidos confiantes para
+    rotas diferentes, a mensagem inteira segue para a melhor rota, como antes.
+    """
+    if not FANOUT_ENABLED:
+        return [(route_message(message)[0], message)]
+    groups = plan_clauses(message, route_message, FANOUT_MIN_CONFIDENCE, FANOUT_MIN_SEGMENT_TOKENS)
+    return [(match, "; ".join(parts)) for match, parts in groups[:FANOUT_MAX_AGENTS]]
+
+def build_agent_turn(request: ChatRequest, match: RouteMatch):
+    if match.route == CALENDAR_ROUTE:
+        # Redirecionar para funcionalidades de agenda
+        return prepare_calendar_turn(request)
+    # Agente cadastrado (ou o de conhecimento geral, por padrão)
+    return prepare_agent_turn(request, match.agent_id or GENERAL_AGENT_ID)
+
+async def prepare_turns(request: ChatRequest) -> List[AgentTurn]:
+    """Escolhe os agentes pelas rotas da mensagem e prepara uma chamada ao LLM para cada um"""
+    branches = plan_branches(request.message)
+    prepares = [
+        build_agent_turn(request if text == request.message
+                         else request.model_copy(update={"message": text}), match)
+        for match, text in branches
+    ]
+    if not MEMORY_ENABLED:
+        return list(await asyncio.gather(*prepares))
+
+    # Histórico e contexto dos agentes são buscados em paralelo
+    *turns, window = await asyncio.gather(*prepares, load_history(request.user_id))
+    for turn in turns:
+        if turn.messages and window is not None:
+            turn.messages = turn.messages[:1] + window.messages() + turn.messages[1:]
+    return turns
+
+async def load_history(user_id: str):
+    try:
+        with span("memory.load"):
+            return await memory.load(user_id)
+    except Exception as e:
+        logger.warning("Erro na memória de conversa: %s", e)
+        return None
+
+async def retrieve_calendar_context(request: ChatRequest) -> Optional[CalendarContext]:
+    """Consulta só a janela e os tipos citados na mensagem e serializa com limite de tokens"""
+    today = date.today()
+    window = (parse_date_window(request.message, today)
+              or DateWindow(today, today + timedelta(days=CALENDAR_WINDOW_DAYS), "próximos dias"))
+    types = parse_event_types(request.message)
+    try:
+        # Consultar eventos através do calendar service
+        with span("calendar.retrieve", window=window.label):
+            page = await fetch_calendar_events(request.user_id, window.start, window.end, types)
+    except Exception as e:
+        logger.warning("Erro ao consultar o calendar-service: %s", e)
+        return None
+
+    events, more = page["events"], page["more"]
+    text, included, tokens = render_events(events, CALENDAR_CONTEXT_TOKENS, more)
+    context = CalendarContext(window=window, types=types, text=text, considered=len(events),
+                              more=more, included=included, tokens=tokens)
+    retrieval_stats.record(context)
+    return context
+
+async def prepare_calendar_turn(request: ChatRequest) -> AgentTurn:
+    """Monta o contexto da agenda para a chamada ao LLM"""
+    context = await retrieve_calendar_context(request)
+    if context is None:
+        return AgentTurn(
+            agent_used="Agenda Service",
+            show_canvas=False,
+            fallback="Desculpe, não foi possível acessar sua agenda no momento."
         )
-        
+
+    window = context.window
+    period = (window.start.isoformat() if window.start == window.end
+              else f"{window.start.isoformat()} a {window.end.isoformat()}")
+    events_context = (f"Eventos de {period} ({window.label}):\n{context.text}" if context.considered
+                      else f"Nenhum evento encontrado de {period} ({window.label}).")
+
+    system_prompt = f"""
+    Você é um assistente de agenda inteligente. Hoje é {date.today().isoformat()}. O usuário perguntou: "{request.message}"
+
+    Contexto da agenda atual: {events_context}
+
+    Responda de forma útil sobre a agenda do usuário. Se não houver eventos relevantes,
+    sugira criar novos eventos se apropriado.
+    """
+
+    return AgentTurn(
+        agent_used="Agenda Service",
+        show_canvas=True,
+        user_id=request.user_id,
+        tools=tool_runtime.toolset("builtin:calendar", CALENDAR_TOOLS) if TOOLS_ENABLED else None,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": request.message}
+        ],
+        max_tokens=200,
+        fallback="Consultando sua agenda..."
+    )
+
+async def retrieve_knowledge(agent_id: int, message: str) -> str:
+    """Top-k trechos da base do agente para a mensagem (vazio se não houver base ou falhar)"""
+    try:
+        with span("knowledge.search", agent_id=agent_id) as current:
+            hits = await knowledge.search(agent_id, message, KNOWLEDGE_TOP_K)
+            hits = [hit for hit in hits if hit.score >= KNOWLEDGE_MIN_SCORE]
+            current.set_attribute("hits", len(hits))
+    except Exception as e:
+        logger.warning("Erro na busca da base de conhecimento do agente %s: %s", agent_id, e)
+        return ""
+    return render_hits(hits, KNOWLEDGE_CONTEXT_TOKENS)
+
+async def prepare_agent_turn(request: ChatRequest, agent_id: int = GENERAL_AGENT_ID) -> AgentTurn:
+    """Monta o prompt de um agente cadastrado (por padrão, o de conhecimento geral)"""
+    try:
+        # Configuração do agente e trechos relevantes da base dele em paralelo
+        agent_config, knowledge_context = await asyncio.gather(
+            fetch_agent_config(agent_id), retrieve_knowledge(agent_id, request.message))
     except Exception as e:
-        print(f"General agent error: {e}")
-        return ChatResponse(
-            response="Desculpe, ocorreu um erro ao processar sua solicitação.",
+        logger.warning("Erro ao buscar a configuração do agente %s: %s", agent_id, e)
+        return AgentTurn(
             agent_used="Assistente Geral",
-            show_canvas=False
+            show_canvas=False,
+            fallback="Desculpe, ocorreu um erro ao processar sua solicitação."
         )
 
+    # Usar o prompt do agente se disponível
+    system_prompt = (agent_config.get('system_prompt') if agent_config
+                   else """Você é um assistente de IA de conhecimento geral, como ChatGPT, Gemini ou Claude.
+                          Seja útil, preciso e amigável. Responda em português brasileiro.""")
+    if knowledge_context:
+        system_prompt += ("\n\nTrechos da base de conhecimento (use se forem relevantes):\n"
+                          + knowledge_context)
+
+    return AgentTurn(
+        agent_used=(agent_config or {}).get("name") or "Assistente Geral",
+        show_canvas=False,
+        user_id=request.user_id,
+        tools=(tool_runtime.toolset(f"agent:{agent_id}", agent_config.get("tools"))
+               if TOOLS_ENABLED and agent_config else None),
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": request.message}
+        ],
+        max_tokens=300,
+        fallback="Como posso ajudá-lo hoje?"
+    )
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8001, log_config=None)
@@ -0,0 +1,301 @@
+# apps/services/orchestrator-agent/memory.py
+"""Memória de conversa por usuário, com janela limitada por tokens
+
+Cada mensagem (usuário/assistente) é anexada a uma lista por usuário no Redis
+(ou em memória, sem Redis). O prompt recebe apenas um resumo das mensagens
+antigas e as mensagens mais recentes que cabem no orçamento de tokens, então o
+tamanho do prompt não cresce com a conversa. Quando as mensagens guardadas
+passam do orçamento, as mais antigas são incorporadas ao resumo em segundo
+plano (resumo incremental: resumo anterior + mensagens novas).
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Sem Redis a memória fica restrita a esta instância
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "orchestrator:memory:"
+
+# Após uma falha, espera este tempo antes de tentar o Redis novamente
+REDIS_RETRY_INTERVAL = 30.0
+
+# Ao compactar, reduz o histórico a esta fração do orçamento para não resumir a cada mensagem
+COMPACT_TARGET_RATIO = 0.75
+
+Summarizer = Callable[[str, List[Dict[str, Any]], int], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata (~4 caracteres por token), suficiente para orçamentos"""
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Mantém o final do texto (a parte mais recente do resumo)"""
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else "…" + text[-max_chars:]
+
+
+async def extractive_summary(previous: str, turns: List[Dict[str, Any]], max_tokens: int) -> str:
+    """Resumo sem LLM: trechos iniciais de cada mensagem, limitado ao orçamento"""
+    labels = {"user": "Usuário", "assistant": "Assistente"}
+    lines = [f"{labels.get(t['role'], t['role'])}: {t['content'][:160]}" for t in turns]
+    text = "\n".join(([previous] if previous else []) + lines)
+    return truncate_to_tokens(text, max_tokens)
+
+
+@dataclass
+class ConversationWindow:
+    summary: str = ""
+    turns: List[Dict[str, Any]] = field(default_factory=list)
+    tokens: int = 0
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Mensagens no formato do chat, para inserir entre o system prompt e a pergunta"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Resumo da conversa até aqui:\n{self.summary}"})
+        messages.extend({"role": t["role"], "content": t["content"]} for t in self.turns)
+        return messages
+
+
+class ConversationMemory:
+    """Histórico por usuário com janela deslizante e resumo incremental"""
+
+    def __init__(self, redis_url: Optional[str] = None, window_tokens: int = 1500,
+                 summary_tokens: int = 300, max_turns: int = 50, ttl: float = 7 * 24 * 3600,
+                 max_local_users: int = 1000, summarizer: Optional[Summarizer] = None):
+        self.redis_url = redis_url
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_local_users = max_local_users
+        self.summarizer = summarizer or extractive_summary
+        self._redis = None
+        self._redis_retry_at = 0.0
+        # Fallback em memória: user_id -> {"summary": str, "turns": [...]}
+        self._local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._compacting: Dict[str, asyncio.Task] = {}
+        # Métricas
+        self.loads = 0
+        self.load_time_total = 0.0
+        self.load_time_max = 0.0
+        self.window_tokens_total = 0
+        self.window_turns_total = 0
+        self.compactions = 0
+        self.compaction_failures = 0
+        self.compaction_time_total = 0.0
+
+    async def start(self):
+        if self.redis_url and aioredis:
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True,
+                                            socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    async def close(self):
+        for task in list(self._compacting.values()):
+            task.cancel()
+        if self._compacting:
+            await asyncio.gather(*self._compacting.values(), return_exceptions=True)
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    @property
+    def redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception):
+        logger.warning("Erro no Redis da memória de conversa: %s", error)
+        self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+
+    @staticmethod
+    def _keys(user_id: str):
+        base = f"{KEY_PREFIX}{user_id}"
+        return f"{base}:turns", f"{base}:summary", f"{base}:tokens", f"{base}:lock"
+
+    def _local_state(self, user_id: str) -> Dict[str, Any]:
+        state = self._local.get(user_id)
+        if state is None:
+            state = self._local[user_id] = {"summary": "", "turns": []}
+            while len(self._local) > self.max_local_users:
+                self._local.popitem(last=False)
+        self._local.move_to_end(user_id)
+        return state
+
+    # --- Leitura ---------------------------------------------------------
+
+    async def _read(self, user_id: str, count: Optional[int]):
+        """Resumo e as últimas `count` mensagens guardadas (todas se None)"""
+        if self.redis_available:
+            turns_key, summary_key, _, _ = self._keys(user_id)
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.get(summary_key)
+                    pipe.lrange(turns_key, -count if count else 0, -1)
+                    raw_summary, raw_turns = await pipe.execute()
+                return (json.loads(raw_summary)["text"] if raw_summary else "",
+                        [json.loads(raw) for raw in raw_turns])
+            except Exception as e:
+                self._redis_failed(e)
+        state = self._local_state(user_id)
+        turns = state["turns"][-count:] if count else list(state["turns"])
+        return state["summary"], turns
+
+    async def load(self, user_id: str) -> ConversationWindow:
+        """Resumo + mensagens mais recentes que cabem em `window_tokens`"""
+        started = time.perf_counter()
+        summary, stored = await self._read(user_id, self.max_turns)
+
+        budget = self.window_tokens - (estimate_tokens(summary) if summary else 0)
+        turns: List[Dict[str, Any]] = []
+        used = 0
+        for turn in reversed(stored):
+            if used + turn["tokens"] > budget:
+                break
+            turns.append(turn)
+            used += turn["tokens"]
+        turns.reverse()
+        window = ConversationWindow(summary=summary, turns=turns, tokens=self.window_tokens - budget + used)
+
+        elapsed = time.perf_counter() - started
+        self.loads += 1
+        self.load_time_total += elapsed
+        self.load_time_max = max(self.load_time_max, elapsed)
+        self.window_tokens_total += window.tokens
+        self.window_turns_total += len(turns)
+        return window
+
+    # --- Escrita ---------------------------------------------------------
+
+    async def append(self, user_id: str, user_message: str, assistant_message: str):
+        """Anexa a troca de mensagens e agenda a compactação se passou do orçamento"""
+        entries = [
+            {"role": "user", "content": user_message, "tokens": estimate_tokens(user_message)},
+            {"role": "assistant", "content": assistant_message, "tokens": estimate_tokens(assistant_message)},
+        ]
+        stored = None
+        if self.redis_available:
+            turns_key, summary_key, tokens_key, _ = self._keys(user_id)
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    pipe.rpush(turns_key, *(json.dumps(e, ensure_ascii=False) for e in entries))
+                    # Total de tokens guardados, para decidir a compactação sem ler a lista
+                    pipe.incrby(tokens_key, sum(e["tokens"] for e in entries))
+                    for key in (turns_key, summary_key, tokens_key):
+                        pipe.expire(key, int(self.ttl))
+                    count, tokens = (await pipe.execute())[:2]
+                stored = (count, tokens)
+            except Exception as e:
+                self._redis_failed(e)
+        if stored is None:
+            state = self._local_state(user_id)
+            state["turns"].extend(entries)
+            stored = (len(state["turns"]), sum(t["tokens"] for t in state["turns"]))
+
+        count, tokens = stored
+        if tokens > self.window_tokens or count > self.max_turns:
+            self._schedule_compaction(user_id)
+
+    def _schedule_compaction(self, user_id: str):
+        task = self._compacting.get(user_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._compact(user_id))
+            self._compacting[user_id] = task
+            task.add_done_callback(lambda _: self._compacting.pop(user_id, None))
+
+    async def _compact(self, user_id: str):
+        """Incorpora as mensagens mais antigas ao resumo até caber no orçamento"""
+        turns_key, summary_key, tokens_key, lock_key = self._keys(user_id)
+        use_redis = self.redis_available
+        if use_redis:
+            try:
+                # Evita que duas réplicas resumam o mesmo histórico ao mesmo tempo
+                if not await self._redis.set(lock_key, "1", nx=True, ex=60):
+                    return
+            except Exception as e:
+                self._redis_failed(e)
+                use_redis = False
+
+        started = time.perf_counter()
+        try:
+            summary, stored = await self._read(user_id, None)
+            total = sum(t["tokens"] for t in stored)
+            if total <= self.window_tokens and len(stored) <= self.max_turns:
+                return
+            folded_tokens = total
+
+            target = self.window_tokens * COMPACT_TARGET_RATIO
+            max_kept = self.max_turns // 2
+            folded = 0
+            while folded < len(stored) - 2 and (total > target or len(stored) - folded > max_kept):
+                total -= stored[folded]["tokens"]
+                folded += 1
+            if not folded:
+                return
+            folded_tokens -= total
+
+            try:
+                new_summary = await self.summarizer(summary, stored[:folded], self.summary_tokens)
+            except Exception as e:
+                logger.warning("Falha ao resumir a conversa, usando resumo extrativo: %s", e)
+                new_summary = await extractive_summary(summary, stored[:folded], self.summary_tokens)
+            new_summary = truncate_to_tokens(new_summary.strip(), self.summary_tokens)
+
+            if use_redis:
+                payload = json.dumps({"text": new_summary, "updated_at": time.time()}, ensure_ascii=False)
+                async with self._redis.pipeline(transaction=True) as pipe:
+                    pipe.set(summary_key, payload, ex=int(self.ttl))
+                    # Novas mensagens entram pelo final, então remover pelo início é seguro
+                    pipe.ltrim(turns_key, folded, -1)
+                    pipe.decrby(tokens_key, folded_tokens)
+                    await pipe.execute()
+            else:
+                state = self._local_state(user_id)
+                state["summary"] = new_summary
+                del state["turns"][:folded]
+            self.compactions += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.compaction_failures += 1
+            logger.error("Falha ao compactar a conversa: %s", e)
+        finally:
+            self.compaction_time_total += time.perf_counter() - started
+            if use_redis:
+                try:
+                    await self._redis.delete(lock_key)
+                except Exception:
+                    pass
+
+    async def clear(self, user_id: str):
+        self._local.pop(user_id, None)
+        if self.redis_available:
+            try:
+                await self._redis.delete(*self._keys(user_id))
+            except Exception as e:
+                self._redis_failed(e)
+
+    def stats(self) -> Dict[str, Any]:
+        loads = self.loads or 1
+        return {
+            "backend": "redis" if self.redis_available else "memory",
+            "window_tokens_budget": self.window_tokens,
+            "loads": self.loads,
+            "load_time_avg_ms": round(1000 * self.load_time_total / loads, 3),
+            "load_time_max_ms": round(1000 * self.load_time_max, 3),
+            "window_tokens_avg": round(self.window_tokens_total / loads, 1),
+            "window_turns_avg": round(self.window_turns_total / loads, 2),
+            "compactions": self.compactions,
+            "compaction_failures": self.compaction_failures,
+            "compaction_time_avg_ms": round(1000 * self.compaction_time_total / (self.compactions or 1), 3),
+            "local_users": len(self._local),
+        }
@@ -0,0 +1,200 @@
+# apps/services/orchestrator-agent/retrieval.py
+"""Recuperação dos eventos relevantes para uma pergunta sobre a agenda
+
+Em vez de colocar a agenda inteira no prompt, a mensagem é analisada para
+extrair a janela de datas ("hoje", "amanhã", "semana que vem", "sexta",
+"20/01"...) e os tipos de evento citados ("reunião", "dentista"...). Só essa
+janela é consultada no calendar-service e os eventos são serializados em uma
+linha cada, até um limite de tokens.
+"""
+import calendar
+import re
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from memory import estimate_tokens
+from router import normalize, tokenize
+
+WEEKDAYS = {
+    "segunda": 0, "terca": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sabado": 5, "domingo": 6,
+}
+
+# Palavras da mensagem -> tipos de evento do calendar-service
+TYPE_KEYWORDS = {
+    "reuniao": ["meeting"], "reunioes": ["meeting"],
+    "apresentacao": ["presentation"], "apresentacoes": ["presentation"],
+    "call": ["call"], "calls": ["call"], "ligacao": ["call"], "ligacoes": ["call"], "chamada": ["call"],
+    "feriado": ["holiday"], "feriados": ["holiday"],
+    "consulta": ["appointment"], "consultas": ["appointment"], "dentista": ["appointment"],
+    "medico": ["appointment"],
+    "academia": ["exercise"], "treino": ["exercise"], "treinos": ["exercise"], "exercicio": ["exercise"],
+    "pessoal": ["holiday", "personal", "appointment", "exercise"],
+    "pessoais": ["holiday", "personal", "appointment", "exercise"],
+    "profissional": ["meeting", "presentation", "call"],
+    "profissionais": ["meeting", "presentation", "call"],
+    "trabalho": ["meeting", "presentation", "call"],
+}
+
+_DATE_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+_NEXT_DAYS_RE = re.compile(r"\bproximos?\s+(\d{1,3})\s+dias\b")
+
+
+@dataclass
+class DateWindow:
+    start: date
+    end: date
+    label: str
+
+
+@dataclass
+class CalendarContext:
+    window: DateWindow
+    types: List[str] = field(default_factory=list)
+    text: str = ""
+    considered: int = 0
+    more: bool = False  # A janela tem mais eventos que os lidos (`considered` é um mínimo)
+    included: int = 0
+    tokens: int = 0
+
+
+def week_bounds(day: date):
+    monday = day - timedelta(days=day.weekday())
+    return monday, monday + timedelta(days=6)
+
+
+def month_bounds(year: int, month: int):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def parse_date_window(message: str, today: date) -> Optional[DateWindow]:
+    """Janela de datas citada na mensagem (None quando não há referência a datas)"""
+    text = normalize(message)
+    tokens = tokenize(message)
+    words = set(tokens)
+
+    match = _DATE_RE.search(text)
+    if match:
+        day, month, year = match.groups()
+        year = int(year) + (2000 if len(year) == 2 else 0) if year else today.year
+        try:
+            target = date(year, int(month), int(day))
+            return DateWindow(target, target, "data")
+        except ValueError:
+            pass
+
+    match = _NEXT_DAYS_RE.search(text)
+    if match:
+        return DateWindow(today, today + timedelta(days=int(match.group(1))), "próximos dias")
+
+    if "depois de amanha" in text:
+        target = today + timedelta(days=2)
+        return DateWindow(target, target, "depois de amanhã")
+    if "amanha" in words:
+        target = today + timedelta(days=1)
+        return DateWindow(target, target, "amanhã")
+    if "hoje" in words:
+        return DateWindow(today, today, "hoje")
+    if "ontem" in words:
+        target = today - timedelta(days=1)
+        return DateWindow(target, target, "ontem")
+
+    if "fim de semana" in text or "final de semana" in text:
+        if today.weekday() == 6:  # Domingo: o fim de semana é hoje
+            return DateWindow(today, today, "fim de semana")
+        saturday = today + timedelta(days=5 - today.weekday()) if today.weekday() < 5 else today
+        return DateWindow(saturday, saturday + timedelta(days=1), "fim de semana")
+
+    for index, token in enumerate(tokens):
+        if token in WEEKDAYS:
+            # Próxima ocorrência do dia da semana (hoje conta)
+            offset = (WEEKDAYS[token] - today.weekday()) % 7
+            if offset == 0 and index > 0 and tokens[index - 1] in ("proxima", "proximo"):
+                offset = 7
+            target = today + timedelta(days=offset)
+            return DateWindow(target, target, token)
+
+    if "semana" in words:
+        monday, sunday = week_bounds(today)
+        if "passada" in words or "anterior" in words:
+            return DateWindow(monday - timedelta(days=7), sunday - timedelta(days=7), "semana passada")
+        if "proxima" in words or "que vem" in text:
+            return DateWindow(monday + timedelta(days=7), sunday + timedelta(days=7), "próxima semana")
+        return DateWindow(today, sunday, "esta semana")
+
+    if "mes" in words:
+        if "passado" in words or "anterior" in words:
+            last_month = today.replace(day=1) - timedelta(days=1)
+            start, end = month_bounds(last_month.year, last_month.month)
+            return DateWindow(start, end, "mês passado")
+        if "proximo" in words or "que vem" in text:
+            next_month = month_bounds(today.year, today.month)[1] + timedelta(days=1)
+            start, end = month_bounds(next_month.year, next_month.month)
+            return DateWindow(start, end, "próximo mês")
+        return DateWindow(today, month_bounds(today.year, today.month)[1], "este mês")
+
+    return None
+
+
+def parse_event_types(message: str) -> List[str]:
+    types: List[str] = []
+    for token in tokenize(message):
+        for event_type in TYPE_KEYWORDS.get(token, ()):
+            if event_type not in types:
+                types.append(event_type)
+    return types
+
+
+def render_events(events: List[Dict[str, Any]], max_tokens: int, more: bool = False):
+    """Uma linha por evento ("2025-01-20 meeting: Reunião equipe") até o limite de tokens
+
+    Com `more` (havia mais eventos do que os lidos) a contagem dos omitidos sai como "N+".
+    """
+    lines: List[str] = []
+    used = 0
+    for event in events:
+        line = f"{event['date']} {event.get('type') or 'event'}: {event['title']}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    included = len(lines)
+    omitted = len(events) - included
+    if more:
+        lines.append(f"(+{omitted}+ eventos não listados)" if omitted else "(há mais eventos no período)")
+    elif omitted:
+        lines.append(f"(+{omitted} eventos não listados)")
+    return "\n".join(lines), included, used
+
+
+class RetrievalStats:
+    """Totais de eventos considerados (na janela) x incluídos no prompt"""
+
+    def __init__(self):
+        self.requests = 0
+        self.considered = 0
+        self.truncated = 0
+        self.included = 0
+        self.tokens = 0
+        self.windows: Dict[str, int] = {}
+
+    def record(self, context: CalendarContext):
+        self.requests += 1
+        self.considered += context.considered
+        self.truncated += context.more
+        self.included += context.included
+        self.tokens += context.tokens
+        self.windows[context.window.label] = self.windows.get(context.window.label, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.requests or 1
+        return {
+            "requests": self.requests,
+            # Soma dos eventos lidos; em `windows_truncated` consultas a janela tinha ainda mais
+            "events_considered": self.considered,
+            "windows_truncated": self.truncated,
+            "events_included": self.included,
+            "context_tokens_avg": round(self.tokens / requests, 1),
+            "windows": dict(self.windows),
+        }
@@ -0,0 +1,232 @@
+# apps/services/orchestrator-agent/router.py
+"""Roteador de intenções do orquestrador
+
+As palavras-chave de todos os agentes são compiladas num índice de tokens
+(sem acentos, por palavra inteira), então o custo de rotear uma mensagem
+depende do tamanho da mensagem e não do número de agentes/palavras-chave.
+Opcionalmente, quando nenhuma palavra-chave casa, um classificador barato
+(n-gramas de caracteres com hashing + similaridade do cosseno) sugere uma rota
+com um nível de confiança.
+"""
+import math
+import re
+import time
+import unicodedata
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+GENERAL_ROUTE = "general"
+CALENDAR_ROUTE = "calendar"
+
+CALENDAR_KEYWORDS = [
+    "agenda", "agendas", "calendário", "calendários", "compromisso", "compromissos",
+    "evento", "eventos", "reunião", "reuniões", "marcar", "agendar", "data", "datas",
+    "horário", "horários", "quando", "hoje", "amanhã", "semana", "mês",
+]
+
+_TOKEN_RE = re.compile(r"\w+")
+# Fronteiras candidatas entre pedidos numa mesma mensagem ("o que tenho amanhã e resuma X");
+# também cortam pedidos únicos ("reunião de pais e mestres"), então quem decide é `plan_clauses`
+_CLAUSE_RE = re.compile(r"[;?!]+|\.\s+|\s+(?:e|and|também|além disso|depois)\s+", re.IGNORECASE)
+
+
+def normalize(text: str) -> str:
+    """Minúsculas e sem acentos ("Reunião" -> "reuniao")"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def split_clauses(message: str) -> List[str]:
+    """Divide a mensagem em trechos que podem ser pedidos independentes"""
+    return [part.strip() for part in _CLAUSE_RE.split(message) if part and part.strip()]
+
+
+@dataclass
+class Route:
+    name: str
+    keywords: List[str] = field(default_factory=list)
+    agent_id: Optional[int] = None
+    label: str = ""
+    description: str = ""  # Texto usado pelo classificador
+
+
+@dataclass
+class RouteMatch:
+    route: str
+    agent_id: Optional[int]
+    label: str
+    score: float
+    confidence: float
+    tier: str  # "keywords", "classifier" ou "default"
+    matched: List[str] = field(default_factory=list)
+
+
+class KeywordIndex:
+    """Índice primeiro-token -> frases; cada palavra-chave pode ter várias palavras"""
+
+    def __init__(self, routes: List[Route]):
+        self._index: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        self.keyword_count = 0
+        for route in routes:
+            for keyword in route.keywords:
+                phrase = tuple(tokenize(keyword))
+                if not phrase:
+                    continue
+                self._index.setdefault(phrase[0], []).append((phrase, route.name))
+                self.keyword_count += 1
+
+    def match(self, tokens: List[str]) -> Dict[str, List[str]]:
+        found: Dict[str, List[str]] = {}
+        for i, token in enumerate(tokens):
+            for phrase, route in self._index.get(token, ()):
+                if len(phrase) == 1 or tuple(tokens[i:i + len(phrase)]) == phrase:
+                    found.setdefault(route, []).append(" ".join(phrase))
+        return found
+
+
+class HashingClassifier:
+    """Classificador por centróides de trigramas de caracteres (hashing em dimensão fixa)"""
+
+    def __init__(self, routes: List[Route], dimensions: int = 1 << 16):
+        self.dimensions = dimensions
+        # Índice invertido feature -> [(rota, peso)] para só tocar nas rotas relevantes
+        self._postings: Dict[int, List[Tuple[str, float]]] = {}
+        for route in routes:
+            text = " ".join([route.label, route.description] + route.keywords)
+            vector = self._vectorize(text)
+            for feature, weight in vector.items():
+                self._postings.setdefault(feature, []).append((route.name, weight))
+
+    def _vectorize(self, text: str) -> Dict[int, float]:
+        counts: Dict[int, float] = {}
+        for token in tokenize(text):
+            padded = f" {token} "
+            for i in range(len(padded) - 2):
+                feature = zlib.crc32(padded[i:i + 3].encode()) % self.dimensions
+                counts[feature] = counts.get(feature, 0.0) + 1.0
+        norm = math.sqrt(sum(v * v for v in counts.values())) or 1.0
+        return {feature: value / norm for feature, value in counts.items()}
+
+    def scores(self, text: str) -> Dict[str, float]:
+        scores: Dict[str, float] = {}
+        for feature, weight in self._vectorize(text).items():
+            for route, route_weight in self._postings.get(feature, ()):
+                scores[route] = scores.get(route, 0.0) + weight * route_weight
+        return scores
+
+
+class IntentRouter:
+    """Escolhe as rotas de uma mensagem; o índice é recompilado quando os agentes mudam"""
+
+    def __init__(self, builtin_routes: List[Route], default_route: Route,
+                 classifier_enabled: bool = False, classifier_threshold: float = 0.35):
+        self.builtin_routes = builtin_routes
+        self.default_route = default_route
+        self.classifier_enabled = classifier_enabled
+        self.classifier_threshold = classifier_threshold
+        self.routes: Dict[str, Route] = {}
+        self._index = KeywordIndex([])
+        self._classifier: Optional[HashingClassifier] = None
+        self.compile_ms = 0.0
+        self.calls = 0
+        self.route_time_total = 0.0
+        self.tier_counts: Dict[str, int] = {}
+        self.compile(builtin_routes)
+
+    def compile(self, routes: List[Route]):
+        started = time.perf_counter()
+        routes_by_name = {route.name: route for route in routes}
+        index = KeywordIndex(list(routes_by_name.values()))
+        classifier = HashingClassifier(list(routes_by_name.values())) if self.classifier_enabled else None
+        # Troca atômica: requisições em andamento continuam usando o índice anterior
+        self.routes, self._index, self._classifier = routes_by_name, index, classifier
+        self.compile_ms = (time.perf_counter() - started) * 1000
+
+    def update_agents(self, agent_routes: List[Route]):
+        self.compile(self.builtin_routes + agent_routes)
+
+    def route(self, message: str) -> List[RouteMatch]:
+        """Rotas candidatas ordenadas pela pontuação (sempre ao menos uma)"""
+        started = time.perf_counter()
+        tokens = tokenize(message)
+        matches: List[RouteMatch] = []
+
+        found = self._index.match(tokens)
+        if found:
+            # Frases mais longas pesam mais ("gastos do mês" vence "mês")
+            weights = {name: sum(len(phrase.split()) for phrase in words) for name, words in found.items()}
+            total = sum(weights.values())
+            for name, words in found.items():
+                route = self.routes[name]
+                matches.append(RouteMatch(
+                    route=name, agent_id=route.agent_id, label=route.label,
+                    score=float(weights[name]), confidence=weights[name] / total,
+                    tier="keywords", matched=words,
+                ))
+        elif self._classifier is not None and tokens:
+            for name, score in self._classifier.scores(message).items():
+                if score >= self.classifier_threshold:
+                    route = self.routes[name]
+                    matches.append(RouteMatch(
+                        route=name, agent_id=route.agent_id, label=route.label,
+                        score=score, confidence=min(1.0, score), tier="classifier",
+                    ))
+
+        if not matches:
+            route = self.default_route
+            matches.append(RouteMatch(route=route.name, agent_id=route.agent_id, label=route.label,
+                                      score=0.0, confidence=1.0, tier="default"))
+        matches.sort(key=lambda m: m.score, reverse=True)
+
+        self.calls += 1
+        self.route_time_total += time.perf_counter() - started
+        self.tier_counts[matches[0].tier] = self.tier_counts.get(matches[0].tier, 0) + 1
+        return matches
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "routes": len(self.routes),
+            "keywords": self._index.keyword_count,
+            "classifier_enabled": self._classifier is not None,
+            "compile_ms": round(self.compile_ms, 3),
+            "calls": self.calls,
+            "route_time_avg_us": round(1e6 * self.route_time_total / self.calls, 2) if self.calls else 0.0,
+            "tiers": dict(self.tier_counts),
+        }
+
+
+def plan_clauses(message: str, route: Callable[[str], List[RouteMatch]], min_confidence: float = 0.6,
+                 min_tokens: int = 3) -> List[Tuple[RouteMatch, List[str]]]:
+    """Trechos da mensagem agrupados por rota, na ordem: [(RouteMatch, [trechos]), ...]
+
+    Só abre grupo o trecho com rota confiante (palavras-chave ou classificador,
+    confiança >= `min_confidence`, ao menos `min_tokens` tokens); os demais
+    ficam com o pedido vizinho. Sem duas rotas confiantes diferentes, a
+    mensagem inteira segue para a melhor rota.
+    """
+    segments = split_clauses(message)
+    groups: Dict[str, Tuple[RouteMatch, List[str]]] = {}
+    pending: List[str] = []
+    last: Optional[str] = None
+    for segment in segments if len(segments) > 1 else ():
+        match = route(segment)[0]
+        if (match.tier == "default" or match.confidence < min_confidence
+                or len(tokenize(segment)) < min_tokens):
+            if last is None:
+                pending.append(segment)
+            else:
+                groups[last][1].append(segment)
+            continue
+        last = match.route
+        parts = groups.setdefault(match.route, (match, []))[1]
+        parts.extend(pending)
+        parts.append(segment)
+        pending = []
+    if len(groups) < 2:
+        return [(route(message)[0], [message])]
+    return list(groups.values())
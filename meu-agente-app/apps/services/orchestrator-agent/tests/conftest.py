@@ -0,0 +1,7 @@
+# apps/services/orchestrator-agent/tests/conftest.py
+"""Os testes importam os módulos do serviço como o uvicorn os vê (o serviço e `shared` no path)"""
+import sys
+from pathlib import Path
+
+SERVICE_DIR = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(SERVICE_DIR), str(SERVICE_DIR.parent)]
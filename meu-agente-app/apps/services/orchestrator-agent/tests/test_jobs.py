@@ -0,0 +1,153 @@
+# apps/services/orchestrator-agent/tests/test_jobs.py
+"""Fila de jobs de chat: fila em memória e recuperação dos jobs interrompidos no Redis"""
+import asyncio
+import json
+import time
+
+import pytest
+
+import jobs
+from jobs import DONE, FAILED, JOB_KEY_PREFIX, PROCESSING_KEY_PREFIX, QUEUE_KEY, QUEUED, JobQueue, QueueFullError
+
+
+async def echo(request):
+    if request.get("fail"):
+        raise ValueError("handler falhou")
+    return {"reply": request["message"].upper()}
+
+
+def test_enqueue_and_wait_for_result():
+    async def main():
+        queue = JobQueue(None, echo, workers=2)
+        await queue.start()
+        try:
+            job = await queue.enqueue({"message": "oi"})
+            assert job["status"] == QUEUED and job["position"] == 1
+            return await queue.wait(job["id"], timeout=2), queue.stats()
+        finally:
+            await queue.close()
+
+    done, stats = asyncio.run(main())
+    assert done["status"] == DONE
+    assert done["result"] == {"reply": "OI"}
+    assert done["finished_at"] >= done["started_at"] >= done["created_at"]
+    assert stats["completed"] == 1 and stats["busy"] == 0 and stats["backend"] == "memory"
+
+
+def test_handler_error_marks_job_failed_and_worker_continues():
+    async def main():
+        queue = JobQueue(None, echo, workers=1)
+        await queue.start()
+        try:
+            failed = await queue.enqueue({"message": "x", "fail": True})
+            ok = await queue.enqueue({"message": "y"})
+            return await queue.wait(failed["id"], 2), await queue.wait(ok["id"], 2), queue.stats()
+        finally:
+            await queue.close()
+
+    failed, ok, stats = asyncio.run(main())
+    assert failed["status"] == FAILED and failed["error"] == "handler falhou"
+    assert ok["status"] == DONE
+    assert stats["failed"] == 1 and stats["completed"] == 1
+
+
+def test_storage_error_fails_job_without_killing_worker():
+    async def main():
+        queue = JobQueue(None, echo, workers=1)
+        save = queue._save
+        broken = set()
+
+        async def flaky_save(job_id, fields):
+            # Primeira gravação de "running" falha, como um Redis fora do ar
+            if fields.get("status") == "running" and not broken:
+                broken.add(job_id)
+                raise ConnectionError("redis fora")
+            await save(job_id, fields)
+
+        queue._save = flaky_save
+        await queue.start()
+        try:
+            first = await queue.enqueue({"message": "a"})
+            second = await queue.enqueue({"message": "b"})
+            return await queue.wait(first["id"], 2), await queue.wait(second["id"], 2), queue._tasks
+        finally:
+            await queue.close()
+
+    first, second, tasks = asyncio.run(main())
+    assert first["status"] == FAILED and first["error"] == "redis fora"
+    assert second["status"] == DONE
+    assert all(task.cancelled() for task in tasks)  # Só pararam no close
+
+
+def test_full_queue_rejects_and_wait_times_out():
+    async def main():
+        queue = JobQueue(None, echo, workers=0, max_depth=2)
+        await queue.start()
+        try:
+            first = await queue.enqueue({"message": "a"})
+            await queue.enqueue({"message": "b"})
+            with pytest.raises(QueueFullError):
+                await queue.enqueue({"message": "c"})
+            started = time.monotonic()
+            pending = await queue.wait(first["id"], timeout=0.1)
+            return pending, time.monotonic() - started, queue.stats(), await queue.wait("nao-existe", 1)
+        finally:
+            await queue.close()
+
+    pending, waited, stats, missing = asyncio.run(main())
+    assert pending["status"] == QUEUED and 0.1 <= waited < 1
+    assert stats["rejected"] == 1 and stats["depth"] == 2
+    assert missing is None
+
+
+def test_requeue_orphans_moves_processing_lists_back_to_queue():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        await redis.lpush(QUEUE_KEY, "novo")
+        await redis.lpush(f"{PROCESSING_KEY_PREFIX}api-1:0", "a")
+        await redis.lpush(f"{PROCESSING_KEY_PREFIX}api-1:1", "b", "c")
+        await redis.lpush(f"{PROCESSING_KEY_PREFIX}api-2:0", "de-outra-instancia")
+        queue = JobQueue("redis://fake", echo, worker_id="api-1")
+        queue._redis = redis
+        await queue._requeue_orphans()
+        return (queue.requeued, await redis.lrange(QUEUE_KEY, 0, -1),
+                [key async for key in redis.scan_iter(match=f"{PROCESSING_KEY_PREFIX}*")])
+
+    requeued, queued, processing = asyncio.run(main())
+    assert requeued == 3
+    # Os interrompidos vão para a ponta que os workers consomem (direita), antes do job novo
+    assert queued[0] == "novo" and sorted(queued[1:]) == ["a", "b", "c"]
+    assert processing == [f"{PROCESSING_KEY_PREFIX}api-2:0"]
+
+
+def test_interrupted_job_is_processed_after_restart(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(jobs.aioredis, "from_url",
+                        lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=server, **kwargs))
+
+    async def main():
+        redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        # Estado deixado por uma instância que caiu no meio do job
+        job = {"id": "j1", "status": "running", "request": {"message": "oi"}, "created_at": time.time()}
+        await redis.hset(JOB_KEY_PREFIX + "j1", mapping={k: json.dumps(v) for k, v in job.items()})
+        await redis.lpush(f"{PROCESSING_KEY_PREFIX}api-1:0", "j1")
+
+        queue = JobQueue("redis://fake", echo, workers=1, worker_id="api-1")
+        await queue.start()
+        try:
+            done = await queue.wait("j1", timeout=3)
+            fresh = await queue.wait((await queue.enqueue({"message": "tchau"}))["id"], timeout=3)
+            leftovers = [key async for key in redis.scan_iter(match=f"{PROCESSING_KEY_PREFIX}*")]
+            lengths = [await redis.llen(key) for key in leftovers]
+            return done, fresh, queue.stats(), lengths
+        finally:
+            await queue.close()
+
+    done, fresh, stats, lengths = asyncio.run(main())
+    assert stats["backend"] == "redis" and stats["requeued"] == 1
+    assert done["status"] == DONE and done["result"] == {"reply": "OI"}
+    assert fresh["status"] == DONE
+    assert sum(lengths) == 0  # Confirmados: nada sobra nas listas de processamento
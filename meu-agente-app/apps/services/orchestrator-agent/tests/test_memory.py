@@ -0,0 +1,116 @@
+# apps/services/orchestrator-agent/tests/test_memory.py
+"""Janela por tokens e compactação da memória de conversa (em memória e no Redis)"""
+import asyncio
+import json
+
+import pytest
+
+from memory import COMPACT_TARGET_RATIO, ConversationMemory, estimate_tokens
+
+
+def turn(role: str, content: str):
+    return {"role": role, "content": content, "tokens": estimate_tokens(content)}
+
+
+async def settle(memory: ConversationMemory):
+    """Espera as compactações agendadas pelo append"""
+    while memory._compacting:
+        await asyncio.gather(*list(memory._compacting.values()))
+
+
+def test_load_keeps_newest_turns_that_fit():
+    memory = ConversationMemory(window_tokens=100)
+    state = memory._local_state("u")
+    state["turns"] = [turn("user", f"{i}" * 120) for i in range(5)]  # 30 tokens cada
+
+    window = asyncio.run(memory.load("u"))
+    assert [t["content"][0] for t in window.turns] == ["2", "3", "4"]
+    assert window.tokens == 90
+    assert window.messages() == [{"role": "user", "content": t["content"]} for t in window.turns]
+
+
+def test_summary_uses_part_of_the_budget():
+    memory = ConversationMemory(window_tokens=100)
+    state = memory._local_state("u")
+    state["summary"] = "s" * 160  # 40 tokens
+    state["turns"] = [turn("user", f"{i}" * 120) for i in range(5)]
+
+    window = asyncio.run(memory.load("u"))
+    assert [t["content"][0] for t in window.turns] == ["3", "4"]
+    assert window.tokens == 100
+    assert window.messages()[0]["role"] == "system"
+    assert window.messages()[0]["content"].endswith("s" * 160)
+
+
+def test_compaction_folds_oldest_turns_down_to_target():
+    async def main():
+        memory = ConversationMemory(window_tokens=200, summary_tokens=1000)
+        for i in range(6):
+            await memory.append("u", f"pergunta {i} " + "p" * 100, f"resposta {i} " + "r" * 100)
+        await settle(memory)
+        return memory
+
+    memory = asyncio.run(main())
+    state = memory._local_state("u")
+    kept = state["turns"]
+    assert memory.compactions >= 1
+    assert sum(t["tokens"] for t in kept) <= 200 * COMPACT_TARGET_RATIO
+    assert len(kept) >= 2
+    # As mais recentes ficam; as dobradas aparecem no resumo
+    assert kept[-1]["content"].startswith("resposta 5")
+    assert "Usuário: pergunta 0" in state["summary"]
+    assert "pergunta 5" not in state["summary"]
+
+
+def test_compaction_caps_turn_count():
+    async def main():
+        memory = ConversationMemory(window_tokens=10000, max_turns=8)
+        for i in range(5):
+            await memory.append("u", f"oi {i}", f"olá {i}")
+        await settle(memory)
+        return memory
+
+    memory = asyncio.run(main())
+    assert len(memory._local_state("u")["turns"]) == 4
+
+
+def test_failed_summarizer_falls_back_to_extractive():
+    async def broken(previous, turns, max_tokens):
+        raise RuntimeError("LLM fora")
+
+    async def main():
+        memory = ConversationMemory(window_tokens=50, summarizer=broken)
+        for i in range(4):
+            await memory.append("u", f"pergunta {i} " + "p" * 60, f"resposta {i} " + "r" * 60)
+        await settle(memory)
+        return memory
+
+    memory = asyncio.run(main())
+    assert memory.compaction_failures == 0
+    assert memory._local_state("u")["summary"].startswith("Usuário: pergunta 0")
+
+
+def test_redis_compaction_trims_list_and_token_counter():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def main():
+        memory = ConversationMemory(redis_url="redis://fake", window_tokens=200, summary_tokens=40)
+        memory._redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        for i in range(6):
+            await memory.append("u", f"pergunta {i} " + "p" * 100, f"resposta {i} " + "r" * 100)
+        await settle(memory)
+        turns_key, summary_key, tokens_key, lock_key = memory._keys("u")
+        raw = await memory._redis.lrange(turns_key, 0, -1)
+        tokens = int(await memory._redis.get(tokens_key))
+        summary = json.loads(await memory._redis.get(summary_key))["text"]
+        locked = await memory._redis.exists(lock_key)
+        window = await memory.load("u")
+        return [json.loads(item) for item in raw], tokens, summary, locked, window
+
+    kept, tokens, summary, locked, window = asyncio.run(main())
+    assert tokens == sum(t["tokens"] for t in kept) <= 200 * COMPACT_TARGET_RATIO
+    assert kept[-1]["content"].startswith("resposta 5")
+    assert "pergunta" in summary and estimate_tokens(summary) <= 41
+    assert not locked
+    assert window.summary == summary
+    assert window.turns[-1]["content"].startswith("resposta 5")
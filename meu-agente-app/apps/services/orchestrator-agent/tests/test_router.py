@@ -0,0 +1,48 @@
+# apps/services/orchestrator-agent/tests/test_router.py
+"""Divisão de mensagens em pedidos por agente (plan_clauses)"""
+from router import (CALENDAR_KEYWORDS, CALENDAR_ROUTE, GENERAL_ROUTE, IntentRouter, Route,
+                    plan_clauses, split_clauses)
+
+
+def make_router() -> IntentRouter:
+    router = IntentRouter(
+        builtin_routes=[Route(name=CALENDAR_ROUTE, keywords=CALENDAR_KEYWORDS, label="Agenda Service")],
+        default_route=Route(name=GENERAL_ROUTE, agent_id=1, label="Assistente Geral"),
+    )
+    router.update_agents([
+        Route(name="agent:7", keywords=["livro", "resuma", "resumo"], agent_id=7, label="Leitura"),
+    ])
+    return router
+
+
+def plan(message: str):
+    return [(match.route, parts) for match, parts in plan_clauses(message, make_router().route)]
+
+
+def test_question_with_e_is_not_split():
+    message = "Quando foi a Revolução Francesa e quais suas causas?"
+    assert len(split_clauses(message)) == 2
+    assert plan(message) == [(CALENDAR_ROUTE, [message])]
+
+
+def test_e_inside_a_single_request_is_not_split():
+    message = "reunião de pais e mestres amanhã"
+    assert plan(message) == [(CALENDAR_ROUTE, [message])]
+
+
+def test_confident_requests_for_different_agents_are_split():
+    assert plan("o que tenho na agenda amanhã e resuma o livro Dom Casmurro") == [
+        (CALENDAR_ROUTE, ["o que tenho na agenda amanhã"]),
+        ("agent:7", ["resuma o livro Dom Casmurro"]),
+    ]
+
+
+def test_unrouted_clauses_stay_with_a_neighbour():
+    assert plan("me diga uma coisa; o que tenho na agenda amanhã e resuma o livro Dom Casmurro") == [
+        (CALENDAR_ROUTE, ["me diga uma coisa", "o que tenho na agenda amanhã"]),
+        ("agent:7", ["resuma o livro Dom Casmurro"]),
+    ]
+
+
+def test_single_clause_goes_to_best_route():
+    assert plan("resuma o livro Dom Casmurro") == [("agent:7", ["resuma o livro Dom Casmurro"])]
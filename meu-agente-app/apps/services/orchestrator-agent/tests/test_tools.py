@@ -0,0 +1,104 @@
+# apps/services/orchestrator-agent/tests/test_tools.py
+"""Execução de ferramentas (ToolRuntime) contra um httpx.MockTransport"""
+import asyncio
+import json
+
+import httpx
+
+from tools import ToolCall, ToolRuntime
+
+SPECS = [
+    {"name": "ver_evento", "apiEndpoint": "/api/calendar/events/{id}",
+     "parameters": [{"name": "id", "type": "string", "required": True}]},
+    {"name": "consultar_agenda", "apiEndpoint": "/api/calendar/events",
+     "parameters": [{"name": "data_inicio", "type": "data", "field": "from"}]},
+    {"name": "criar_evento", "apiEndpoint": "/api/calendar/create",
+     "parameters": [{"name": "titulo", "field": "title"}]},
+    {"name": "lento", "apiEndpoint": "/api/calendar/slow", "timeout": 0.05},
+]
+
+
+def run(handler, calls, **options):
+    """Executa as chamadas; devolve (resultados, requisições que chegaram ao transporte)"""
+    seen = []
+
+    async def transport(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return await handler(request)
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(transport)) as client:
+            runtime = ToolRuntime(lambda: client, {"/api/calendar": "http://calendar"}, **options)
+            return await runtime.execute(runtime.compile(SPECS), calls, "user-1")
+
+    return asyncio.run(main()), seen
+
+
+async def echo(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"path": request.url.raw_path.decode()})
+
+
+def test_path_values_are_percent_encoded():
+    results, seen = run(echo, [ToolCall("1", "ver_evento", {"id": "a b?user_id=outro#x"})])
+    assert results[0].status == "ok"
+    assert seen[0].url.raw_path == b"/events/a%20b%3Fuser_id%3Doutro%23x?user_id=user-1"
+
+
+def test_path_values_with_slash_or_dots_are_rejected():
+    calls = [ToolCall(str(i), "ver_evento", {"id": value})
+             for i, value in enumerate(["../agents/1", "x/y", "..", "."])]
+    results, seen = run(echo, calls)
+    assert seen == []
+    assert [result.status for result in results] == ["error"] * 4
+    assert "Valor inválido" in json.loads(results[0].content)["error"]
+
+
+def test_unknown_endpoints_and_tools_are_not_called():
+    runtime = ToolRuntime(lambda: None, {"/api/calendar": "http://calendar"})
+    toolset = runtime.compile([{"name": "outro", "apiEndpoint": "/api/agents/1"},
+                               {"name": "externo", "apiEndpoint": "http://evil.example/x"}])
+    assert toolset is None
+
+    results, seen = run(echo, [ToolCall("1", "apagar_tudo", {})])
+    assert seen == []
+    assert results[0].status == "error"
+    assert "Ferramenta desconhecida" in results[0].content
+
+
+def test_arguments_go_to_query_or_body():
+    results, seen = run(echo, [ToolCall("1", "consultar_agenda", {"data_inicio": "2025-01-20"}),
+                               ToolCall("2", "criar_evento", {"titulo": "Dentista"})])
+    assert [result.status for result in results] == ["ok", "ok"]
+    assert dict(seen[0].url.params) == {"from": "2025-01-20", "user_id": "user-1"}
+    assert seen[1].method == "POST"
+    assert json.loads(seen[1].content) == {"title": "Dentista", "user_id": "user-1"}
+
+
+def test_calls_per_round_are_capped():
+    calls = [ToolCall(str(i), "consultar_agenda", {}) for i in range(3)]
+    results, seen = run(echo, calls, max_calls=2)
+    assert len(seen) == 2
+    assert [result.status for result in results] == ["ok", "ok", "error"]
+    assert [result.call.id for result in results] == ["0", "1", "2"]
+
+
+def test_large_results_are_truncated():
+    async def large(request):
+        return httpx.Response(200, text="x" * 5000)
+
+    results, _ = run(large, [ToolCall("1", "consultar_agenda", {})], max_result_bytes=100)
+    assert results[0].status == "truncated"
+    assert results[0].content == "x" * 100 + "\n[resultado truncado]"
+
+
+def test_http_errors_and_timeouts_become_results():
+    async def handler(request):
+        if request.url.path == "/slow":
+            await asyncio.sleep(1)
+        return httpx.Response(404, text="not found")
+
+    results, _ = run(handler, [ToolCall("1", "consultar_agenda", {}), ToolCall("2", "lento", {})])
+    assert results[0].status == "error"
+    assert json.loads(results[0].content) == {"error": "HTTP 404", "detail": "not found"}
+    assert results[1].status == "timeout"
+    assert json.loads(results[1].content) == {"error": "Sem resposta em 0.05s"}
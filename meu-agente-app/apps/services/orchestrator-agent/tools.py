@@ -0,0 +1,290 @@
+# apps/services/orchestrator-agent/tools.py
+"""Ferramentas dos agentes: specs cadastradas -> function calling do LLM -> chamadas HTTP
+
+Cada agente guarda em `tools` uma lista como
+
+    {"name": "consultar_agenda", "description": "...", "apiEndpoint": "/api/calendar/events",
+     "method": "GET", "timeout": 3,
+     "parameters": [{"name": "data_inicio", "type": "data", "field": "from", "required": true}]}
+
+`method` (padrão GET, ou POST para nomes como criar_/adicionar_), `timeout`,
+`field` (nome do campo no serviço) e `required` são opcionais. A lista é
+compilada uma vez por agente em schemas de function calling e reaproveitada
+enquanto a configuração não mudar (LRU).
+
+As chamadas que o modelo pede numa mesma rodada rodam em paralelo sobre o pool
+HTTP do orquestrador, cada uma com seu timeout; a resposta é lida até
+`max_result_bytes` e truncada além disso. Só endpoints de serviços conhecidos
+(`routes`: prefixo -> URL interna) são aceitos.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from shared.instrumentation import metrics, span, tracer
+
+logger = logging.getLogger(__name__)
+
+# Tipos aceitos nas specs (inclusive os nomes usados na tela de configurações)
+PARAMETER_TYPES = {
+    "string": {"type": "string"},
+    "texto": {"type": "string"},
+    "data": {"type": "string", "format": "date", "description": "Data no formato AAAA-MM-DD"},
+    "date": {"type": "string", "format": "date", "description": "Data no formato AAAA-MM-DD"},
+    "number": {"type": "number"},
+    "numero": {"type": "number"},
+    "integer": {"type": "integer"},
+    "inteiro": {"type": "integer"},
+    "boolean": {"type": "boolean"},
+}
+WRITE_PREFIXES = ("criar", "create", "adicionar", "add", "agendar", "registrar", "atualizar", "update")
+
+tool_calls_total = metrics.counter("tool_calls_total", "Chamadas de ferramentas por resultado", ["service", "tool", "status"])
+tool_call_seconds = metrics.histogram("tool_call_seconds", "Duração das chamadas de ferramentas", ["service", "tool"])
+
+
+class ToolSpecError(ValueError):
+    pass
+
+
+@dataclass
+class ToolParameter:
+    name: str
+    schema: Dict[str, Any]
+    field: str
+    required: bool = False
+
+
+@dataclass
+class Tool:
+    name: str
+    description: str
+    method: str
+    url: str
+    parameters: List[ToolParameter]
+    timeout: float
+
+    def schema(self) -> Dict[str, Any]:
+        """Formato `tools` da API de chat completions"""
+        return {"type": "function", "function": {
+            "name": self.name,
+            "description": self.description,
+            "parameters": {
+                "type": "object",
+                "properties": {p.name: p.schema for p in self.parameters},
+                "required": [p.name for p in self.parameters if p.required],
+            },
+        }}
+
+
+@dataclass
+class ToolSet:
+    tools: Dict[str, Tool]
+    schemas: List[Dict[str, Any]]
+
+
+@dataclass
+class ToolCall:
+    id: str
+    name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ToolResult:
+    call: ToolCall
+    status: str  # ok | truncated | error | timeout
+    content: str
+    elapsed: float = 0.0
+
+    def message(self) -> Dict[str, Any]:
+        """Mensagem `tool` devolvida ao modelo"""
+        return {"role": "tool", "tool_call_id": self.call.id, "content": self.content}
+
+
+class ToolRuntime:
+    def __init__(self, client: Callable[[], httpx.AsyncClient], routes: Dict[str, str],
+                 timeout: float = 5.0, max_timeout: float = 30.0, max_result_bytes: int = 8000,
+                 max_calls: int = 8, cache_size: int = 256):
+        self._client = client
+        # Prefixos mais longos primeiro ("/api/calendar" antes de "/api")
+        self.routes = sorted(((prefix.rstrip("/"), url.rstrip("/")) for prefix, url in routes.items()),
+                             key=lambda item: len(item[0]), reverse=True)
+        self.timeout = timeout
+        self.max_timeout = max_timeout
+        self.max_result_bytes = max_result_bytes
+        self.max_calls = max_calls
+        self.cache_size = cache_size
+        self._compiled: "OrderedDict[str, Tuple[str, ToolSet]]" = OrderedDict()
+        self.compiles = 0
+        self.cache_hits = 0
+        self.calls: Dict[str, int] = {}
+        self.call_time_total = 0.0
+
+    # --- Compilação ---------------------------------------------------------
+
+    def toolset(self, key: str, raw_tools: Any) -> Optional[ToolSet]:
+        """ToolSet da configuração `raw_tools` (JSON ou lista), em cache por `key` enquanto não mudar"""
+        fingerprint = raw_tools if isinstance(raw_tools, str) else json.dumps(raw_tools, sort_keys=True, default=str)
+        cached = self._compiled.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            self._compiled.move_to_end(key)
+            self.cache_hits += 1
+            return cached[1]
+
+        self.compiles += 1
+        toolset = self.compile(raw_tools)
+        self._compiled[key] = (fingerprint, toolset)
+        self._compiled.move_to_end(key)
+        while len(self._compiled) > self.cache_size:
+            self._compiled.popitem(last=False)
+        return toolset
+
+    def compile(self, raw_tools: Any) -> Optional[ToolSet]:
+        """Specs inválidas (ou de endpoints desconhecidos) são ignoradas com aviso"""
+        if isinstance(raw_tools, str):
+            try:
+                raw_tools = json.loads(raw_tools or "[]")
+            except ValueError:
+                logger.warning("Ferramentas do agente não são JSON válido")
+                return None
+        tools: Dict[str, Tool] = {}
+        for spec in raw_tools if isinstance(raw_tools, list) else []:
+            try:
+                tool = self._compile_tool(spec)
+            except ToolSpecError as e:
+                logger.warning("Ferramenta ignorada: %s", e)
+                continue
+            tools[tool.name] = tool
+        if not tools:
+            return None
+        return ToolSet(tools=tools, schemas=[tool.schema() for tool in tools.values()])
+
+    def _compile_tool(self, spec: Any) -> Tool:
+        if not isinstance(spec, dict) or not spec.get("name"):
+            raise ToolSpecError("spec sem nome")
+        name = str(spec["name"]).strip().replace(" ", "_")
+        url = self._resolve(str(spec.get("apiEndpoint") or ""))
+        if url is None:
+            raise ToolSpecError(f"{name}: endpoint '{spec.get('apiEndpoint')}' não pertence a um serviço conhecido")
+        method = str(spec.get("method") or ("POST" if name.lower().startswith(WRITE_PREFIXES) else "GET")).upper()
+
+        parameters = []
+        for param in spec.get("parameters") or []:
+            if not isinstance(param, dict) or not param.get("name"):
+                raise ToolSpecError(f"{name}: parâmetro sem nome")
+            kind = str(param.get("type") or "string").lower()
+            schema = dict(PARAMETER_TYPES.get(kind, PARAMETER_TYPES["string"]))
+            if param.get("description"):
+                schema["description"] = str(param["description"])
+            parameters.append(ToolParameter(
+                name=str(param["name"]), schema=schema,
+                field=str(param.get("field") or param["name"]), required=bool(param.get("required")),
+            ))
+
+        timeout = min(float(spec.get("timeout") or self.timeout), self.max_timeout)
+        return Tool(name=name, description=str(spec.get("description") or name), method=method,
+                    url=url, parameters=parameters, timeout=timeout)
+
+    def _resolve(self, endpoint: str) -> Optional[str]:
+        """Endpoint como o gateway o expõe (/api/calendar/...) -> URL interna do serviço"""
+        for prefix, base_url in self.routes:
+            if endpoint == prefix or endpoint.startswith(prefix + "/"):
+                return base_url + endpoint[len(prefix):]
+        return None
+
+    # --- Execução -------------------------------------------------------------
+
+    async def execute(self, toolset: ToolSet, calls: List[ToolCall], user_id: str) -> List[ToolResult]:
+        """Executa as chamadas de uma rodada em paralelo; a ordem dos resultados é a das chamadas"""
+        with span("tools.execute", calls=len(calls)):
+            return list(await asyncio.gather(*[
+                self._call(toolset, call, user_id) if index < self.max_calls
+                else self._rejected(call, "Limite de chamadas de ferramentas por rodada atingido")
+                for index, call in enumerate(calls)
+            ]))
+
+    async def _rejected(self, call: ToolCall, detail: str) -> ToolResult:
+        return self._record(ToolResult(call, "error", json.dumps({"error": detail}, ensure_ascii=False)))
+
+    async def _call(self, toolset: ToolSet, call: ToolCall, user_id: str) -> ToolResult:
+        tool = toolset.tools.get(call.name)
+        if tool is None:
+            return await self._rejected(call, f"Ferramenta desconhecida: {call.name}")
+
+        url = tool.url
+        payload: Dict[str, Any] = {}
+        for param in tool.parameters:
+            value = call.arguments.get(param.name)
+            if value is None:
+                continue
+            placeholder = "{" + param.field + "}"
+            if placeholder in url:
+                # O valor vem do modelo: não pode sair do segmento nem trocar de rota
+                text = str(value)
+                if "/" in text or text in (".", ".."):
+                    return await self._rejected(call, f"Valor inválido para {param.name}: {text!r}")
+                url = url.replace(placeholder, quote(text, safe=""))
+            else:
+                payload[param.field] = value
+        payload.setdefault("user_id", user_id)
+        request_args = {"params": payload} if tool.method in ("GET", "DELETE") else {"json": payload}
+
+        started = time.perf_counter()
+        with span("tool.call", tool=tool.name, method=tool.method) as current:
+            try:
+                status, content = await asyncio.wait_for(self._fetch(tool.method, url, request_args), tool.timeout)
+            except asyncio.TimeoutError:
+                status, content = "timeout", json.dumps({"error": f"Sem resposta em {tool.timeout:g}s"})
+            except httpx.HTTPError as e:
+                status, content = "error", json.dumps({"error": str(e) or type(e).__name__}, ensure_ascii=False)
+            current.set_attribute("status", status)
+            current.set_attribute("result_chars", len(content))
+        return self._record(ToolResult(call, status, content, time.perf_counter() - started))
+
+    async def _fetch(self, method: str, url: str, request_args: Dict[str, Any]) -> Tuple[str, str]:
+        """Lê a resposta até o limite de bytes; o restante nem chega a ser baixado"""
+        body = bytearray()
+        truncated = False
+        async with self._client().stream(method, url, **request_args) as response:
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) > self.max_result_bytes:
+                    truncated = True
+                    break
+            status_code = response.status_code
+
+        text = bytes(body[:self.max_result_bytes]).decode("utf-8", errors="ignore")
+        if status_code >= 400:
+            return "error", json.dumps({"error": f"HTTP {status_code}", "detail": text[:500]}, ensure_ascii=False)
+        if truncated:
+            return "truncated", text + "\n[resultado truncado]"
+        try:
+            # JSON compacto ocupa menos do contexto do modelo
+            return "ok", json.dumps(json.loads(text), ensure_ascii=False, separators=(",", ":"))
+        except ValueError:
+            return "ok", text
+
+    def _record(self, result: ToolResult) -> ToolResult:
+        self.calls[result.status] = self.calls.get(result.status, 0) + 1
+        self.call_time_total += result.elapsed
+        tool_calls_total.inc(service=tracer.service_name, tool=result.call.name, status=result.status)
+        tool_call_seconds.observe(result.elapsed, service=tracer.service_name, tool=result.call.name)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.calls.values())
+        return {
+            "compiled": len(self._compiled),
+            "compiles": self.compiles,
+            "cache_hits": self.cache_hits,
+            "calls": dict(self.calls),
+            "call_time_avg_ms": round(1000 * self.call_time_total / total, 3) if total else 0.0,
+        }
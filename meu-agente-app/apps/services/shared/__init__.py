@@ -0,0 +1,6 @@
+"""Código compartilhado entre os serviços (instrumentação, logs...)
+
+Os serviços importam como `from shared.instrumentation import ...`; em
+desenvolvimento `apps/services` precisa estar no PYTHONPATH (o start-dev.sh
+já exporta) e nas imagens Docker a pasta é copiada para /app/shared.
+"""
@@ -0,0 +1,592 @@
+# apps/services/shared/instrumentation.py
+"""Tracing distribuído e métricas Prometheus para os serviços FastAPI
+
+Uso em cada serviço:
+
+    from shared.instrumentation import setup_instrumentation, span
+    setup_instrumentation(app, "api-gateway")
+
+- Propaga `traceparent` (W3C) e `X-Request-ID` entre os serviços: o middleware
+  continua o trace recebido e `TracingTransport` injeta os cabeçalhos nas
+  chamadas httpx, registrando um span por chamada upstream.
+- `span("nome")` mede trechos internos (roteamento, LLM...) e
+  `instrument_sqlalchemy(engine)` cria um span por query.
+- Todo span alimenta o histograma `span_duration_seconds` e as requisições
+  alimentam `http_server_request_duration_seconds`, expostos em `/metrics`.
+- Spans amostrados são exportados em lote para um coletor OTLP/HTTP (JSON) ou
+  para um arquivo JSON Lines, sem dependências extras.
+
+Variáveis: TRACING_EXPORTER (otlp | file | none), OTEL_EXPORTER_OTLP_ENDPOINT,
+TRACE_FILE, TRACE_SAMPLE_RATIO.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
+
+REQUEST_ID_HEADER = "x-request-id"
+TRACEPARENT_HEADER = "traceparent"
+
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+# --- Métricas ---------------------------------------------------------------
+
+class Histogram:
+    """Histograma com buckets fixos e labels, no formato de exposição do Prometheus"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()  # Spans de banco podem terminar em threads do threadpool
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [contagem por bucket..., soma, contagem total]
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key))
+            sep = "," if labels else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {count:g}')
+            lines.append(f'{self.name}_bucket{{{labels}{sep}le="+Inf"}} {series[-1]:g}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {series[-1]:g}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            labels = ",".join(f'{name}="{_escape(v)}"' for name, v in zip(self.labelnames, key))
+            lines.append(f"{self.name}{{{labels}}} {value:g}")
+        return lines
+
+
+class Gauge:
+    """Valor instantâneo; com `set_function` é lido na hora da coleta (ex.: tamanho de fila)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._functions[key] = function
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                items[key] = float(function())
+            except Exception:
+                continue
+        for key, value in items.items():
+            labels = ",".join(f'{name}="{_escape(v)}"' for name, v in zip(self.labelnames, key))
+            lines.append(f"{self.name}{{{labels}}} {value:g}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str],
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(name, documentation, labelnames, buckets)
+        return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str]) -> Counter:
+        if name not in self._metrics:
+            self._metrics[name] = Counter(name, documentation, labelnames)
+        return self._metrics[name]
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str]) -> Gauge:
+        if name not in self._metrics:
+            self._metrics[name] = Gauge(name, documentation, labelnames)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+http_duration = metrics.histogram(
+    "http_server_request_duration_seconds", "Duração das requisições HTTP recebidas",
+    ["service", "method", "route", "status"],
+)
+span_duration = metrics.histogram(
+    "span_duration_seconds", "Duração dos spans (chamadas upstream, queries, LLM, etapas internas)",
+    ["service", "name", "kind", "error"],
+)
+spans_dropped = metrics.counter(
+    "spans_dropped_total", "Spans descartados porque a fila de exportação estava cheia", ["service"],
+)
+
+
+# --- Spans ------------------------------------------------------------------
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    kind: str = "internal"
+    sampled: bool = True
+    request_id: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    error: Optional[str] = None
+    _started: float = field(default_factory=time.perf_counter, repr=False)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_request_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.request_id if span else None
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    match = _TRACEPARENT_RE.match((value or "").strip().lower())
+    if not match or match.group(2) == "0" * 32 or match.group(3) == "0" * 16:
+        return None
+    return match.group(2), match.group(3), bool(int(match.group(4), 16) & 1)
+
+
+class SpanExporter:
+    """Fila de spans exportada em lote por uma task em segundo plano"""
+
+    def __init__(self, service_name: str, mode: str = "none", endpoint: Optional[str] = None,
+                 file_path: Optional[str] = None, batch_size: int = 512, interval: float = 2.0,
+                 max_queue: int = 10000):
+        self.service_name = service_name
+        self.mode = mode
+        self.endpoint = (endpoint or "http://localhost:4318").rstrip("/")
+        self.file_path = file_path or f"traces-{service_name}.jsonl"
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: deque = deque()
+        self._max_queue = max_queue
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.exported = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("otlp", "file")
+
+    def export(self, span: Span):
+        if len(self._queue) >= self._max_queue:
+            spans_dropped.inc(service=self.service_name)
+            return
+        self._queue.append(span)  # deque.append é thread-safe
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        if self.mode == "otlp":
+            self._client = httpx.AsyncClient(timeout=5.0)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.failures += 1
+                logger.warning("Falha ao exportar spans: %s", e)
+
+    async def flush(self):
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if self.mode == "otlp" and self._client is not None:
+                response = await self._client.post(f"{self.endpoint}/v1/traces", json=self._otlp_payload(batch))
+                response.raise_for_status()
+            elif self.mode == "file":
+                lines = "".join(json.dumps(self._json_span(s), ensure_ascii=False) + "\n" for s in batch)
+                await asyncio.to_thread(self._append_file, lines)
+            self.exported += len(batch)
+
+    def _append_file(self, lines: str):
+        with open(self.file_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _json_span(self, span: Span) -> Dict[str, Any]:
+        return {
+            "service": self.service_name,
+            "name": span.name,
+            "kind": span.kind,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "request_id": span.request_id,
+            "start_ns": span.start_ns,
+            "duration_ms": round((span.end_ns - span.start_ns) / 1e6, 3),
+            "attributes": span.attributes,
+            "error": span.error,
+        }
+
+    @staticmethod
+    def _otlp_value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _otlp_payload(self, batch: List[Span]) -> Dict[str, Any]:
+        spans = []
+        for span in batch:
+            attributes = dict(span.attributes)
+            if span.request_id:
+                attributes["request.id"] = span.request_id
+            item = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": SPAN_KINDS.get(span.kind, 1),
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [{"key": k, "value": self._otlp_value(v)} for k, v in attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            spans.append(item)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "shared.instrumentation"}, "spans": spans}],
+        }]}
+
+
+class Tracer:
+    def __init__(self, service_name: str = "unknown", sample_ratio: float = 1.0,
+                 exporter: Optional[SpanExporter] = None):
+        self.service_name = service_name
+        self.sample_ratio = sample_ratio
+        self.exporter = exporter or SpanExporter(service_name)
+
+    def start_span(self, name: str, kind: str = "internal", attributes: Optional[Dict[str, Any]] = None,
+                   parent: Optional[Span] = None, remote: Optional[Tuple[str, str, bool]] = None,
+                   request_id: Optional[str] = None) -> Span:
+        if parent is None and remote is None:
+            parent = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+            request_id = request_id or parent.request_id
+        elif remote is not None:
+            trace_id, parent_id, sampled = remote
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < self.sample_ratio
+        return Span(name=name, trace_id=trace_id, span_id=os.urandom(8).hex(), parent_id=parent_id,
+                    kind=kind, sampled=sampled, request_id=request_id or trace_id,
+                    attributes=dict(attributes or {}))
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None):
+        if span.end_ns is not None:
+            return
+        span.end_ns = time.time_ns()
+        if error is not None and span.error is None:
+            span.error = f"{type(error).__name__}: {error}"
+        span_duration.observe(time.perf_counter() - span._started, service=self.service_name,
+                              name=span.name, kind=span.kind, error="true" if span.error else "false")
+        if span.sampled and self.exporter.enabled:
+            self.exporter.export(span)
+
+
+tracer = Tracer()
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", activate: bool = True, **attributes: Any) -> Iterator[Span]:
+    """Mede um trecho de código como span filho do span atual
+
+    Use `activate=False` dentro de geradores assíncronos: o span não vira o
+    "atual" do contexto (que é compartilhado com quem consome o gerador).
+    """
+    current = tracer.start_span(name, kind=kind, attributes=attributes)
+    token = _current_span.set(current) if activate else None
+    try:
+        yield current
+    except GeneratorExit:  # Consumidor fechou o gerador antes do fim: não é erro
+        raise
+    except BaseException as e:
+        tracer.end_span(current, error=e)
+        raise
+    finally:
+        if token is not None:
+            _current_span.reset(token)
+        tracer.end_span(current)
+
+
+def inject_headers(headers: Any, target: Optional[Span] = None):
+    """Adiciona traceparent / X-Request-ID do span (ou do span atual) aos cabeçalhos"""
+    target = target or _current_span.get()
+    if target is None:
+        return
+    headers[TRACEPARENT_HEADER] = target.traceparent
+    if target.request_id:
+        headers[REQUEST_ID_HEADER] = target.request_id
+
+
+# --- httpx ------------------------------------------------------------------
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """Transport httpx que cria um span "client" por requisição e propaga o contexto
+
+    Para respostas em streaming o span termina quando chegam os cabeçalhos
+    (tempo até o primeiro byte).
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, peer: Optional[str] = None):
+        self._transport = transport
+        self.peer = peer
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attributes = {"http.method": request.method, "http.url": str(request.url.copy_with(query=None))}
+        if self.peer:
+            attributes["peer.service"] = self.peer
+        name = f"{self.peer or request.url.host} {request.method} {request.url.path}"
+        with span(name, kind="client", **attributes) as current:
+            inject_headers(request.headers, current)
+            response = await self._transport.handle_async_request(request)
+            current.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                current.error = f"HTTP {response.status_code}"
+            return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def traced_transport(peer: Optional[str] = None, **kwargs: Any) -> TracingTransport:
+    """Atalho: AsyncHTTPTransport(**kwargs) instrumentado"""
+    return TracingTransport(httpx.AsyncHTTPTransport(**kwargs), peer=peer)
+
+
+# --- SQLAlchemy -------------------------------------------------------------
+
+def instrument_sqlalchemy(engine: Any, name: str = "db"):
+    """Um span por query executada (engine síncrono ou AsyncEngine)"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "QUERY"
+        current = tracer.start_span(f"{name} {operation}", kind="client", attributes={
+            "db.system": sync_engine.dialect.name,
+            "db.statement": statement[:500],
+        })
+        conn.info.setdefault("_trace_spans", []).append(current)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("_trace_spans")
+        if spans:
+            tracer.end_span(spans.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(context):
+        spans = context.connection.info.get("_trace_spans") if context.connection is not None else None
+        if spans:
+            tracer.end_span(spans.pop(), error=context.original_exception)
+
+
+# --- ASGI -------------------------------------------------------------------
+
+class InstrumentationMiddleware:
+    """Middleware ASGI puro (não bufferiza respostas em streaming)"""
+
+    def __init__(self, app, service_name: str):
+        self.app = app
+        self.service_name = service_name
+        self._routes: Optional[Dict[Any, str]] = None
+
+    def _route_template(self, scope) -> str:
+        if self._routes is None:
+            fastapi_app = scope.get("app")
+            routes = getattr(fastapi_app, "routes", []) if fastapi_app is not None else []
+            self._routes = {r.endpoint: r.path for r in routes if getattr(r, "endpoint", None)}
+        endpoint = scope.get("endpoint")
+        return self._routes.get(endpoint, "unmatched") if endpoint else "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        method = scope.get("method", "GET")
+        current = tracer.start_span(
+            f"{method} {scope.get('path', '')}", kind="server",
+            remote=parse_traceparent(headers.get(TRACEPARENT_HEADER)),
+            request_id=headers.get(REQUEST_ID_HEADER),
+            attributes={"http.method": method, "http.target": scope.get("path", "")},
+        )
+        token = _current_span.set(current)
+        status = {"code": 500}
+
+        def finish(error: Optional[BaseException] = None):
+            if current.end_ns is not None:
+                return
+            route = self._route_template(scope)
+            current.name = f"{method} {route}"
+            current.set_attribute("http.route", route)
+            current.set_attribute("http.status_code", status["code"])
+            if status["code"] >= 500 and current.error is None:
+                current.error = f"HTTP {status['code']}"
+            http_duration.observe(time.perf_counter() - current._started, service=self.service_name,
+                                  method=method, route=route, status=str(status["code"]))
+            tracer.end_span(current, error=error)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                response_headers = list(message.get("headers", []))
+                response_headers.append((b"x-request-id", current.request_id.encode("latin-1")))
+                response_headers.append((b"traceparent", current.traceparent.encode("latin-1")))
+                message = {**message, "headers": response_headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            finish(error=e)
+            raise
+        finally:
+            _current_span.reset(token)
+            finish()
+
+
+def setup_instrumentation(app, service_name: str):
+    """Instala o middleware, a rota /metrics e o exportador de spans no app FastAPI"""
+    from fastapi.responses import PlainTextResponse
+
+    mode = os.getenv("TRACING_EXPORTER", "none").lower()
+    tracer.service_name = service_name
+    tracer.sample_ratio = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+    tracer.exporter = SpanExporter(
+        service_name, mode=mode,
+        endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"),
+        file_path=os.getenv("TRACE_FILE"),
+    )
+    app.add_middleware(InstrumentationMiddleware, service_name=service_name)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    @app.on_event("startup")
+    async def start_exporter():
+        await tracer.exporter.start()
+
+    @app.on_event("shutdown")
+    async def stop_exporter():
+        await tracer.exporter.close()
@@ -0,0 +1,118 @@
+# apps/services/shared/logs.py
+"""Logging estruturado (JSON) e não bloqueante para os serviços
+
+    from shared.logs import setup_logging
+    logger = setup_logging("api-gateway")
+
+- Os handlers dos loggers só enfileiram o registro (QueueHandler); a
+  formatação em JSON e a escrita no stdout acontecem numa thread separada
+  (QueueListener), então o event loop não espera pelo I/O do terminal.
+- Registros DEBUG são amostrados (LOG_DEBUG_SAMPLE_RATE) antes de entrar na fila.
+- O nível é configurável por serviço: LOG_LEVEL_<SERVICO> (ex.: LOG_LEVEL_API_GATEWAY)
+  tem precedência sobre LOG_LEVEL (padrão INFO).
+- Corpos de requisição/resposta só devem ser logados quando LOG_PAYLOADS=1
+  (use `LOG_PAYLOADS` antes de montar a mensagem).
+- Cada linha leva request_id/trace_id do span atual (shared.instrumentation).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from shared.instrumentation import current_span
+
+LOG_PAYLOADS = os.getenv("LOG_PAYLOADS", "0").lower() in ("1", "true", "yes")
+
+# Atributos padrão do LogRecord; o que sobrar veio de `extra=` e vai como campo do JSON
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "color_message"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service_name: str):
+        super().__init__()
+        self.service_name = service_name
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "service": self.service_name,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """Enfileira o registro já com os ids do trace (o span atual só existe nesta thread)"""
+
+    def __init__(self, log_queue: queue.Queue, debug_sample_rate: float = 1.0):
+        super().__init__(log_queue)
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+        return super().filter(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        span = current_span()
+        if span is not None:
+            record.request_id = span.request_id
+            record.trace_id = span.trace_id
+        # Resolve a mensagem e a exceção aqui: args/tracebacks não podem cruzar a fila com segurança
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def log_level(service_name: str) -> int:
+    key = "LOG_LEVEL_" + service_name.upper().replace("-", "_")
+    level = logging.getLevelName((os.getenv(key) or os.getenv("LOG_LEVEL", "INFO")).upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+def setup_logging(service_name: str) -> logging.Logger:
+    """Troca os handlers do root (e do uvicorn) pela fila; retorna o logger do serviço"""
+    global _listener
+    if _listener is None:
+        log_queue: queue.Queue = queue.Queue(-1)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter(service_name))
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        handler = ContextQueueHandler(log_queue, float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1")))
+        root = logging.getLogger()
+        root.handlers = [handler]
+        root.setLevel(log_level(service_name))
+
+        # O uvicorn instala handlers próprios (síncronos); passam a propagar para o root
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+        if os.getenv("LOG_ACCESS", "true").lower() not in ("1", "true", "yes"):
+            logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+        # Bibliotecas muito verbosas em DEBUG
+        for name in ("httpx", "httpcore", "openai"):
+            logging.getLogger(name).setLevel(max(logging.INFO, root.level))
+    return logging.getLogger(service_name)
@@ -0,0 +1,105 @@
+# apps/services/shared/singleflight.py
+"""Coalescência de chamadas idênticas em andamento (single-flight)
+
+    flight = SingleFlight("settings", ttl=0.5)
+    response = await flight.do("GET /agents", lambda: client.get("/agents"))
+
+- Enquanto uma chamada para a chave está em andamento, as demais esperam o
+  mesmo resultado (ou a mesma exceção) em vez de repetir a requisição.
+- Com `ttl > 0`, o resultado bem-sucedido ainda é reaproveitado por uma janela
+  curta (micro-cache), absorvendo rajadas que chegam logo depois.
+- O cancelamento de quem esperava não cancela a chamada compartilhada.
+- `forget(prefixo)` descarta o micro-cache e desassocia as chamadas em
+  andamento (use após escritas que tornam o resultado obsoleto).
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from shared.instrumentation import metrics, tracer
+
+singleflight_requests = metrics.counter(
+    "singleflight_requests_total",
+    "Chamadas ao single-flight por resultado (leader executou, coalesced esperou outra, cached micro-cache)",
+    ["service", "group", "result"],
+)
+
+
+class SingleFlight:
+    def __init__(self, name: str, ttl: float = 0.0, max_entries: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._recent: Dict[str, Tuple[float, Any]] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.errors = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        if self.ttl > 0:
+            cached = self._recent.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.cache_hits += 1
+                self._count("cached")
+                return cached[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            self._count("leader")
+            task = asyncio.ensure_future(self._run(key, fn))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+            self._count("coalesced")
+        # shield: quem desistir de esperar não cancela a chamada dos outros
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fn()
+        except BaseException:
+            self.errors += 1
+            raise
+        else:
+            if self.ttl > 0 and self._inflight.get(key) is asyncio.current_task():
+                if len(self._recent) >= self.max_entries:
+                    self._evict()
+                self._recent[key] = (time.monotonic() + self.ttl, value)
+            return value
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._recent.items() if expires <= now]:
+            del self._recent[key]
+        if len(self._recent) >= self.max_entries:
+            self._recent.clear()
+
+    def forget(self, prefix: str = ""):
+        for key in [k for k in self._recent if k.startswith(prefix)]:
+            del self._recent[key]
+        # As chamadas em andamento terminam normalmente para quem já esperava,
+        # mas novos pedidos iniciam outra chamada
+        for key in [k for k in self._inflight if k.startswith(prefix)]:
+            del self._inflight[key]
+
+    def _count(self, result: str):
+        singleflight_requests.inc(service=tracer.service_name, group=self.name, result=result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+            "ttl": self.ttl,
+        }
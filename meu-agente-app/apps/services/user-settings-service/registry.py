@@ -0,0 +1,123 @@
+# apps/services/user-settings-service/registry.py
+"""Registro em memória dos agentes com ETags e notificação de mudanças
+
+Os agentes são carregados do banco no startup e as leituras são servidas da
+memória. Cada criação/atualização é gravada no banco, aplicada ao registro e
+publicada no canal Redis `agents:changes`, para que caches de outros serviços
+(e outras réplicas deste) invalidem imediatamente em vez de fazer polling.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Sem Redis as mudanças ficam restritas a esta instância
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+CHANGES_CHANNEL = "agents:changes"
+
+
+def compute_etag(payload: Any) -> str:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara o cabeçalho If-None-Match (lista ou '*') com a ETag atual"""
+    if not if_none_match:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class AgentRegistry:
+    """Agentes serializados indexados por id, com ETag por agente e da lista inteira"""
+
+    def __init__(self):
+        self._agents: Dict[int, Dict[str, Any]] = {}
+        self._etags: Dict[int, str] = {}
+        self._list: List[Dict[str, Any]] = []
+        self._list_etag = compute_etag([])
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def replace_all(self, agents: List[Dict[str, Any]]):
+        self._agents = {agent["id"]: agent for agent in agents}
+        self._etags = {agent["id"]: compute_etag(agent) for agent in agents}
+        self._rebuild_list()
+
+    def upsert(self, agent: Dict[str, Any]):
+        self._agents[agent["id"]] = agent
+        self._etags[agent["id"]] = compute_etag(agent)
+        self._rebuild_list()
+
+    def remove(self, agent_id: int):
+        self._agents.pop(agent_id, None)
+        self._etags.pop(agent_id, None)
+        self._rebuild_list()
+
+    def _rebuild_list(self):
+        self._list = [self._agents[agent_id] for agent_id in sorted(self._agents)]
+        self._list_etag = compute_etag(sorted(self._etags.items()))
+
+    def get(self, agent_id: int) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        return self._agents.get(agent_id), self._etags.get(agent_id)
+
+    def all(self) -> Tuple[List[Dict[str, Any]], str]:
+        return self._list, self._list_etag
+
+    # --- Notificações -----------------------------------------------------
+
+    async def start(self, redis_url: Optional[str], reload_agent: Callable[[int], Any]):
+        """Conecta ao Redis e escuta mudanças feitas por outras réplicas"""
+        if not (redis_url and aioredis):
+            return
+        self._redis = aioredis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._listener = asyncio.create_task(self._listen(redis_url, reload_agent))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    async def publish(self, action: str, agent_id: int):
+        if self._redis is None:
+            return
+        message = {"action": action, "id": agent_id, "etag": self._etags.get(agent_id)}
+        try:
+            await self._redis.publish(CHANGES_CHANNEL, json.dumps(message))
+        except Exception as e:
+            logger.warning("Falha ao publicar mudança do agente %s: %s", agent_id, e)
+
+    async def _listen(self, redis_url: str, reload_agent: Callable[[int], Any]):
+        client = aioredis.from_url(redis_url, decode_responses=True)
+        try:
+            while True:
+                try:
+                    async with client.pubsub() as pubsub:
+                        await pubsub.subscribe(CHANGES_CHANNEL)
+                        async for message in pubsub.listen():
+                            if message.get("type") != "message":
+                                continue
+                            change = json.loads(message["data"])
+                            # Ignora o eco das mudanças que esta instância já aplicou
+                            if change.get("etag") and change.get("etag") == self._etags.get(change["id"]):
+                                continue
+                            await reload_agent(int(change["id"]))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Assinatura de mudanças de agentes interrompida: %s", e)
+                    await asyncio.sleep(5)
+        finally:
+            await client.aclose()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Servidor LLM falso compatível com a API de chat da OpenAI (para benchmarks)
+
+Responde /v1/chat/completions (com e sem stream) de forma determinística: o
+texto depende só da última mensagem, a latência até o primeiro token e a taxa
+de tokens por segundo são configuráveis. Aponte o orquestrador para ele com
+OPENAI_BASE_URL=http://127.0.0.1:<porta>/v1 e qualquer OPENAI_API_KEY.
+
+    python benchmarks/fake_llm_server.py --port 8090 --latency 0.2 --tokens-per-second 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = ("agenda reunião projeto cliente tarefa semana resumo prazo equipe relatório "
+         "evento horário proposta contrato revisão entrega").split()
+
+app = FastAPI(title="Fake LLM")
+app.state.latency = float(os.getenv("FAKE_LLM_LATENCY", "0.2"))
+app.state.tokens_per_second = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50"))
+app.state.tokens = int(os.getenv("FAKE_LLM_TOKENS", "40"))
+app.state.requests = 0
+
+
+def completion_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> List[str]:
+    """Tokens determinísticos a partir da última mensagem"""
+    last = messages[-1]["content"] if messages else ""
+    seed = int(hashlib.sha1(last.encode("utf-8")).hexdigest(), 16)
+    count = max(1, min(max_tokens or app.state.tokens, app.state.tokens))
+    return [WORDS[(seed >> (i % 64)) % len(WORDS)] + " " for i in range(count)]
+
+
+def prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(m.get("content") or "") for m in messages) // 4
+
+
+@app.get("/health")
+async def health():
+    return {"status": "healthy", "requests": app.state.requests}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    messages = body.get("messages", [])
+    tokens = completion_tokens(messages, body.get("max_tokens") or 0)
+    model = body.get("model", "fake")
+    created = int(time.time())
+    completion_id = f"chatcmpl-fake-{app.state.requests}"
+    interval = 1.0 / app.state.tokens_per_second if app.state.tokens_per_second > 0 else 0.0
+
+    if not body.get("stream"):
+        await asyncio.sleep(app.state.latency + interval * len(tokens))
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens(messages),
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens(messages) + len(tokens),
+            },
+        })
+
+    def chunk(delta: Dict[str, Any], finish_reason=None) -> str:
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def events():
+        await asyncio.sleep(app.state.latency)
+        yield chunk({"role": "assistant", "content": ""})
+        for token in tokens:
+            yield chunk({"content": token})
+            if interval:
+                await asyncio.sleep(interval)
+        yield chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=app.state.latency, help="segundos até o primeiro token")
+    parser.add_argument("--tokens-per-second", type=float, default=app.state.tokens_per_second)
+    parser.add_argument("--tokens", type=int, default=app.state.tokens, help="tokens por resposta")
+    args = parser.parse_args()
+    app.state.latency = args.latency
+    app.state.tokens_per_second = args.tokens_per_second
+    app.state.tokens = args.tokens
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Benchmark de latência do user-settings-service sob concorrência
+
+Dispara requisições concorrentes contra /agents e /agents/{id} e mede p50/p99.
+Para comparar antes/depois de uma mudança, rode uma vez em cada versão do serviço
+salvando o resultado e depois compare os dois arquivos:
+
+    # versão anterior (ex.: git checkout <commit> e suba o serviço)
+    python benchmarks/settings_concurrency.py --label antes --output antes.json
+    # versão atual
+    python benchmarks/settings_concurrency.py --label depois --output depois.json
+    python benchmarks/settings_concurrency.py --compare antes.json depois.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    return {
+        "requests": len(samples) + errors,
+        "errors": errors,
+        "rps": round((len(samples) + errors) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(samples), 2) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2),
+        "max_ms": round(max(samples), 2) if samples else 0.0,
+    }
+
+
+async def run_path(client: httpx.AsyncClient, path: str, concurrency: int, total: int) -> Dict[str, float]:
+    samples: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                response.raise_for_status()
+                samples.append((time.perf_counter() - started) * 1000)
+            except httpx.HTTPError:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, errors, time.perf_counter() - started)
+
+
+async def run(args) -> Dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30.0) as client:
+        # Aquecimento: abre conexões e popula caches antes de medir
+        await asyncio.gather(*(client.get(path) for path in args.paths for _ in range(args.concurrency)),
+                             return_exceptions=True)
+        results = {}
+        for path in args.paths:
+            results[path] = await run_path(client, path, args.concurrency, args.requests)
+    return {
+        "label": args.label,
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "requests_per_path": args.requests,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def print_report(report: Dict):
+    print(f"\n[{report['label']}] {report['url']} - concorrência {report['concurrency']}")
+    print(f"{'rota':<20}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erros':>8}")
+    for path, r in report["results"].items():
+        print(f"{path:<20}{r['rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"\n{before['label']} -> {after['label']} (concorrência {before['concurrency']} -> {after['concurrency']})")
+    print(f"{'rota':<20}{'métrica':<10}{before['label']:>12}{after['label']:>12}{'variação':>12}")
+    for path, b in before["results"].items():
+        a = after["results"].get(path)
+        if not a:
+            continue
+        for metric in ("rps", "p50_ms", "p99_ms"):
+            change = ((a[metric] - b[metric]) / b[metric] * 100) if b[metric] else 0.0
+            print(f"{path:<20}{metric:<10}{b[metric]:>12}{a[metric]:>12}{change:>+11.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8004")
+    parser.add_argument("--paths", nargs="+", default=["/agents", "/agents/1"])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000, help="requisições por rota")
+    parser.add_argument("--label", default="atual")
+    parser.add_argument("--output", help="arquivo JSON para salvar o resultado")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"), help="compara dois resultados salvos")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
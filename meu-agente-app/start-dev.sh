@@ -29,6 +29,9 @@ FRONTEND_PID=$!
 echo "🔧 Iniciando serviços backend..."
 cd ../../
 
+# Módulos compartilhados (apps/services/shared) importados pelos serviços
+export PYTHONPATH="$(pwd)/apps/services${PYTHONPATH:+:$PYTHONPATH}"
+
 # Iniciar cada serviço em background
 cd apps/services/api-gateway && python main.py &
 API_GATEWAY_PID=$!